@@ -0,0 +1,234 @@
+"""
+Timed benchmarks of the pipeline stages (unify_units, aggregate_variable(s), save_into_database and
+integrate_to_dT) on synthetic RCMIP shaped data. The wall time and peak memory of each stage are
+appended to a JSON history and compared to the last run with the same configuration.
+integrate_to_dT is run once for each number of worker processes given, to measure the scaling of
+the integration across cores (the number of cores is recorded with the results).
+
+Run e.g.:
+python -m ar6_ch6_rcmipfigs.benchmarks.run_benchmarks --models 5 --members 10
+python -m ar6_ch6_rcmipfigs.benchmarks.run_benchmarks --stages integrate_to_dT --workers 1 2 4 8
+"""
+import argparse
+import functools
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+from scmdata import ScmDataFrame
+
+from ar6_ch6_rcmipfigs.benchmarks.synthetic import synthetic_timeseries, synthetic_protocol_variables, \
+    synthetic_forcing_dataset, synthetic_variables, name_erf_anthropogenic
+from ar6_ch6_rcmipfigs.constants import RESULTS_DIR
+from ar6_ch6_rcmipfigs.utils.database_generation import unify_units, save_into_database
+from ar6_ch6_rcmipfigs.utils.irf_integration import integrate_to_dT
+from ar6_ch6_rcmipfigs.utils.misc_func import aggregate_variable, aggregate_variables, make_folders
+
+PATH_HISTORY = os.path.join(RESULTS_DIR, 'benchmarks', 'history.json')
+
+
+def _stage_unify_units(inputs, workdir):
+    unify_units(inputs['db'], inputs['protocol_variables'])
+
+
+def _stage_aggregate_variable(inputs, workdir):
+    db = inputs['db']
+    for cm in db['climatemodel'].unique():
+        db = aggregate_variable(db, name_erf_anthropogenic, cm)
+
+
+def _stage_aggregate_variables(inputs, workdir):
+    aggregate_variables(inputs['db'], [name_erf_anthropogenic])
+
+
+def _stage_save_into_database(inputs, workdir):
+    save_into_database(inputs['db'], workdir, 'benchmark')
+
+
+def _stage_integrate_to_dT(inputs, workdir, n_workers=1):
+    ds = inputs['ds']
+    integrate_to_dT(ds, str(ds['time.year'].values[0]), str(ds['time.year'].values[-1]), inputs['variables'],
+                    n_workers=n_workers, path_dT=os.path.join(workdir, 'dT.nc'))
+
+
+stages = {
+    'unify_units': _stage_unify_units,
+    'aggregate_variable': _stage_aggregate_variable,
+    'aggregate_variables': _stage_aggregate_variables,
+    'save_into_database': _stage_save_into_database,
+    'integrate_to_dT': _stage_integrate_to_dT,
+}
+
+
+def make_inputs(config, stage_names):
+    """
+    Generates the synthetic inputs needed by stage_names.
+
+    :param config: keyword arguments to the synthetic data generators
+    :param stage_names: stages to run
+    :return: dictionary of inputs
+    """
+    inputs = {'variables': synthetic_variables(config['n_variables'])}
+    if 'integrate_to_dT' in stage_names:
+        inputs['ds'] = synthetic_forcing_dataset(**config)
+    if any(name != 'integrate_to_dT' for name in stage_names):
+        inputs['db'] = ScmDataFrame(synthetic_timeseries(**config))
+        inputs['protocol_variables'] = synthetic_protocol_variables(config['n_variables'])
+    return inputs
+
+
+def time_stage(func, inputs, repeat=1):
+    """
+    Runs func(inputs, workdir) repeat times for the wall time (the fastest run is kept) and once
+    more under tracemalloc for the peak memory allocated.
+
+    :return: wall time in seconds, peak memory in MB
+    """
+    times = []
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory() as workdir:
+            _t0 = time.perf_counter()
+            func(inputs, workdir)
+            times.append(time.perf_counter() - _t0)
+    with tempfile.TemporaryDirectory() as workdir:
+        tracemalloc.start()
+        try:
+            func(inputs, workdir)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    return min(times), peak / 1e6
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(__file__)).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def read_history(path_history=PATH_HISTORY):
+    """
+    Reads the benchmark history (list of runs), empty if there is none.
+    """
+    if not os.path.isfile(path_history):
+        return []
+    with open(path_history) as fh:
+        return json.load(fh)
+
+
+def find_regressions(record, history, tolerance=1.5):
+    """
+    Compares record to the last run in history with the same configuration.
+
+    :param tolerance: a stage is a regression if its wall time or peak memory is more than
+    tolerance times that of the previous run
+    :return: list of (stage, quantity, previous, current)
+    """
+    previous = [rec for rec in history if rec['config'] == record['config']]
+    if len(previous) == 0:
+        return []
+    regressions = []
+    for stage, result in record['results'].items():
+        prev_result = previous[-1]['results'].get(stage)
+        if prev_result is None:
+            continue
+        for quantity in ['wall_time_s', 'peak_memory_mb']:
+            if result[quantity] > tolerance * prev_result[quantity]:
+                regressions.append((stage, quantity, prev_result[quantity], result[quantity]))
+    return regressions
+
+
+def _result_name(stage, n_workers):
+    return stage if n_workers == 1 else '%s[n_workers=%s]' % (stage, n_workers)
+
+
+def run_benchmarks(stage_names=None, path_history=PATH_HISTORY, repeat=1, tolerance=1.5, n_workers=(1,),
+                   **config):
+    """
+    Runs the benchmarks, appends the results to the history and reports regressions compared
+    to the last run with the same configuration.
+
+    :param stage_names: stages to run (keys of stages), by default all
+    :param path_history: path of the JSON history, not written if None
+    :param repeat: number of timed runs of each stage
+    :param tolerance: see find_regressions
+    :param n_workers: numbers of worker processes integrate_to_dT is run with, the speedup relative
+    to the first is reported
+    :param config: keyword arguments to the synthetic data generators, e.g. n_models, n_members
+    :return: the record of this run, list of regressions
+    """
+    stage_names = list(stages) if stage_names is None else list(stage_names)
+    for name in stage_names:
+        if name not in stages:
+            raise ValueError('Unknown stage %s, choose from %s' % (name, list(stages)))
+    config = dict(dict(n_models=5, n_scenarios=8, n_variables=10, n_years=251, n_members=1, nan_fraction=0.05,
+                       seed=0), **config)
+    inputs = make_inputs(config, stage_names)
+    results = {}
+    for name in stage_names:
+        if name == 'integrate_to_dT':
+            runs = [(_result_name(name, n), functools.partial(stages[name], n_workers=n)) for n in n_workers]
+        else:
+            runs = [(name, stages[name])]
+        for result_name, func in runs:
+            wall_time, peak_memory = time_stage(func, inputs, repeat=repeat)
+            results[result_name] = {'wall_time_s': wall_time, 'peak_memory_mb': peak_memory}
+            print('%s: %.3f s, %.1f MB' % (result_name, wall_time, peak_memory))
+    if 'integrate_to_dT' in stage_names and len(n_workers) > 1:
+        times = [results[_result_name('integrate_to_dT', n)]['wall_time_s'] for n in n_workers]
+        for _n_workers, wall_time in zip(n_workers, times):
+            print('integrate_to_dT speedup with %s workers on %s cores: %.2f'
+                  % (_n_workers, os.cpu_count(), times[0] / wall_time))
+    record = {
+        'date': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'config': config,
+        'results': results,
+    }
+    if path_history is None:
+        return record, []
+    history = read_history(path_history)
+    regressions = find_regressions(record, history, tolerance=tolerance)
+    for stage, quantity, previous, current in regressions:
+        print('Regression in %s: %s went from %.3f to %.3f' % (stage, quantity, previous, current))
+    make_folders(path_history)
+    with open(path_history, 'w') as fh:
+        json.dump(history + [record], fh, indent=1)
+    return record, regressions
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--stages', nargs='+', choices=list(stages), default=None)
+    parser.add_argument('--models', type=int, default=5)
+    parser.add_argument('--scenarios', type=int, default=8)
+    parser.add_argument('--variables', type=int, default=10)
+    parser.add_argument('--years', type=int, default=251)
+    parser.add_argument('--members', type=int, default=1)
+    parser.add_argument('--nan-fraction', type=float, default=0.05)
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--tolerance', type=float, default=1.5)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1],
+                        help='numbers of worker processes for integrate_to_dT')
+    parser.add_argument('--history', default=PATH_HISTORY)
+    args = parser.parse_args(args)
+    _, regressions = run_benchmarks(stage_names=args.stages, path_history=args.history, repeat=args.repeat,
+                                    tolerance=args.tolerance, n_workers=args.workers, n_models=args.models,
+                                    n_scenarios=args.scenarios,
+                                    n_variables=args.variables, n_years=args.years, n_members=args.members,
+                                    nan_fraction=args.nan_fraction)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,120 @@
+"""
+Synthetic inputs shaped like the RCMIP phase-1 submissions, for benchmarking without the real data.
+The same random forcing is available as a timeseries table (as read into ScmDataFrame in
+0_database-generation) and as an xarray dataset (as forcing_data_rcmip_models.nc from 1_preprocess_data).
+"""
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+name_erf = 'Effective Radiative Forcing'
+name_erf_anthropogenic = 'Effective Radiative Forcing|Anthropogenic'
+# subcategories of name_erf_anthropogenic found in the RCMIP submissions:
+_erf_subcategories = [
+    'CH4', 'CO2', 'N2O', 'Aerosols', 'Tropospheric Ozone', 'Stratospheric Ozone', 'F-Gases|HFC',
+    'Montreal Gases', 'Other|BC on Snow', 'Other|Contrails and Contrail-induced Cirrus',
+]
+_scenarios = ['historical', 'ssp119', 'ssp126', 'ssp245', 'ssp370', 'ssp370-lowNTCF-aerchemmip',
+              'ssp370-lowNTCF-gidden', 'ssp585']
+
+
+def synthetic_variables(n_variables):
+    """
+    Names of n_variables subcategories of 'Effective Radiative Forcing|Anthropogenic', the RCMIP ones first.
+    """
+    extra = ['Other|Synthetic %s' % i for i in range(max(n_variables - len(_erf_subcategories), 0))]
+    return [name_erf_anthropogenic + '|' + sub for sub in (_erf_subcategories + extra)[:n_variables]]
+
+
+def _synthetic_values(n_models, n_scenarios, n_variables, n_years, n_members, nan_fraction, seed):
+    """
+    Random walk forcing with dims (variable, scenario, climatemodel, ensemble_member, time) and
+    a contiguous gap of NaNs in a fraction nan_fraction of the time series.
+    """
+    rng = np.random.default_rng(seed)
+    shape = (n_variables, n_scenarios, n_models, n_members, n_years)
+    values = np.cumsum(rng.normal(0, 0.01, shape), axis=-1)
+    n_series = int(np.prod(shape[:-1]))
+    gaps = rng.random(n_series) < nan_fraction
+    flat = values.reshape(n_series, n_years)
+    for ind in np.flatnonzero(gaps):
+        start = rng.integers(0, n_years)
+        flat[ind, start:start + rng.integers(1, max(n_years // 10, 1) + 1)] = np.nan
+    return values
+
+
+def _labels(n_models, n_scenarios, n_variables, n_members):
+    scenarios = (_scenarios + ['scenario-%s' % i for i in range(max(n_scenarios - len(_scenarios), 0))])
+    return dict(
+        variable=synthetic_variables(n_variables),
+        scenario=scenarios[:n_scenarios],
+        climatemodel=['synthetic-model-%s' % i for i in range(n_models)],
+        ensemble_member=np.arange(n_members),
+    )
+
+
+def synthetic_timeseries(n_models=5, n_scenarios=8, n_variables=10, n_years=251, n_members=1,
+                         nan_fraction=0.05, start_year=1850, seed=None):
+    """
+    Synthetic forcing timeseries table in the RCMIP submission format (one row per time series,
+    one column per year), to be read with ScmDataFrame. Every second climate model reports in mW/m^2,
+    so that unify_units has something to convert. With n_members > 1 the ensemble members are
+    distinguished by the meta column ensemble_member.
+
+    :param n_models: number of climate models
+    :param n_scenarios: number of scenarios
+    :param n_variables: number of forcing variables
+    :param n_years: number of years
+    :param n_members: number of ensemble members per climate model
+    :param nan_fraction: fraction of the time series with a gap of missing values
+    :param start_year: first year
+    :param seed: seed for the random number generator
+    :return: pd.DataFrame
+    """
+    values = _synthetic_values(n_models, n_scenarios, n_variables, n_years, n_members, nan_fraction, seed)
+    labels = _labels(n_models, n_scenarios, n_variables, n_members)
+    index = pd.MultiIndex.from_product([labels[dim] for dim in ['variable', 'scenario', 'climatemodel',
+                                                                'ensemble_member']],
+                                       names=['variable', 'scenario', 'climatemodel', 'ensemble_member'])
+    df = pd.DataFrame(values.reshape(-1, n_years), index=index,
+                      columns=np.arange(start_year, start_year + n_years)).reset_index()
+    in_mW = df['climatemodel'].isin(labels['climatemodel'][1::2])
+    df.loc[in_mW, df.columns[4:]] *= 1000
+    df.insert(2, 'unit', np.where(in_mW, 'mW/m^2', 'W/m^2'))
+    df.insert(2, 'region', 'World')
+    df.insert(0, 'model', 'unspecified')
+    if n_members == 1:
+        df = df.drop(columns='ensemble_member')
+    return df
+
+
+def synthetic_protocol_variables(n_variables=10):
+    """
+    Protocol variable definitions (variable, unit) for the variables of synthetic_timeseries,
+    as read by get_protocol_vars.
+    """
+    variables = [name_erf, name_erf_anthropogenic] + synthetic_variables(n_variables)
+    return pd.DataFrame({'variable': variables, 'unit': 'W/m^2'})
+
+
+def synthetic_forcing_dataset(n_models=5, n_scenarios=8, n_variables=10, n_years=251, n_members=1,
+                              nan_fraction=0.05, start_year=1850, seed=None):
+    """
+    Synthetic forcing dataset shaped like forcing_data_rcmip_models.nc: one variable per forcing,
+    dims scenario, climatemodel (and ensemble_member if n_members > 1) and time, and delta_t.
+    The values are the same as in synthetic_timeseries with the same arguments (in W/m^2).
+
+    :return: xr.Dataset
+    """
+    values = _synthetic_values(n_models, n_scenarios, n_variables, n_years, n_members, nan_fraction, seed)
+    labels = _labels(n_models, n_scenarios, n_variables, n_members)
+    time = pd.to_datetime(['%s-01-01' % year for year in range(start_year, start_year + n_years)])
+    dims = ('scenario', 'climatemodel', 'ensemble_member', 'time')
+    ds = xr.Dataset(coords=dict(scenario=labels['scenario'], climatemodel=labels['climatemodel'],
+                                ensemble_member=labels['ensemble_member'], time=time))
+    for var, _val in zip(labels['variable'], values):
+        ds[var] = xr.DataArray(_val, dims=dims, attrs={'unit': 'W/m^2'})
+    if n_members == 1:
+        ds = ds.squeeze('ensemble_member', drop=True)
+    ds['delta_t'] = xr.DataArray(np.ones(n_years), dims='time')
+    return ds
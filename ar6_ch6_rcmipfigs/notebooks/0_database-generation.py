@@ -21,8 +21,9 @@ from ar6_ch6_rcmipfigs.constants import INPUT_DATA_DIR
 
 __depends__ = []
 __dest__ = [INPUT_DATA_DIR+
-    "/data/database-results/phase-1/timestamp.txt",
-    INPUT_DATA_DIR+"/data/database-observations/timestamp.txt",
+    "/database-results/phase-1/timestamp.txt",
+    INPUT_DATA_DIR+"/database-results/phase-1/manifest.json",
+    INPUT_DATA_DIR+"/database-observations/timestamp.txt",
 ]
 
 # %%
@@ -49,9 +50,6 @@ import tqdm
 from scmdata import ScmDataFrame, df_append
 
 # %%
-from ar6_ch6_rcmipfigs.utils.database_generation import check_all_variables_and_units_as_in_protocol, \
-    check_all_scenarios_as_in_protocol, unify_units, save_into_database, mce_get_quantile, hector_get_quantile
-
 TEST_RUN = strtobool(os.getenv("CI", "False")) or False
 TEST_RUN
 
@@ -84,8 +82,14 @@ if not os.path.isdir(OBS_DATABASE_PATH):
 SCENARIO_PROTOCOL = os.path.join(INPUT_DATA_DIR, "data", "protocol", "rcmip-emissions-annual-means.csv"
 )
 
+# %% [markdown]
+# The parsed protocol tables are cached (keyed by the content hash of the file), so the files are only parsed
+# again when they change.
+
 # %%
-protocol_db = ScmDataFrame(SCENARIO_PROTOCOL)
+from ar6_ch6_rcmipfigs.utils.misc_func import get_protocol_emissions, get_protocol_vars, get_protocol_scenarios
+
+protocol_db = get_protocol_emissions(SCENARIO_PROTOCOL)
 protocol_db.head()
 
 # %%
@@ -99,15 +103,11 @@ DATA_PROTOCOL = os.path.join(INPUT_DATA_DIR,
 )
 
 # %%
-protocol_variables = pd.read_excel(DATA_PROTOCOL, sheet_name="variable_definitions")
-protocol_variables.columns = protocol_variables.columns.str.lower()
+protocol_variables = get_protocol_vars(DATA_PROTOCOL)
 protocol_variables.head()
 
 # %%
-protocol_scenarios = pd.read_excel(
-    DATA_PROTOCOL, sheet_name="scenario_info", skip_rows=2
-)
-protocol_scenarios.columns = protocol_scenarios.columns.str.lower()
+protocol_scenarios = get_protocol_scenarios(DATA_PROTOCOL)
 protocol_scenarios.head()
 
 # %% [markdown]
@@ -164,192 +164,42 @@ sorted(results_files)
     if 'magicc' in str(p)] #for m in model_of_interest]) and "$" not in str(p)
 #]
 
-# %%
-db = []
-for rf in tqdm.tqdm_notebook(results_files):
-    if rf.endswith(".csv"):
-        loaded = ScmDataFrame(rf)
-    else:
-        loaded = ScmDataFrame(rf, sheet_name="your_data")
-    db.append(loaded)
-
-db = df_append(db).timeseries().reset_index()
-db["unit"] = db["unit"].apply(
-    lambda x: x.replace("Dimensionless", "dimensionless") if isinstance(x, str) else x
-)
-db = ScmDataFrame(db)
-db.head()
-
-# %%
-db.filter(climatemodel="*cicero*").head()
-
-# %%
-db["climatemodel"].unique()
-
-# %% [markdown]
-# ### Minor quick fixes
-
-# %% [markdown]
-# We relabel all the ssp370-lowNTCF data to remove ambiguity.
-
-# %%
-db = db.timeseries().reset_index()
-db["scenario"] = db["scenario"].apply(
-    lambda x: "ssp370-lowNTCF-gidden" if x == "ssp370-lowNTCF" else x
-)
-db["scenario"] = db["scenario"].apply(
-    lambda x: "esm-ssp370-lowNTCF-gidden" if x == "esm-ssp370-lowNTCF" else x
-)
-db["scenario"] = db["scenario"].apply(
-    lambda x: "esm-ssp370-lowNTCF-gidden-allGHG"
-    if x == "esm-ssp370-lowNTCF-allGHG"
-    else x
-)
-db = ScmDataFrame(db)
-
-# %%
-assert "ssp370-lowNTCF" not in db["scenario"].unique().tolist()
-assert "esm-ssp370-lowNTCF" not in db["scenario"].unique().tolist()
-assert "esm-ssp370-lowNTCF-allGHG" not in db["scenario"].unique().tolist()
-
 # %% [markdown]
-# The Hector and MCE data is mislabelled so we do a quick fix here. I also have changed my mind about how to format the quantiles so tweak the FaIR and WASP data too.
-
-# %%
-mce_prob_data = db.filter(climatemodel="MCE*PROB*")
-mce_prob_data["climatemodel"].unique()
-if not mce_prob_data.timeseries().empty:
-    mce_prob_data = mce_prob_data.timeseries().reset_index()
-
-    mce_prob_data["variable"] = (
-        mce_prob_data["variable"]
-        + "|"
-        + mce_prob_data["climatemodel"].apply(mce_get_quantile)
-        + "th quantile"
-    )
-
-    mce_prob_data["climatemodel"] = mce_prob_data["climatemodel"].apply(
-        lambda x: "-".join(x.split("-")[:-1])
-    )
-
-    db = db.filter(climatemodel="MCE*PROB*", keep=False).append(mce_prob_data)
-
-db.filter(climatemodel="MCE*PROB").head(10)
-
-# %%
-hector_prob_data = db.filter(climatemodel="hector*HISTCALIB*")
-if not hector_prob_data.timeseries().empty:
-    hector_prob_data = hector_prob_data.timeseries().reset_index()
-
-    hector_prob_data["variable"] = (
-        hector_prob_data["variable"]
-        + "|"
-        + hector_prob_data["climatemodel"].apply(hector_get_quantile)
-    )
-
-    hector_prob_data["climatemodel"] = hector_prob_data["climatemodel"].apply(
-        lambda x: x.split("-")[0]
-    )
-
-    db = db.filter(climatemodel="hector*HISTCALIB*", keep=False).append(
-        hector_prob_data
-    )
-
-db.filter(climatemodel="hector*HISTCALIB").head(10)
+# ### Incremental rebuild
+# The manifest next to `timestamp.txt` holds the size, modification time and content hash of every submission
+# read, and the input and output files of every climate model. Only the climate models with new, changed or
+# deleted input files are reprocessed and rewritten, the others are kept as they are. Set `REBUILD_ALL = True`
+# to rebuild the whole database (output files on disk which are not written again are then removed).
 
 # %%
-fair_prob_data = db.filter(climatemodel="*FaIR*")
-if not fair_prob_data.timeseries().empty:
-    fair_prob_data = fair_prob_data.timeseries().reset_index()
-
-    fair_prob_data["variable"] = fair_prob_data["variable"].apply(
-        lambda x: x.replace("|00th", "|0th").replace("|05th", "|5th")
-    )
-
-    db = db.filter(climatemodel="*FaIR*", keep=False).append(
-        ScmDataFrame(fair_prob_data)
-    )
-
-db.filter(climatemodel="*FaIR*").head(10)
-
-# %%
-wasp_prob_data = db.filter(climatemodel="*WASP*")
-if not wasp_prob_data.timeseries().empty:
-    wasp_prob_data = wasp_prob_data.timeseries().reset_index()
-
-    wasp_prob_data["variable"] = wasp_prob_data["variable"].apply(
-        lambda x: x.replace("|00th", "|0th").replace("|05th", "|5th")
-    )
+from ar6_ch6_rcmipfigs.utils.database_manifest import read_manifest, empty_manifest, plan_rebuild, \
+    rebuild_database
 
-    db = db.filter(climatemodel="*WASP*", keep=False).append(
-        ScmDataFrame(wasp_prob_data)
-    )
+REBUILD_ALL = False
+FILENAME_LEADER = "rcmip-phase-1"
 
-db.filter(climatemodel="*WASP*").head(10)
+manifest = empty_manifest() if REBUILD_ALL else read_manifest(OUTPUT_DATABASE_PATH)
+plan = plan_rebuild(manifest, results_files)
+print("{} new or changed, {} removed, {} files to read".format(
+    len(plan["changed"]), len(plan["removed"]), len(plan["read"])))
+plan["stale"]
 
 # %% [markdown]
-# ## Unify units and check names
+# ## Rebuilding the database
+# `rebuild_database` reads the files of the plan in parallel and processes them as follows (if no submission is
+# new or changed, only the outputs of deleted submissions are removed).
+#
+# ### Minor quick fixes
+# We relabel all the ssp370-lowNTCF data to remove ambiguity (`SCENARIO_RELABEL`).
+#
+# The Hector and MCE data is mislabelled so we do a quick fix here. I also have changed my mind about how to format
+# the quantiles so tweak the FaIR and WASP data too. The reshaping rules of each model family are in
+# `PROBABILISTIC_OUTPUT_RULES` and are applied to the metadata in one pass (a new model family only needs a new rule).
+#
+# ### Unify units and check names
+# The scenarios, variables and units (as they will be after unifying the units) of all submissions are checked
+# against the protocol first, so climate models which fail are not converted (`unify_submissions`).
 #
-# Here we loop over the submissions and unify their units as well as checking their naming matches what we expect.
-
-# %%
-base_df = db.timeseries()
-any_failures = False
-
-clean_db = []
-for climatemodel, cdf in tqdm.tqdm_notebook(
-    base_df.groupby("climatemodel"), desc="Climate model"
-):
-    print(climatemodel)
-    print("-" * len(climatemodel))
-
-    any_failures_climatemodel = False
-
-    cdf = ScmDataFrame(cdf)
-    cdf_converted_units = unify_units(cdf, protocol_variables)
-    try:
-        check_all_scenarios_as_in_protocol(cdf_converted_units, protocol_scenarios)
-        check_all_variables_and_units_as_in_protocol(
-            cdf_converted_units, protocol_variables
-        )
-    except AssertionError as e:
-        print(e)
-        any_failures_climatemodel = True
-    #     # currently not possible as groups weren't told to obey variable hierarchy,
-    #     # add this in phase 2
-    #     for v_top in cdf_converted_units.filter(level=0)["variable"].unique():
-    #         print(v_top)
-    #         cdf_pyam = cdf_converted_units.filter(variable="{}*".format(v_top)).timeseries()
-    #         cdf_pyam.columns = cdf_pyam.columns.map(lambda x: x.year)
-
-    #         cdf_consistency_checker = pyam.IamDataFrame(cdf_pyam)
-    #         if cdf_consistency_checker.check_internal_consistency() is not None:
-    #             print("Failed for {}".format(v_top))
-    #             any_failures_climatemodel = True
-    #             failing_set = cdf_consistency_checker.copy()
-
-    print()
-    if not any_failures_climatemodel:
-        clean_db.append(cdf_converted_units)
-        print("All clear for {}".format(climatemodel))
-    else:
-        print("Failed {}".format(climatemodel))
-        print("X" * len("Failed"))
-        any_failures = True
-
-    print()
-    print()
-
-if any_failures:
-    raise AssertionError("database isn't ready yet")
-else:
-    clean_db = df_append(clean_db)
-    clean_db.head()
-
-# %%
-clean_db.head()
-
-# %% [markdown]
 # Notes whilst doing this:
 #
 # - I wasn't clear that the variable hierarchy needs to be obeyed, hence doing internal consistency checks isn't going to work
@@ -360,11 +210,20 @@ clean_db.head()
 # - need to decide what a sensible tolerance is
 # - might have to go back to model notes to work out why there are inconsistencies
 # - will have to implement a custom hack to deal with the double counting in the direct aerosol forcing hierarchy
-
-# %% [markdown]
-# ## Creating a database
+#
+# ### Creating a database
+# With `DATABASE_FORMAT = "parquet"` the database is saved as Parquet files (one row group per scenario)
+# with an index of all timeseries, so `1_preprocess_data` only reads the files, scenarios and years it needs.
+#
+# The outputs of the climate models rebuilt (and of deleted submissions) are removed first, then the manifest is updated.
 
 # %%
-save_into_database(clean_db, OUTPUT_DATABASE_PATH, "rcmip-phase-1")
+DATABASE_FORMAT = "csv"  # or "parquet"
+manifest = rebuild_database(OUTPUT_DATABASE_PATH, manifest, plan, protocol_variables, protocol_scenarios,
+                            FILENAME_LEADER, file_format=DATABASE_FORMAT, rebuild_all=REBUILD_ALL,
+                            depends=__depends__, dest=__dest__)
+if not plan["read"]:
+    print("No submission changed, the database is up to date")
+sorted(manifest["climatemodels"])
 
 # %%
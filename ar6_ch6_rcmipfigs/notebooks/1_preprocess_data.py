@@ -24,8 +24,6 @@ import xarray as xr
 from IPython.display import clear_output
 import numpy as np
 import os
-import re
-from pathlib import Path
 import pandas as pd
 import tqdm
 from scmdata import df_append, ScmDataFrame
@@ -79,25 +77,24 @@ scenarios_fl = ['ssp119', 'ssp126', 'ssp245', 'ssp370', 'ssp370-lowNTCF-aerchemm
 # ### Models to look for
 
 # %% [markdown]
-# Models are chosen solely on availability of relevant  data:
+# Models are chosen solely on availability of relevant  data. The patterns are matched case-insensitively
+# (see `select_files` below):
 
 # %% jupyter={"outputs_hidden": false} pycharm={"name": "#%%\n"}
 
-model_of_interest = [
-    #    ".*acc2.*v2-0-1.*",
-    ".*rcmip-phase-1_cicero-scm.*",
-    #    ".*escimo.*v2-0-1.*",
-    ".*fair-1.5-default.*",
-    #    ".*rcmip_phase-1_gir.*",
-    #    ".*greb.*v2-0-0.*",
-    #    ".*hector.*v2-0-0.*",
-    #    ".*MAGICC7.1.0aX-rcmip-phase-1.*",
-    ".*rcmip-phase-1_magicc7.1.0.beta*",
-    #    ".*MAGICC7.1.0aX.*",
-    #    ".*mce.*v2-0-1.*",
-    #    ".*oscar-v3-0*v1-0-1.*",
-    ".*oscarv3.0.*"
-    #    ".*wasp.*v1-0-1.*",
+climatemodels_of_interest = [
+    #    "ACC2*",
+    "Cicero-SCM*",
+    #    "ESCIMO*",
+    "FaIR-1.5-DEFAULT*",
+    #    "GIR*",
+    #    "GREB*",
+    #    "hector*",
+    #    "MAGICC7.1.0aX*",
+    "MAGICC7.1.0.beta*",
+    #    "MCE*",
+    "OSCARv3.0*",
+    #    "WASP*",
 ]
 # %% [markdown]
 # Where to look for files:
@@ -106,6 +103,8 @@ model_of_interest = [
 
 # RESULTS_PATH = os.path.join(BASE_DIR, "data", "results", "phase-1/")
 RESULTS_PATH = os.path.join(INPUT_DATA_DIR, "database-results", "phase-1")
+# format the database was saved in, see 0_database-generation:
+DATABASE_FORMAT = "csv"  # or "parquet"
 RESULTS_PATH
 # RESULTS_PATH
 
@@ -113,51 +112,18 @@ RESULTS_PATH
 SCENARIO_PROTOCOL = os.path.join(INPUT_DATA_DIR, "data", "protocol", "rcmip-emissions-annual-means-v3-1-0.csv")
 SCENARIO_PROTOCOL
 
-# %% [markdown]
-# List of files:
-
-# %% jupyter={"outputs_hidden": false} pycharm={"name": "#%%\n"}
-results_files = list(Path(RESULTS_PATH).rglob("*.csv")) + list(Path(RESULTS_PATH).rglob("*.xlsx"))
-results_files[:4]
-
 # %% [markdown]
 # ## Make file list to load:
+# The index of the database (written by `0_database-generation`) maps each climate model, region and
+# variable to its file, so the files are looked up instead of searching the folder. Quantile files are left out.
 
 # %%
-results_files = [
-    str(p)
-    for p in results_files
-    if any([bool(re.match(m, str(p))) for m in model_of_interest]) and "$" not in str(p)
-]
-print(len(results_files))
-print(results_files)
-
-# %% jupyter={"outputs_hidden": false} pycharm={"name": "#%%\n"}
-from ar6_ch6_rcmipfigs.utils.misc_func import prep_str_for_filename
+from ar6_ch6_rcmipfigs.utils.database_generation import read_file_index, select_files
 
 variables_of_interest = variables_erf + variables_erf_comp + variables_erf_tot
-relevant_files = [
-    str(p)
-    for p in results_files
-    if any(
-        [
-            bool(re.match(".*{}.*".format(prep_str_for_filename(v)), str(p)))
-            for v in variables_of_interest
-        ]
-    )
-]
-print("Number of relevant files: {}".format(len(relevant_files)))
-relevant_files
-
-# %% [markdown]
-# ### Remove quantile files:
-
-# %%
-quantile='quantile'
-relevant_files= [
-    str(p)
-    for p in relevant_files
-    if quantile not in p]
+file_index = read_file_index(RESULTS_PATH, "rcmip-phase-1")
+relevant_files = select_files(file_index, climatemodels=climatemodels_of_interest,
+                              variables=variables_of_interest, ignore_case=True)
 print("Number of relevant files: {}".format(len(relevant_files)))
 relevant_files
 
@@ -165,16 +131,16 @@ relevant_files
 # ### Read in all variables:
 
 # %% jupyter={"outputs_hidden": false} pycharm={"name": "#%%\n"}
-db = []
-for rf in tqdm.tqdm_notebook(relevant_files):
-    # print(rf.endswith('sf'))
-    if rf.endswith(".csv"):
-        loaded = ScmDataFrame(rf)
-    else:
-        loaded = ScmDataFrame(rf, sheet_name="your_data")
-    db.append(loaded.filter(variable=variables_erf, scenario=scenarios_fl))  # variables_of_interest))
-print(db)
-db = df_append(db).timeseries().reset_index()
+from ar6_ch6_rcmipfigs.utils.results_loader import load_results
+from ar6_ch6_rcmipfigs.utils.database_generation import read_database_parquet
+
+if DATABASE_FORMAT == "parquet":
+    # only the row groups of the scenarios needed are read:
+    db = read_database_parquet(RESULTS_PATH, "rcmip-phase-1", files=relevant_files,
+                               filters=dict(variable=variables_erf, scenario=scenarios_fl))
+else:
+    # files are read in parallel and filtered while they are read:
+    db = load_results(relevant_files, filters=dict(variable=variables_erf, scenario=scenarios_fl))  # variables_of_interest))
 db["unit"] = db["unit"].apply(
     lambda x: x.replace("Dimensionless", "dimensionless") if isinstance(x, str) else x
 )
@@ -244,19 +210,16 @@ db.head()
 # ## Aggregate and rename
 
 # %%
-from ar6_ch6_rcmipfigs.utils.misc_func import aggregate_variable
+from ar6_ch6_rcmipfigs.utils.misc_func import aggregate_variables
+
+# %% [markdown]
+# All models are aggregated at once, models which already report a variable keep it:
 
-# %%
-erf_aerosols = "Effective Radiative Forcing|Anthropogenic|Aerosols"
-db_aggregated = db.copy()
-for cmod in db_aggregated[climatemodel].unique():
-    db_aggregated = aggregate_variable(db_aggregated, erf_aerosols, cmod)  # "Effective Radiative Forcing|Anthropogenic|F-Gases|HFC")
 # %% jupyter={"outputs_hidden": false} pycharm={"name": "#%%\n"}
+erf_aerosols = "Effective Radiative Forcing|Anthropogenic|Aerosols"
 erf_HFC = "Effective Radiative Forcing|Anthropogenic|F-Gases|HFC"
-# aggregate HFC variables
-for cmod in db_aggregated[climatemodel].unique():
-    db_aggregated = aggregate_variable(db_aggregated, erf_HFC, cmod)  # "Effective Radiative Forcing|Anthropogenic|F-Gases|HFC")
-# )
+db_aggregated, aggregation_report = aggregate_variables(db, [erf_aerosols, erf_HFC])
+aggregation_report
 
 # %% jupyter={"outputs_hidden": false} pycharm={"name": "#%%\n"}
 # aggregate Aerosols:
@@ -327,45 +290,41 @@ times = db_aggregated.time_points  # timeseries().transpose().index
 
 # %% [markdown]
 # ## Convert data to xarray dataset
-#
-#
+# The timeseries table is pivoted once into a (variable, scenario, climatemodel, time) array:
 
 # %% jupyter={"outputs_hidden": false} pycharm={"name": "#%%\n"}
-import cftime
-
-t_coord = db_aggregated.timeseries().transpose().index.values
-
-ds = xr.Dataset()  # coords={time:t_coord, climatemodel:climatemodels_fl,
-#      scenario:scenarios})
-first = True
-for var in variables_erf_comp + variables_erf_tot:
-    # get data array for variable:
-    _da = db_aggregated.filter(variable=var, climatemodel=climatemodels_fl
-                               ).timeseries().transpose().unstack().to_xarray().squeeze()
-    # convert to dataset:
-    _ds = _da.to_dataset(name=var)
-    # remove coordinate for variabel (contained in name):
-    del _ds.coords[variable]
-    # merge with existing dataset:
-    ds = xr.merge([_ds, ds])
-ds['year'] = xr.DataArray([t.year for t in ds['time'].values], dims='time')
-ds['month'] = xr.DataArray([t.month for t in ds['time'].values], dims='time')
-ds['day'] = xr.DataArray([t.day for t in ds['time'].values], dims='time')
-# Convert to cftime
-dates = [cftime.DatetimeGregorian(y, m, d) for y, m, d in zip(ds['year'], ds['month'], ds['day'])]
-ds['time'] = dates
-ds = ds.sel(time=slice('1850', '2100'))
-ds['time'] = pd.to_datetime([pd.datetime(y, m, d) for y, m, d in zip(ds['year'], ds['month'], ds['day'])])
-# Timestep for integral:
-ds['delta_t'] = xr.DataArray(np.ones(len(ds['time'])), dims='time', coords={'time': ds['time']})
+from ar6_ch6_rcmipfigs.utils.forcing_dataset import build_forcing_dataset
+from ar6_ch6_rcmipfigs.utils.time_axis import time_fields, time_step, to_time_axis
+
+# 'datetime64' (years 1678-2261) or 'cftime' for longer, e.g. multi-millennium, runs:
+TIME_OUTPUT = 'datetime64'
+CALENDAR = 'standard'
+
+ds = build_forcing_dataset(db_aggregated.filter(climatemodel=climatemodels_fl),
+                           variables=variables_erf_comp + variables_erf_tot, dims=(scenario, climatemodel))
+year, month, day = time_fields(ds['time'].values)
+in_period = (year >= 1850) & (year <= 2100)
+ds = ds.isel(time=in_period)
+ds['time'] = to_time_axis(ds['time'].values, output=TIME_OUTPUT, calendar=CALENDAR)
+ds['year'] = ('time', year[in_period])
+ds['month'] = ('time', month[in_period])
+ds['day'] = ('time', day[in_period])
+# Timestep for integral (in years, ones for annual data):
+ds['delta_t'] = ('time', time_step(ds['time'].values, calendar=CALENDAR))
 ds_save = ds.copy()
 
 # %%
 ds
 
 
+# %% [markdown]
+# Save compressed, with one scenario per chunk (a path ending with .zarr writes a Zarr store instead).
+# Set `float32=True` to halve the size of the file.
+
 # %%
-ds_save.to_netcdf(SAVEPATH_DATASET)
+from ar6_ch6_rcmipfigs.utils.dataset_io import write_dataset
+
+write_dataset(ds_save, SAVEPATH_DATASET, float32=False)
 
 # %%
 SAVEPATH_DATASET
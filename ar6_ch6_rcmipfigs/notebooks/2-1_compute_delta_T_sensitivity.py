@@ -81,20 +81,7 @@ PATH_DT_OUTPUT = RESULTS_DIR + '/tables/table_sens_dT_cs.csv'
 
 # %%
 
-def IRF(t, l=0.885, alpha1=0.587 / 4.1, alpha2=0.413 / 249, tau1=4.1, tau2=249):
-    """
-    Returns the IRF function for:
-    :param t: Time in years
-    :param l: climate sensitivity factor
-    :param alpha1:
-    :param alpha2:
-    :param tau1:
-    :param tau2:
-    :return:
-    IRF
-    """
-    return l * (alpha1 * np.exp(-t / tau1) + alpha2 * np.exp(-t / tau2))
-
+from ar6_ch6_rcmipfigs.utils.irf_integration import IRF
 
 # %%
 
@@ -129,7 +116,9 @@ scenarios_fl = ['ssp119', 'ssp126', 'ssp245', 'ssp370', 'ssp370-lowNTCF-aerchemm
 # ## Open dataset:
 
 # %%
-ds = xr.open_dataset(PATH_DATASET)
+from ar6_ch6_rcmipfigs.utils.dataset_io import read_dataset
+
+ds = read_dataset(PATH_DATASET)
 
 # %% [markdown]
 # # Integrate:
@@ -141,128 +130,8 @@ ds = xr.open_dataset(PATH_DATASET)
 # \end{align*}
 
 # %%
-name_deltaT = 'Delta T'
-
-
-def new_varname(var, nname):
-    """
-    var:str
-        Old variable of format varname|bla|bla
-    nname:str
-        name for the resulting variable, based on var
-    Returns
-    -------
-    new variable name with nname|bla|bla
-    """
-    return nname + '|' + '|'.join(var.split('|')[1:])
-
-
-def integrate_(i, var, nvar, ds, ds_DT, csfac=0.885):
-    """
-    
-    Parameters
-    ----------
-    i:int
-        the index for the integral
-    var:str
-        the name of the EFR variables to integrate
-    nvar:str
-        the name of output integrated value
-
-    ds:xr.Dataset
-        the ds with the intput data
-    ds_DT: xr.Dataset
-        the ouptut ds with the integrated results
-    csfac: climate sensitivity factor (for IRF)
-    Returns
-    -------
-    None
-    
-    """
-    # lets create a ds that goes from 0 to i inclusive
-    ds_short = ds[{'time': slice(0, i + 1)}].copy()
-    # lets get the current year
-    current_year = ds_short['time'][{'time': i}].dt.year
-    # lets get a list of years
-    years = ds_short['time'].dt.year
-    # lets get the year delta until current year(i)
-    ds_short['end_year_delta'] = current_year - years
-
-    # lets get the irf values from 0 until i
-    ds_short['irf'] = IRF(
-        ds_short['end_year_delta'] * ds_short['delta_t'], l=csfac
-    )
-
-    # lets do the famous integral
-    ds_short['to_integrate'] = \
-        ds_short[var] * \
-        ds_short['irf'] * \
-        ds_short['delta_t']
-
-    # lets sum all the values up until i and set
-    # this value at ds_DT
-    # If whole array is null, set value to nan
-    if np.all(ds_short['to_integrate'].isnull()):  # or last_null:
-        _val = np.nan
-    else:
-        # 
-
-        _ds_int = ds_short['to_integrate'].sum(['time'])
-        # mask where last value is null (in order to not get intgral 
-        _ds_m1 = ds_short['to_integrate'].isel(time=-1)
-        # where no forcing data)
-        _val = _ds_int.where(_ds_m1.notnull())
-    # set value in dataframe:
-    ds_DT[nvar][{'time': i}] = _val
-
-
-def integrate_to_dT(ds, from_t, to_t, variables, csfac=0.885):
-    """
-    Integrate forcing to temperature change.
-
-    :param ds: dataset containing the focings
-    :param from_t: start time
-    :param to_t: end time
-    :param variables: variables to integrate
-    :param csfac: climate sensitivity factor
-    :return:
-    """
-    # slice dataset
-    ds_sl = ds.sel(time=slice(from_t, to_t))
-    len_time = len(ds_sl['time'])
-    # lets create a result DS
-    ds_DT = ds_sl.copy()
-
-    # lets define the vars of the ds
-    vars = variables  # variables_erf_comp+ variables_erf_tot #['EFR']
-    for var in variables:
-        namevar = new_varname(var, name_deltaT)
-        # set all values to zero for results dataarray:
-        ds_DT[namevar] = ds_DT[var] * 0
-        # Units Kelvin:
-        ds_DT[namevar].attrs['unit'] = 'K'
-        if 'unit' in ds_DT[namevar].coords:
-            ds_DT[namevar].coords['unit'] = 'K'
-
-    for i in range(len_time):
-        # da = ds[var]
-        if (i % 20) == 0:
-            print('%s of %s done' % (i, len_time))
-        for var in variables:
-            namevar = new_varname(var, name_deltaT)  # 'Delta T|' + '|'.join(var.split('|')[1:])
-
-            # print(var)
-            integrate_(i, var, namevar, ds_sl, ds_DT, csfac=csfac)
-    clear_output()
-
-    fname = 'DT_%s-%s.nc' % (from_t, to_t)
-    # save dataset.
-    ds_DT.to_netcdf(fname)
-    #for var in variables:
-    #    ds_DT[var].plot(alpha=0.3)
-    # plt.show()
-    #plt.show()
-    return ds_DT
+from ar6_ch6_rcmipfigs.utils.irf_integration import integrate_to_dT_sensitivity, name_deltaT
+from ar6_ch6_rcmipfigs.utils.misc_func import new_varname
 
 
 
@@ -271,6 +140,8 @@ def integrate_to_dT(ds, from_t, to_t, variables, csfac=0.885):
 
 # %% [markdown]
 # ## Compute $\Delta T$ with 3 different climate sensitivities
+# The IRF is linear in the climate sensitivity factor, so we integrate once and scale to each ECS
+# (new dimension 'ECS' in the dataset).
 
 # %%
 0.884-0.526
@@ -281,9 +152,8 @@ def integrate_to_dT(ds, from_t, to_t, variables, csfac=0.885):
 # %%
 csfs = [0.884, 0.526, 1.136]
 ECS2ecsf = {'ECS = 2K':0.526, 'ECS = 3.4K':0.884, 'ECS = 5K': 1.136 }
-dic_ds = {}
-for key  in ECS2ecsf:
-    dic_ds[key] = integrate_to_dT(ds, '1850', '2100',(variables_erf_comp+variables_erf_tot), csfac=ECS2ecsf[key])
+ds_DT_ECS = integrate_to_dT_sensitivity(ds, '1850', '2100', (variables_erf_comp + variables_erf_tot), ECS2ecsf,
+                                        dim='ECS')
 
 # %% [markdown]
 # ## Set reference year
@@ -295,6 +165,15 @@ ref_year = '2021'
 years= ['2040', '2100']
 iterables = [list(ECS2ecsf.keys()), years]
 
+# Delta T relative to reference year, mean over climate models, for all ECS values at once:
+variables_dt_comp = [new_varname(var, name_deltaT) for var in variables_erf_comp]
+_ds_dT = ds_DT_ECS[variables_dt_comp]
+_ds_dT_refy = _ds_dT.sel(time=slice(ref_year, ref_year)).squeeze('time', drop=True)
+dic_dT_mean = {}
+for year in years:
+    _ds_dT_y = _ds_dT.sel(time=slice(year, year)).squeeze('time', drop=True)
+    dic_dT_mean[year] = (_ds_dT_y - _ds_dT_refy).mean('climatemodel')
+
 def setup_table(scenario_n=''):
     _i = pd.MultiIndex.from_product(iterables, names=['', ''])
     table = pd.DataFrame(columns=[var.split('|')[-1] for var in variables_erf_comp], index = _i).transpose()
@@ -312,12 +191,7 @@ for scn in scenarios_fl:
         dtvar = new_varname(var, name_deltaT)
         for key in ECS2ecsf:
             for year in years: 
-                
-                _tab_da = dic_ds[key][dtvar].sel(scenario=scn, time=slice(year,year))-  dic_ds[key][dtvar].sel(scenario=scn, time=slice(ref_year,ref_year)).squeeze()
-                #print(_tab_da)
-
-                #_tab_da = dic_ds[key][var].sel(scenario=scn, time=slice(year,year))
-                tab.loc[tabvar,key][year]=_tab_da.mean('climatemodel').values[0]
+                tab.loc[tabvar,key][year] = dic_dT_mean[year][dtvar].sel(scenario=scn, ECS=key).item()
     scntab_dic[scn]=tab.copy()
 
 
@@ -358,13 +232,7 @@ for scn in scenarios_fl:
         print(dtvar)
         for key in ECS2ecsf:
             for year in years: 
-                
-                _tab_da = dic_ds[key][dtvar].sel(scenario=scn, time=slice(year,year))-  dic_ds[key][dtvar].sel(scenario=scn, time=slice(ref_year,ref_year)).squeeze()
-                #print(_tab_da)
-
-                #_tab_da = dic_ds[key][var].sel(scenario=scn, time=slice(year,year))
-                #print(_tab_da['climatemodel'])
-                tab.loc[(scn, tabvar), (key,year)] =_tab_da.mean('climatemodel').values[0]
+                tab.loc[(scn, tabvar), (key,year)] = dic_dT_mean[year][dtvar].sel(scenario=scn, ECS=key).item()
     #scntab_dic[scn]=tab.copy()
 
 
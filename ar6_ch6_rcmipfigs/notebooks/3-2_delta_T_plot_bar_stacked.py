@@ -141,7 +141,11 @@ def setup_table_prop(scenario_n='', years=None, vars=None, scens=None):
 # where IRF is the impulse response function and ERF is the effective radiative forcing from RCMIP. 
 
 # %%
-ds_DT = xr.open_dataset(PATH_DT)
+from ar6_ch6_rcmipfigs.utils.delta_T_data import DeltaTData
+
+# opened lazily, the derived views (SLCF stack, anomalies, model mean and std) are memoized:
+dt_data = DeltaTData(PATH_DT, variables_erf_comp)
+ds_DT = dt_data.ds
 
 
 # %% [markdown]
@@ -167,16 +171,10 @@ var = variables_erf_comp[0]
 f_totn = sum_name(var)
 dt_totn = sum_name(new_varname(var, name_deltaT))
 
-# make xarray with variable as new dimension:
-_lst_f = []
-_lst_dt = []
-for var in variables_erf_comp:
-    _lst_f.append(ds_DT[var])
-    _lst_dt.append(ds_DT[new_varname(var, name_deltaT)])
-erf_all = sum_name('Effective Radiative Forcing|Anthropogenic|all')
-dt_all = sum_name(new_varname('Effective Radiative Forcing|Anthropogenic|all', name_deltaT))
-ds_DT[erf_all] = xr.concat(_lst_f, pd.Index(variables_erf_comp, name='variable'))
-ds_DT[dt_all] = xr.concat(_lst_dt, pd.Index(variables_erf_comp, name='variable'))
+# dataset with the SLCF components stacked along a new dimension variable:
+erf_all = dt_data.erf_all
+dt_all = dt_data.dt_all
+ds_DT = dt_data.ds_slcf
 
 # %%
 ref_year = '2021'
@@ -185,62 +183,50 @@ scntab_dic = {}
 
 # tab_tot = setup_table2()
 # tab_tot_sd = setup_table2()
-def table_of_sts(ds_DT, scenarios_nhist, variables, tab_vars, years, ref_year, sts='mean'):
+def table_of_sts(dT_stats, scenarios_nhist, variables, tab_vars, years, ref_year, sts='mean'):
     """
     Creates pandas dataframe of statistics (mean, median, standard deviation) for change
-    in temperature Delta T since year (ref year) for each scenario in scenarios,
+    in temperature Delta T since year (ref year) for each scenario in scenarios, indexed from
+    the statistics computed by DeltaTData.statistics.
 
-    :param ds_DT:
+    :param dT_stats: statistics from DeltaTData.statistics
     :param scenarios_nhist:
     :param variables:
     :param tab_vars:
     :param years:
     :param ref_year:
-    :param sts:
+    :param sts: 'mean', 'median', 'std', 'min' or 'max'
     :return:
     """
     tabel = setup_table_prop(years=years, vars=tab_vars)
-    for scn in scenarios_nhist:
-        for var, tabvar in zip(variables, tab_vars):
-            dtvar = new_varname(var, name_deltaT) # if ERF name, changes it here.
-            tabscn = scn  # Table scenario name the same.
-            for year in years:
-                _da =ds_DT[dtvar].sel(scenario=scn)
-                _da_refy = _da.sel(time=slice(ref_year, ref_year)).squeeze() # ref year value
-                _da_y = _da.sel(time=slice(year, year)) # year value
-                _tab_da = _da_y - _da_refy
-                #_tab_da = ds_DT[dtvar].sel(scenario=scn, time=slice(year, year)) - ds_DT[dtvar].sel(scenario=scn,
-                #                                                                                    time=slice(ref_year,
-                #                                                                                               ref_year)).squeeze()
-
-                # Do statistics over RCMIP models
-                if sts == 'mean':
-                    tabel.loc[(year, tabvar), tabscn] = _tab_da.mean('climatemodel').values[0]
-                if sts == 'median':
-                    tabel.loc[(year, tabvar), tabscn] = _tab_da.median('climatemodel').values[0]
-                elif sts == 'std':
-                    tabel.loc[(year, tabvar), tabscn] = _tab_da.std('climatemodel').values[0]
-
-    return tabel
+    dtvars = [new_varname(var, name_deltaT) for var in variables]  # if ERF name, changes it here.
+    _stats = dT_stats.sel(statistic=sts, ref_year=ref_year, variable=dtvars, scenario=list(scenarios_nhist))
+    # year value (first time step in year):
+    year_of_time = _stats['time.year'].values
+    _stats = _stats.isel(time=[np.flatnonzero(year_of_time == int(year))[0] for year in years])
+    _values = _stats.transpose('time', 'variable', 'scenario').values.reshape(len(years) * len(variables), -1)
+    return pd.DataFrame(_values, index=tabel.index, columns=tabel.columns)
+
 
+# Statistics over the RCMIP models of Delta T relative to ref_year, for all variables and scenarios
+# (the SLCF components summed in Delta T|Anthropogenic|All):
+dT_stats = dt_data.statistics([ref_year])
 
 # Statistics on Delta T anthropogenic
 # Mean
-tabel_dT_anthrop = table_of_sts(ds_DT, scenarios_nhist, ['Delta T|Anthropogenic'], ['Total'], years, ref_year)
+tabel_dT_anthrop = table_of_sts(dT_stats, scenarios_nhist, ['Delta T|Anthropogenic'], ['Total'], years, ref_year)
 # Standard deviation
-tabel_dT_anthrop_SD = table_of_sts(ds_DT, scenarios_nhist, ['Delta T|Anthropogenic'], ['Total'], years, ref_year, sts='std')
+tabel_dT_anthrop_SD = table_of_sts(dT_stats, scenarios_nhist, ['Delta T|Anthropogenic'], ['Total'], years, ref_year, sts='std')
 # Mean:
-tabel_dT_slcfs = table_of_sts(ds_DT, scenarios_nhist, variables_dt_comp, [var.split('|')[-1] for var in variables_dt_comp], years,
+tabel_dT_slcfs = table_of_sts(dT_stats, scenarios_nhist, variables_dt_comp, [var.split('|')[-1] for var in variables_dt_comp], years,
                               ref_year)
 # Standard deviation
-tabel_dT_slcfs_DF = table_of_sts(ds_DT, scenarios_nhist, variables_dt_comp, [var.split('|')[-1] for var in variables_dt_comp],
+tabel_dT_slcfs_DF = table_of_sts(dT_stats, scenarios_nhist, variables_dt_comp, [var.split('|')[-1] for var in variables_dt_comp],
                                  years, ref_year, sts='std')
-# Compute sum of SLCFs
-_ds = ds_DT.copy()
+# Sum of SLCFs
 vall = 'Delta T|Anthropogenic|All'
-_ds[vall] = _ds[vall].sum('variable')
-tabel_dT_sum_slcf = table_of_sts(_ds, scenarios_nhist, [vall], ['Sum SLCFs'], years, ref_year)
-tabel_dT_sum_slcf_SD = table_of_sts(_ds, scenarios_nhist, [vall], ['Sum SLCFs'], years, ref_year, sts='std')
+tabel_dT_sum_slcf = table_of_sts(dT_stats, scenarios_nhist, [vall], ['Sum SLCFs'], years, ref_year)
+tabel_dT_sum_slcf_SD = table_of_sts(dT_stats, scenarios_nhist, [vall], ['Sum SLCFs'], years, ref_year, sts='std')
 
 # %%
 from ar6_ch6_rcmipfigs.constants import RESULTS_DIR
@@ -365,10 +351,10 @@ def sigma_com(sig_DT, mu_DT, sig_alpha, mu_alpha, dim='climatemodel'):
             sig_alpha ** 2 + mu_alpha ** 2) - mu_DT ** 2 * mu_alpha ** 2) / mu_alpha ** 2) ** (.5)
 
 
-sum_DT_std =  table_of_sts(_ds, scenarios_nhist, [vall], ['Sum SLCFs'], years, ref_year, sts='std')
-sum_DT_mean = table_of_sts(_ds, scenarios_nhist, [vall], ['Sum SLCFs'], years, ref_year, sts='mean')
-tot_DT_std = table_of_sts(ds_DT, scenarios_nhist, ['Delta T|Anthropogenic'], ['Total'], years, ref_year, sts='std')
-tot_DT_mean = table_of_sts(ds_DT, scenarios_nhist, ['Delta T|Anthropogenic'], ['Total'], years, ref_year, sts='mean')
+sum_DT_std =  table_of_sts(dT_stats, scenarios_nhist, [vall], ['Sum SLCFs'], years, ref_year, sts='std')
+sum_DT_mean = table_of_sts(dT_stats, scenarios_nhist, [vall], ['Sum SLCFs'], years, ref_year, sts='mean')
+tot_DT_std = table_of_sts(dT_stats, scenarios_nhist, ['Delta T|Anthropogenic'], ['Total'], years, ref_year, sts='std')
+tot_DT_mean = table_of_sts(dT_stats, scenarios_nhist, ['Delta T|Anthropogenic'], ['Total'], years, ref_year, sts='mean')
 
 yerr_sum = sigma_com(sum_DT_std, sum_DT_mean, .24, .885)
 yerr_tot = sigma_com(tot_DT_std, tot_DT_mean, .24, .885)  # .rename('')
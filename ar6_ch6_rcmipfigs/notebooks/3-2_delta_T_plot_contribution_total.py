@@ -88,7 +88,11 @@ climatemodels_fl = ['Cicero-SCM', 'Cicero-SCM-ECS3', 'FaIR-1.5-DEFAULT', 'MAGICC
 # where IRF is the impulse response function and ERF is the effective radiative forcing from RCMIP. 
 
 # %%
-ds_DT = xr.open_dataset(PATH_DT)
+from ar6_ch6_rcmipfigs.utils.delta_T_data import DeltaTData
+
+# opened lazily, the derived views (SLCF stack, anomalies, model mean and std) are memoized:
+dt_data = DeltaTData(PATH_DT, variables_erf_comp)
+ds_DT = dt_data.ds
 
 # %%
 name_deltaT = 'Delta T'
@@ -135,16 +139,10 @@ var = variables_erf_comp[0]
 f_totn = sum_name(var)
 dt_totn = sum_name(new_varname(var, name_deltaT))
 
-# make xarray with variable as new dimension:
-_lst_f = []
-_lst_dt = []
-for var in variables_erf_comp:
-    _lst_f.append(ds_DT[var])
-    _lst_dt.append(ds_DT[new_varname(var, name_deltaT)])
-erf_all = sum_name('Effective Radiative Forcing|Anthropogenic|all')
-dt_all = sum_name(new_varname('Effective Radiative Forcing|Anthropogenic|all', name_deltaT))
-ds_DT[erf_all] = xr.concat(_lst_f, pd.Index(variables_erf_comp, name='variable'))
-ds_DT[dt_all] = xr.concat(_lst_dt, pd.Index(variables_erf_comp, name='variable'))
+# dataset with the SLCF components stacked along a new dimension variable:
+erf_all = dt_data.erf_all
+dt_all = dt_data.dt_all
+ds_DT = dt_data.ds_slcf
 
 # %%
 ds_diff = ds_DT.sel(time='2100').squeeze()-ds_DT.sel(time='2021').squeeze()
@@ -175,8 +173,7 @@ scenarios_ss = ['ssp126','ssp245', 'ssp585']
 ref_var_erf = 'Effective Radiative Forcing|Anthropogenic'
 ref_var_dt = new_varname(ref_var_erf, name_deltaT)
 # make subset and ref to year s_y:
-_ds = ds_DT.sel(scenario=scenarios_ss, time=slice(s_y2, e_y2)) - ds_DT.sel(scenario=scenarios_ss,
-                                                                           time=slice(s_y, s_y)).squeeze()
+_ds = dt_data.anomaly(s_y, s_y2, e_y2, scenarios=scenarios_ss)
 cdic1 = get_cmap_dic(variables_erf_comp, palette='bright')
 cdic2 = get_cmap_dic(variables_dt_comp, palette='bright')
 cdic = dict(**cdic1, **cdic2)
@@ -270,8 +267,7 @@ scenarios_ss = ['ssp126','ssp245', 'ssp585']
 ref_var_erf = 'Effective Radiative Forcing|Anthropogenic'
 ref_var_dt = new_varname(ref_var_erf, name_deltaT)
 # make subset and ref to year s_y:
-_ds = ds_DT.sel(scenario=scenarios_ss, time=slice(s_y2, e_y2)) - ds_DT.sel(scenario=scenarios_ss,
-                                                                           time=slice(s_y, s_y)).squeeze()
+_ds = dt_data.anomaly(s_y, s_y2, e_y2, scenarios=scenarios_ss)
 cdic1 = get_cmap_dic(variables_erf_comp, palette='bright')
 cdic2 = get_cmap_dic(variables_dt_comp, palette='bright')
 cdic = dict(**cdic1, **cdic2)
@@ -364,8 +360,7 @@ scenarios_ss = list(set( scenarios_fl) - {'historical','ssp370-lowNTCF-aerchemmi
 ref_var_erf = 'Effective Radiative Forcing|Anthropogenic'
 ref_var_dt = new_varname(ref_var_erf, name_deltaT)
 # make subset and ref to year s_y:
-_ds = ds_DT.sel(scenario=scenarios_ss, time=slice(s_y2, e_y2)) - ds_DT.sel(scenario=scenarios_ss,
-                                                                           time=slice(s_y, s_y)).squeeze()
+_ds = dt_data.anomaly(s_y, s_y2, e_y2, scenarios=scenarios_ss)
 cdic1 = get_cmap_dic(variables_erf_comp, palette='bright')
 cdic2 = get_cmap_dic(variables_dt_comp, palette='bright')
 cdic = dict(**cdic1, **cdic2)
@@ -87,7 +87,11 @@ climatemodels_fl = ['Cicero-SCM', 'Cicero-SCM-ECS3', 'FaIR-1.5-DEFAULT', 'MAGICC
 # where IRF is the impulse response function and ERF is the effective radiative forcing from RCMIP. 
 
 # %%
-ds_DT = xr.open_dataset(PATH_DT)
+from ar6_ch6_rcmipfigs.utils.delta_T_data import DeltaTData
+
+# opened lazily, the derived views (SLCF stack, anomalies, model mean and std) are memoized:
+dt_data = DeltaTData(PATH_DT, variables_erf_comp)
+ds_DT = dt_data.ds
 
 # %%
 ds_DT
@@ -208,11 +212,8 @@ for var in variables_erf_comp:
     fig, axs = plt.subplots(1, 2, figsize=[20, 6])
     for scn in scenarios_fl:#list(set(scenarios) - {'historical'}):
         first = True
-        _da1 = ds_DT[new_varname(var, name_deltaT)].sel(scenario=scn, time=slice(s_y2, e_y2)) - ds_DT[
-            new_varname(var, name_deltaT)].sel(
-            scenario=scn, time=slice(s_y, s_y)).squeeze()
-        _da2 = ds_DT[var].sel(scenario=scn, time=slice(s_y2, e_y2)) - ds_DT[var].sel(scenario=scn,
-                                                                                     time=slice(s_y, s_y)).squeeze()
+        _da1 = dt_data.anomaly(s_y, s_y2, e_y2)[new_varname(var, name_deltaT)].sel(scenario=scn)
+        _da2 = dt_data.anomaly(s_y, s_y2, e_y2)[var].sel(scenario=scn)
         for _da, ax in zip([_da1, _da2], axs):
             _pl_da = _da.mean(climatemodel)
             _pl_da.plot(ax=ax, c=cdic[scn], label=scn, linestyle = lsdic[scn])
@@ -245,15 +246,12 @@ for var, ax in zip(variables_erf_comp, axs):
     # print(var)
     for scn in scenarios_fl:#list(set(scenarios) - {'historical'}):
         # first=True
-        _da = ds_DT[new_varname(var, name_deltaT)].sel(scenario=scn, time=slice(s_y, e_y)) - ds_DT[
-            new_varname(var, name_deltaT)].sel(
-            scenario=scn, time=slice(s_y2, s_y2)).squeeze()
         # _da2 = ds_DT[nvar(var, nname)].sel(scenario=scn, time=slice(s_y2,e_y2))- ds_DT[nvar(var, nname)].sel(scenario=scn, time=slice(s_y2,s_y2)).squeeze()
         # _da2 = ds_DT[var].sel(scenario=scn, time=slice(s_y,e_y))- ds_DT[var].sel(scenario=scn, time=slice(s_y,s_y)).squeeze()
         # for _da, ax in zip([_da1, _da2], axs):
-        _pl_da = _da.mean(climatemodel)
+        _pl_da = dt_data.model_mean(s_y2, s_y, e_y)[new_varname(var, name_deltaT)].sel(scenario=scn)
         _pl_da.plot(ax=ax, c=cdic[scn], linestyle = lsdic[scn], label=scn)
-        _std = _da.std(climatemodel)
+        _std = dt_data.model_std(s_y2, s_y, e_y)[new_varname(var, name_deltaT)].sel(scenario=scn)
         ax.fill_between(_pl_da['time'].values, _pl_da - _std, _pl_da + _std, alpha=0.3,
                         color=cdic[scn], label='_nolegen_')
         ax.set_title('%s, start year: %s' % (('|'.join(var.split('|')[1:])), s_y))
@@ -290,16 +288,10 @@ var = variables_erf_comp[0]
 f_totn = sum_name(var)
 dt_totn = sum_name(new_varname(var, name_deltaT))
 
-# make xarray with variable as new dimension:
-_lst_f = []
-_lst_dt = []
-for var in variables_erf_comp:
-    _lst_f.append(ds_DT[var])
-    _lst_dt.append(ds_DT[new_varname(var, name_deltaT)])
-erf_all = sum_name('Effective Radiative Forcing|Anthropogenic|all')
-dt_all = sum_name(new_varname('Effective Radiative Forcing|Anthropogenic|all', name_deltaT))
-ds_DT[erf_all] = xr.concat(_lst_f, pd.Index(variables_erf_comp, name='variable'))
-ds_DT[dt_all] = xr.concat(_lst_dt, pd.Index(variables_erf_comp, name='variable'))
+# dataset with the SLCF components stacked along a new dimension variable:
+erf_all = dt_data.erf_all
+dt_all = dt_data.dt_all
+ds_DT = dt_data.ds_slcf
 
 # %%
 fig, axs = plt.subplots(1, 2, figsize=[20, 6])
@@ -310,8 +302,7 @@ for var, ax in zip([dt_totn, f_totn], axs):
     for scn in list(set(scenarios_fl) - {'historical'}):
         first = True
         _da = ds_DT[var].sel(scenario=scn)
-        _da = ds_DT[var].sel(scenario=scn, time=slice(s_y, e_y)) - ds_DT[var].sel(scenario=scn,
-                                                                                  time=slice(s_y, s_y)).squeeze()
+        _da = dt_data.anomaly(s_y, s_y, e_y)[var].sel(scenario=scn)
         # _da2 = ds_DT[nvar(var, nname)].sel(scenario=scn, time=slice(s_y2,e_y2))- ds_DT[nvar(var, nname)].sel(scenario=scn, time=slice(s_y2,s_y2)).squeeze()
 
         _pl_da = _da.sum(variable)
@@ -343,8 +334,7 @@ for var, ax in zip([dt_totn, f_totn], axs):
     for scn in list(set(scenarios_fl) - {'historical'}):
         first = True
         _da = ds_DT[var].sel(scenario=scn)
-        _da = ds_DT[var].sel(scenario=scn, time=slice(s_y2, e_y2)) - ds_DT[var].sel(scenario=scn,
-                                                                                    time=slice(s_y, s_y)).squeeze()
+        _da = dt_data.anomaly(s_y, s_y2, e_y2)[var].sel(scenario=scn)
         # _da2 = ds_DT[nvar(var, nname)].sel(scenario=scn, time=slice(s_y2,e_y2))- ds_DT[nvar(var, nname)].sel(scenario=scn, time=slice(s_y2,s_y2)).squeeze()
         # _pl_da = _da.sum(variable)
         _pl_da = _da.mean(climatemodel)
@@ -410,14 +400,10 @@ for var in variables_dt_comp:
     fig, ax = plt.subplots(1, 1, figsize=figsize)
     for scn in list(set(scenarios_fl) - {'historical'}):
         first = True
-        _da = ds_DT[var].sel(scenario=scn, time=slice(s_y2, e_y2)) - ds_DT[new_varname(var, name_deltaT)].sel(
-            scenario=scn,
-            time=slice(s_y,
-                       s_y)).squeeze()
         # _da2 = ds_DT[var].sel(scenario=scn, time=slice(s_y2,e_y2))- ds_DT[var].sel(scenario=scn, time=slice(s_y,s_y)).squeeze()
-        _pl_da = _da.mean(climatemodel)
+        _pl_da = dt_data.model_mean(s_y, s_y2, e_y2)[var].sel(scenario=scn)
         _pl_da.plot(ax=ax, c=cdic[scn], label=scn, linestyle = lsdic[scn])
-        _std = _da.std(climatemodel)
+        _std = dt_data.model_std(s_y, s_y2, e_y2)[var].sel(scenario=scn)
         ax.fill_between(_pl_da['time'].values, _pl_da - _std, _pl_da + _std, alpha=0.3,
                         color=cdic[scn], label='_nolegen_')
     ax.set_title('%s' % (('|'.join(var.split('|')[1:]))))
@@ -455,9 +441,7 @@ for var in [dt_totn]:  # , f_totn]:
     print(var)
     for scn in list(set(scenarios_fl) - {'historical'}):
         # Plot dataset difference to first year, i.e.
-        ds_DT_sy = ds_DT[var].sel(scenario=scn,
-                       time=slice(s_y, s_y)).squeeze()
-        _da = ds_DT[var].sel(scenario=scn, time=slice(s_y2, e_y2)) - ds_DT_sy
+        _da = dt_data.anomaly(s_y, s_y2, e_y2)[var].sel(scenario=scn)
         # Take mean over climate models:
         _pl_da = _da.mean(climatemodel)
         # Sum up the variables:
@@ -556,14 +540,10 @@ for var, ax in zip(variables_dt_comp, axs):
     #fig, ax = plt.subplots(1, 1, figsize=figsize)
     for scn in list(set(scenarios_fl) - {'historical'}):
         first = True
-        _da = ds_DT[var].sel(scenario=scn, time=slice(s_y2, e_y2)) - ds_DT[new_varname(var, name_deltaT)].sel(
-            scenario=scn,
-            time=slice(s_y,
-                       s_y)).squeeze()
         # _da2 = ds_DT[var].sel(scenario=scn, time=slice(s_y2,e_y2))- ds_DT[var].sel(scenario=scn, time=slice(s_y,s_y)).squeeze()
-        _pl_da = _da.mean(climatemodel)
+        _pl_da = dt_data.model_mean(s_y, s_y2, e_y2)[var].sel(scenario=scn)
         _pl_da.plot(ax=ax, c=cdic[scn], label=trans_scen2plotlabel(scn), linestyle = lsdic[scn])
-        _std = _da.std(climatemodel)
+        _std = dt_data.model_std(s_y, s_y2, e_y2)[var].sel(scenario=scn)
         ax.fill_between(_pl_da['time'].values, _pl_da - _std, _pl_da + _std, alpha=0.3,
                         color=cdic[scn], label='_nolegen_')
     ax.set_title('%s' % (('|'.join(var.split('|')[1:]))))
@@ -614,9 +594,7 @@ for var in [dt_totn]:  # , f_totn]:
     print(var)
     for scn in list(set(scenarios_fl) - {'historical'}):
         # Plot dataset difference to first year, i.e.
-        ds_DT_sy = ds_DT[var].sel(scenario=scn,
-                       time=slice(s_y, s_y)).squeeze()
-        _da = ds_DT[var].sel(scenario=scn, time=slice(s_y2, e_y2)) - ds_DT_sy
+        _da = dt_data.anomaly(s_y, s_y2, e_y2)[var].sel(scenario=scn)
         # Take mean over climate models:
         _pl_da = _da.mean(climatemodel)
         # Sum up the variables:
@@ -680,8 +658,7 @@ scenarios_ss = ['ssp126', 'ssp585']
 ref_var_erf = 'Effective Radiative Forcing|Anthropogenic'
 ref_var_dt = new_varname(ref_var_erf, name_deltaT)
 # make subset and ref to year s_y:
-_ds = ds_DT.sel(scenario=scenarios_ss, time=slice(s_y2, e_y2)) - ds_DT.sel(scenario=scenarios_ss,
-                                                                           time=slice(s_y, s_y)).squeeze()
+_ds = dt_data.anomaly(s_y, s_y2, e_y2, scenarios=scenarios_ss)
 cdic1 = get_cmap_dic(variables_erf_comp, palette='bright')
 cdic2 = get_cmap_dic(variables_dt_comp, palette='bright')
 cdic = dict(**cdic1, **cdic2)
@@ -775,8 +752,7 @@ scenarios_ss = ['ssp126', 'ssp585']
 ref_var_erf = 'Effective Radiative Forcing|Anthropogenic'
 ref_var_dt = new_varname(ref_var_erf, name_deltaT)
 # make subset and ref to year s_y:
-_ds = ds_DT.sel(scenario=(scenarios_ss + [optimal_emission_reduction_scn]), time=slice(s_y2, e_y2)) - ds_DT.sel(
-    scenario=(scenarios_ss + [optimal_emission_reduction_scn]), time=slice(s_y, s_y)).squeeze()
+_ds = dt_data.anomaly(s_y, s_y2, e_y2, scenarios=scenarios_ss + [optimal_emission_reduction_scn])
 variables_dt_comp = [new_varname(var, name_deltaT) for var in variables_erf_comp]
 cdic1 = get_cmap_dic(variables_erf_comp, palette='bright')
 cdic2 = get_cmap_dic(variables_dt_comp, palette='bright')
@@ -861,8 +837,7 @@ scenarios_ss = ['ssp126', 'ssp585']
 ref_var_erf = 'Effective Radiative Forcing|Anthropogenic'
 ref_var_dt = new_varname(ref_var_erf, name_deltaT)
 # make subset and ref to year s_y:
-_ds = ds_DT.sel(scenario=scenarios_ss, time=slice(s_y2, e_y2)) - ds_DT.sel(scenario=scenarios_ss,
-                                                                           time=slice(s_y, s_y)).squeeze()
+_ds = dt_data.anomaly(s_y, s_y2, e_y2, scenarios=scenarios_ss)
 variables_dt_comp = [new_varname(var, name_deltaT) for var in variables_erf_comp]
 cdic1 = get_cmap_dic(variables_erf_comp, palette='bright')
 cdic2 = get_cmap_dic(variables_dt_comp, palette='bright')
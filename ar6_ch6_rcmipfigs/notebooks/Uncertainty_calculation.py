@@ -168,3 +168,30 @@ def sigma_DT(dT, sig_alpha, mu_alpha, dim='climatemodel'):
 # b) $\Delta T_x$ calculated for a fixed $\mu_\alpha$ 
 #
 # to compute the uncertainty bars. 
+
+# %% [markdown]
+# ## Monte Carlo alternative:
+# Instead of propagating the uncertainty analytically (independence and normality), we can draw $N$ sets of IRF parameters
+# ($\alpha$ and, if wanted, $c_i$ and $\tau_i$), integrate the ERF of every RCMIP model with each set and compute
+# statistics over the samples. The statistics are computed on the fly, so the samples are never all held in memory.
+
+# %%
+import os
+
+from ar6_ch6_rcmipfigs.constants import OUTPUT_DATA_DIR
+from ar6_ch6_rcmipfigs.utils.dataset_io import read_dataset
+from ar6_ch6_rcmipfigs.utils.irf_ensemble import integrate_to_dT_ensemble
+
+PATH_DATASET = OUTPUT_DATA_DIR + '/forcing_data_rcmip_models.nc'
+ds = read_dataset(PATH_DATASET)
+
+variables_erf = ['Effective Radiative Forcing|Anthropogenic|CH4',
+                 'Effective Radiative Forcing|Anthropogenic|Aerosols',
+                 'Effective Radiative Forcing|Anthropogenic|Tropospheric Ozone',
+                 'Effective Radiative Forcing|Anthropogenic|F-Gases|HFC',
+                 'Effective Radiative Forcing|Anthropogenic|Other|BC on Snow',
+                 'Effective Radiative Forcing|Anthropogenic']
+# sigma_alpha = 0.24, mu_alpha=0.885:
+ds_DT_mc = integrate_to_dT_ensemble(ds, '1850', '2100', variables_erf, n_samples=10000,
+                                    params={'l': (0.885, 0.24)}, n_workers=os.cpu_count(), seed=0)
+ds_DT_mc
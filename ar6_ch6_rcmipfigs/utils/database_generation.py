@@ -1,11 +1,24 @@
+import itertools
 import os
 import re
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
 from datetime import datetime
 from pprint import pprint
 import logging
+import pandas as pd
 import pyam
 import tqdm
-from scmdata import ScmDataFrame
+from scmdata import ScmDataFrame, df_append
+from scmdata.filters import pattern_match
+from scmdata.units import UnitConverter
+
+from ar6_ch6_rcmipfigs.utils.results_loader import filter_rows
+
+try:
+    import pyarrow
+    import pyarrow.parquet as pq
+except ImportError:
+    pyarrow = None
 
 """
 All code is based on or directly copied from Zebedee Nicholls (zebedee.nicholls@climate-energy-college.org)
@@ -32,117 +45,269 @@ def strip_quantile(inv):
 
 
 def check_all_variables_and_units_as_in_protocol(df_to_check, protocol_variables):
-    checker_df = df_to_check.filter(variable="*Other*", keep=False)[
-        ["variable", "unit"]
-    ]
-    checker_df["unit"] = checker_df["unit"].apply(
-        lambda x: x.replace("dimensionless", "Dimensionless")
-        if isinstance(x, str)
-        else x
-    )
-
-    def strip_quantile(inv):
-        if any([inv.endswith(suf) for suf in ["quantile", "mean", "stddev"]]):
-            return "|".join(inv.split("|")[:-1])
-
-        return inv
-
-    checker_df["variable"] = checker_df["variable"].apply(strip_quantile)
-    merged_df = checker_df.merge(protocol_variables[["variable", "unit"]])
+    report = validate_against_protocol(df_to_check, protocol_variables, check_scenarios=False)
     try:
-        assert len(merged_df) == len(checker_df)
+        assert report.empty
     except AssertionError:
-        pprint(set(checker_df["variable"]) - set(protocol_variables["variable"]))
-        pprint(set(checker_df["unit"]) - set(protocol_variables["unit"]))
+        pprint(set(report.loc[report["kind"] == "variable", "variable"]))
+        pprint(set(report.loc[report["kind"] == "unit", "unit"]))
         raise
 
 
 def check_all_scenarios_as_in_protocol(df_to_check, protocol_scenarios):
-    checker_df = df_to_check["scenario"].to_frame()
-    merged_df = checker_df.merge(protocol_scenarios[["scenario"]])
-    assert len(merged_df) == len(checker_df), set(checker_df["scenario"]) - set(
-        merged_df["scenario"]
-    )
-
-
-def unify_units(in_df, protocol_variables, exc_info=False):
-    out_df = in_df.copy()
-    for variable in tqdm.tqdm_notebook(out_df["variable"].unique()):
-        if variable.startswith("Radiative Forcing|Anthropogenic|Albedo Change"):
-            target_unit = protocol_variables[
-                protocol_variables["variable"]
-                == "Radiative Forcing|Anthropogenic|Albedo Change"
-                ]["unit"].iloc[0]
-
-        elif variable.startswith(
-                "Effective Radiative Forcing|Anthropogenic|Albedo Change"
-        ):
-            target_unit = protocol_variables[
-                protocol_variables["variable"]
-                == "Effective Radiative Forcing|Anthropogenic|Albedo Change"
-                ]["unit"].iloc[0]
-
-        elif variable.startswith("Carbon Pool"):
-            target_unit = protocol_variables[
-                protocol_variables["variable"] == "Carbon Pool|Atmosphere"
-                ]["unit"].iloc[0]
-
-        elif "Other" in variable:
-            target_unit = protocol_variables[
-                protocol_variables["variable"]
-                == "{}".format(variable.split("|Other")[0])
-                ]["unit"].iloc[0]
-
-        elif any([variable.endswith(suf) for suf in ["quantile", "mean", "stddev"]]):
+    report = validate_against_protocol(df_to_check, protocol_scenarios=protocol_scenarios, check_variables=False)
+    assert report.empty, set(report["scenario"])
+
+
+# last part of quantile, mean and stddev variables, see strip_quantile:
+_STATISTIC_SUFFIX = re.compile(r"(?:^|\|)[^|]*(?:quantile|mean|stddev)$")
+
+
+def _get_converted_units(variable_units, protocol_variables):
+    """
+    Unit of each (variable, unit) pair after unify_units: the target unit if the conversion is possible,
+    otherwise the unit is kept. Only one UnitConverter is built per distinct conversion.
+    """
+    plan = plan_unit_conversions(variable_units["variable"].unique(), protocol_variables)
+    convertible = {}
+    units = []
+    for variable, unit in zip(variable_units["variable"], variable_units["unit"]):
+        if variable not in plan or not isinstance(unit, str):
+            units.append(unit)
+            continue
+        target_unit, context = plan[variable]
+        if (unit, target_unit, context) not in convertible:
             try:
-                target_unit = protocol_variables[
-                    protocol_variables["variable"] == "|".join(variable.split("|")[:-1])
-                    ]["unit"].iloc[0]
+                UnitConverter(unit, target_unit, context=context)
+                convertible[unit, target_unit, context] = True
             except:
-                logger.exception(
-                    f"Failed to find unit for {variable}", exc_info=exc_info
-                )
-                continue
+                convertible[unit, target_unit, context] = False
+        units.append(target_unit if convertible[unit, target_unit, context] else unit)
+    return units
+
+
+def validate_against_protocol(df_to_check, protocol_variables=None, protocol_scenarios=None,
+                              check_variables=True, check_scenarios=True, converted=True):
+    """
+    Checks the scenarios, variables and units of all climate models against the protocol in one pass,
+    working on the unique values only. Variables containing "Other" are not checked and the statistic
+    suffix of quantile, mean and stddev variables is stripped, as in strip_quantile.
+
+    :param df_to_check: ScmDataFrame or timeseries table
+    :param protocol_variables: protocol variable definitions (columns variable and unit)
+    :param protocol_scenarios: protocol scenario definitions (column scenario)
+    :param check_variables: check the variables and units
+    :param check_scenarios: check the scenarios
+    :param converted: the units have been unified already, otherwise they are checked as they would be
+    after unify_units, so that a climate model can be rejected before converting it
+    :return: pd.DataFrame with one row per mismatch and columns climatemodel, kind ("scenario",
+    "variable" or "unit"), scenario, variable, unit and protocol_unit; empty if all is as in the protocol
+    """
+    ts = df_to_check.timeseries() if isinstance(df_to_check, ScmDataFrame) else df_to_check
+    meta = ts.index.to_frame(index=False) if isinstance(ts.index, pd.MultiIndex) else ts
+    if "climatemodel" not in meta:
+        meta = meta.assign(climatemodel=None)
+    columns = ["climatemodel", "kind", "scenario", "variable", "unit", "protocol_unit"]
+    report = [pd.DataFrame(columns=columns)]
+
+    if check_scenarios:
+        scenarios = meta[["climatemodel", "scenario"]].drop_duplicates()
+        report.append(scenarios[~scenarios["scenario"].isin(set(protocol_scenarios["scenario"]))].assign(
+            kind="scenario"))
+
+    if check_variables:
+        variables = meta[["climatemodel", "variable", "unit"]].drop_duplicates()
+        variables = variables[~variables["variable"].str.contains("Other", regex=False)]
+        variable_units = variables[["variable", "unit"]].drop_duplicates()
+        if not converted:
+            variable_units["converted_unit"] = _get_converted_units(variable_units, protocol_variables)
         else:
-            try:
-                target_unit = protocol_variables[
-                    protocol_variables["variable"] == variable
-                    ]["unit"].iloc[0]
-            except:
-                logger.exception(
-                    f"Failed to find unit for {variable}", exc_info=exc_info
-                )
-                continue
+            variable_units["converted_unit"] = variable_units["unit"]
+        variable_units["protocol_variable"] = variable_units["variable"].str.replace(_STATISTIC_SUFFIX, "", regex=True)
+        variable_units["converted_unit"] = variable_units["converted_unit"].replace("dimensionless", "Dimensionless")
+        variables = variables.merge(variable_units, on=["variable", "unit"], how="left")
+
+        protocol_units = protocol_variables.groupby("variable")["unit"].agg(lambda x: ", ".join(map(str, x)))
+        protocol_pairs = set(zip(protocol_variables["variable"], protocol_variables["unit"].fillna("")))
+        in_protocol = variables["protocol_variable"].isin(set(protocol_variables["variable"]))
+        pair_in_protocol = pd.Series(
+            [pair in protocol_pairs for pair in zip(variables["protocol_variable"],
+                                                    variables["converted_unit"].fillna(""))],
+            index=variables.index, dtype=bool,
+        )
+        report.append(variables[~in_protocol].assign(kind="variable"))
+        wrong_unit = variables[in_protocol & ~pair_in_protocol]
+        report.append(wrong_unit.assign(kind="unit", unit=wrong_unit["converted_unit"],
+                                        protocol_unit=wrong_unit["protocol_variable"].map(protocol_units)))
+
+    report = pd.concat(report, ignore_index=True, sort=False)[columns]
+    return report.sort_values(["climatemodel", "kind"]).reset_index(drop=True)
+
+
+def get_unit_index(protocol_variables):
+    """
+    Index of the protocol variable definitions: variable -> unit (the first definition of each variable).
+    """
+    unique_variables = protocol_variables.drop_duplicates("variable")
+    return dict(zip(unique_variables["variable"], unique_variables["unit"]))
+
+
+def get_target_unit(variable, unit_index):
+    """
+    Target unit of variable from the protocol unit index (see get_unit_index). Albedo Change and
+    Carbon Pool subcategories and "|Other" variables take the unit of their parent variable and
+    quantile, mean and stddev variables that of the variable without the suffix.
+    Returns None if the variable (or its parent) is not in the protocol.
+    """
+    if variable.startswith("Radiative Forcing|Anthropogenic|Albedo Change"):
+        return unit_index.get("Radiative Forcing|Anthropogenic|Albedo Change")
+
+    if variable.startswith("Effective Radiative Forcing|Anthropogenic|Albedo Change"):
+        return unit_index.get("Effective Radiative Forcing|Anthropogenic|Albedo Change")
+
+    if variable.startswith("Carbon Pool"):
+        return unit_index.get("Carbon Pool|Atmosphere")
+
+    if "Other" in variable:
+        return unit_index.get(variable.split("|Other")[0])
+
+    if any([variable.endswith(suf) for suf in ["quantile", "mean", "stddev"]]):
+        return unit_index.get("|".join(variable.split("|")[:-1]))
+
+    return unit_index.get(variable)
+
+
+def plan_unit_conversions(variables, protocol_variables):
+    """
+    Resolves the target unit and unit context of each variable.
+
+    :param variables: variables to convert
+    :param protocol_variables: protocol variable definitions (columns variable and unit)
+    :return: dictionary of variable: (target unit, context), variables without a unit in the
+    protocol (missing or NaN) are logged and left out
+    """
+    unit_index = get_unit_index(protocol_variables)
+    plan = {}
+    for variable in variables:
+        target_unit = get_target_unit(variable, unit_index)
+        if not isinstance(target_unit, str):
+            logger.error(f"Failed to find unit for {variable}")
+            continue
+
+        if "CH4" in target_unit:
+            plan[variable] = (target_unit, "CH4_conversions")
+        elif "NOx" in target_unit:
+            plan[variable] = (target_unit, "NOx_conversions")
+        elif target_unit == "Dimensionless":
+            plan[variable] = ("dimensionless", None)
+        else:
+            plan[variable] = (target_unit, None)
+    return plan
 
+
+def unify_units(in_df, protocol_variables, exc_info=False):
+    """
+    Converts all timeseries to the units of the protocol. The target unit of each variable is
+    resolved once (see plan_unit_conversions) and the timeseries are converted in groups of
+    (current unit, target unit, context), so there is one conversion per distinct unit pair.
+    """
+    ts = in_df.timeseries()
+    meta = ts.index.to_frame(index=False)
+    if "unit_context" not in meta:
+        meta["unit_context"] = None
+    values = ts.values.copy()
+
+    plan = plan_unit_conversions(meta["variable"].unique(), protocol_variables)
+    no_unit = meta["unit"].isnull() & meta["variable"].isin(plan)
+    if no_unit.any():
+        logger.error(f"Failed for {meta.loc[no_unit, 'variable'].unique()} without current_unit")
+    keys = pd.DataFrame({
+        "unit": meta["unit"],
+        "target_unit": meta["variable"].map({v: target for v, (target, _) in plan.items()}),
+        # groupby drops None, so no context is "":
+        "context": meta["variable"].map({v: context or "" for v, (_, context) in plan.items()}),
+    }).dropna()
+    for (current_unit, target_unit, context), rows in keys.groupby(
+            ["unit", "target_unit", "context"]
+    ).groups.items():
+        context = context or None
         try:
-            if "CH4" in target_unit:
-                out_df = out_df.convert_unit(
-                    target_unit, variable=variable, context="CH4_conversions"
-                )
-                continue
-
-            if "NOx" in target_unit:
-                out_df = out_df.convert_unit(
-                    target_unit, variable=variable, context="NOx_conversions"
-                )
-                continue
-
-            if target_unit == "Dimensionless":
-                target_unit = "dimensionless"
-
-            out_df = out_df.convert_unit(target_unit, variable=variable)
+            uc = UnitConverter(current_unit, target_unit, context=context)
         except:
-            current_unit = out_df.filter(variable=variable)["unit"].unique()
+            variables = meta.loc[rows, "variable"].unique()
             logger.exception(
-                f"Failed for {variable} with target unit: {target_unit} and current_unit: {current_unit}",
+                f"Failed for {variables} with target unit: {target_unit} and current_unit: {current_unit}",
                 exc_info=exc_info,
             )
+            continue
+        values[rows] = uc.convert_from(values[rows])
+        meta.loc[rows, "unit"] = target_unit
+        meta.loc[rows, "unit_context"] = context
 
-    out_df = out_df.timeseries().reset_index()
+    out_df = pd.DataFrame(values, index=pd.MultiIndex.from_frame(meta), columns=ts.columns).reset_index()
     out_df["unit_context"] = out_df["unit_context"].fillna("not_required")
     return ScmDataFrame(out_df)
 
 
+# the ssp370-lowNTCF scenarios of the submissions are the ones of Gidden et al.:
+SCENARIO_RELABEL = {
+    "ssp370-lowNTCF": "ssp370-lowNTCF-gidden",
+    "esm-ssp370-lowNTCF": "esm-ssp370-lowNTCF-gidden",
+    "esm-ssp370-lowNTCF-allGHG": "esm-ssp370-lowNTCF-gidden-allGHG",
+}
+
+
+def relabel_scenarios(df):
+    """
+    Relabels the ssp370-lowNTCF scenarios (see SCENARIO_RELABEL) to remove ambiguity.
+
+    :param df: ScmDataFrame
+    :return: ScmDataFrame
+    """
+    df = df.timeseries().reset_index()
+    df["scenario"] = df["scenario"].replace(SCENARIO_RELABEL)
+    return ScmDataFrame(df)
+
+
+def unify_submissions(df, protocol_variables, protocol_scenarios):
+    """
+    Checks the submissions of each climate model against the protocol (see validate_against_protocol)
+    and unifies the units of those which pass (see unify_units). The mismatches are printed.
+
+    :param df: ScmDataFrame
+    :param protocol_variables: protocol variable definitions (columns variable and unit)
+    :param protocol_scenarios: protocol scenario definitions (column scenario)
+    :return: ScmDataFrame with the units of the protocol
+    :raises AssertionError: if any climate model does not pass
+    """
+    base_df = df.timeseries()
+    protocol_report = validate_against_protocol(base_df, protocol_variables, protocol_scenarios, converted=False)
+
+    any_failures = False
+    clean_db = []
+    for climatemodel, cdf in tqdm.tqdm_notebook(base_df.groupby("climatemodel"), desc="Climate model"):
+        print(climatemodel)
+        print("-" * len(climatemodel))
+
+        mismatches = protocol_report[protocol_report["climatemodel"] == climatemodel]
+        print()
+        if mismatches.empty:
+            clean_db.append(unify_units(ScmDataFrame(cdf), protocol_variables))
+            print("All clear for {}".format(climatemodel))
+        else:
+            print(mismatches.drop(columns="climatemodel").to_string(index=False))
+            print("Failed {}".format(climatemodel))
+            print("X" * len("Failed"))
+            any_failures = True
+
+        print()
+        print()
+
+    if any_failures:
+        raise AssertionError("database isn't ready yet")
+    return df_append(clean_db)
+
+
 def prep_str_for_filename(ins):
     return (
         ins.replace("_", "-")
@@ -154,16 +319,23 @@ def prep_str_for_filename(ins):
     )
 
 
-def get_filename(scmdf, leader):
-    climatemodel = prep_str_for_filename(
-        scmdf.get_unique_meta("climatemodel", no_duplicates=True)
-    )
-    variable = prep_str_for_filename(
-        scmdf.get_unique_meta("variable", no_duplicates=True)
+def get_filename_from_meta(climatemodel, region, variable, leader, extension="csv"):
+    return "{}_{}_{}_{}.{}".format(
+        leader,
+        prep_str_for_filename(climatemodel),
+        prep_str_for_filename(region),
+        prep_str_for_filename(variable),
+        extension,
     )
-    region = prep_str_for_filename(scmdf.get_unique_meta("region", no_duplicates=True))
 
-    return "{}_{}_{}_{}.csv".format(leader, climatemodel, region, variable)
+
+def get_filename(scmdf, leader):
+    return get_filename_from_meta(
+        scmdf.get_unique_meta("climatemodel", no_duplicates=True),
+        scmdf.get_unique_meta("region", no_duplicates=True),
+        scmdf.get_unique_meta("variable", no_duplicates=True),
+        leader,
+    )
 
 
 def convert_scmdf_to_pyamdf_year_only(iscmdf):
@@ -173,30 +345,323 @@ def convert_scmdf_to_pyamdf_year_only(iscmdf):
     return pyam.IamDataFrame(out)
 
 
-def save_into_database(db, db_path, filename_leader):
-    for cm in tqdm.tqdm_notebook(
-            db["climatemodel"].unique(), leave=False, desc="Climate models"
-    ):
-        db_cm = db.filter(climatemodel=cm)
-        for r in tqdm.tqdm_notebook(
-                db_cm["region"].unique(), leave=False, desc="Regions"
-        ):
-            db_cm_r = db_cm.filter(region=r)
-            for v in tqdm.tqdm_notebook(
-                    db_cm_r["variable"].unique(), leave=False, desc="Variables"
-            ):
-                db_cm_r_v = ScmDataFrame(db_cm_r.filter(variable=v))
-                filename = get_filename(db_cm_r_v, leader=filename_leader)
-                outfile = os.path.join(db_path, filename)
-
-                convert_scmdf_to_pyamdf_year_only(db_cm_r_v).to_csv(outfile)
-                logger.debug("saved file to {}".format(outfile))
+def to_pyam_table(ts):
+    """
+    Timeseries table (metadata index, year columns) in the layout written by
+    convert_scmdf_to_pyamdf_year_only(...).to_csv, without building the IamDataFrame: timeseries
+    with missing metadata and years without any data are dropped and the columns are in title case.
+    """
+    iamc_idx = ["model", "scenario", "region", "variable", "unit"]
+    idx = iamc_idx + [col for col in ts.index.names if col not in iamc_idx]
+    out = ts.reset_index()
+    out = out[out[idx].notnull().all(axis=1)].set_index(idx).sort_index()
+    out = out.dropna(how="all").dropna(how="all", axis=1).reset_index()
+    return out.rename(columns={c: str(c).title() for c in out.columns})
+
+
+def get_parquet_filename(scmdf, leader):
+    return get_filename(scmdf, leader)[: -len(".csv")] + ".parquet"
+
+
+def get_parquet_index_filename(leader):
+    return "{}_index.parquet".format(leader)
+
+
+def get_file_index_filename(leader):
+    return "{}_files.csv".format(leader)
+
+
+def _keep_index_entries(old_index, rewritten, db_path):
+    """
+    Entries of old_index (with a file column) for files which were not rewritten and are still in db_path.
+    """
+    kept = ~old_index["file"].isin(rewritten) & old_index["file"].map(
+        lambda f: os.path.isfile(os.path.join(db_path, f)))
+    return old_index[kept]
+
+
+def write_parquet(ts, outfile):
+    """
+    Writes the timeseries table ts (metadata index, year columns) to outfile in Parquet format with
+    one row group per scenario, so readers filtering on scenario can skip the others.
+
+    :return: metadata of the timeseries written
+    """
+    out = ts.copy()
+    out.columns = out.columns.map(str)
+    out = out.reset_index()
+    table = pyarrow.Table.from_pandas(out, preserve_index=False)
+    with pq.ParquetWriter(outfile, table.schema) as writer:
+        for scenario in out["scenario"].unique():
+            writer.write_table(
+                pyarrow.Table.from_pandas(out[out["scenario"] == scenario], schema=table.schema,
+                                          preserve_index=False)
+            )
+    return out[list(ts.index.names)]
+
+
+def _write_group(ts, outfile, file_format):
+    if file_format == "parquet":
+        return write_parquet(ts, outfile)
+    to_pyam_table(ts).to_csv(outfile, index=False)
+    return None
+
+
+def save_into_database(db, db_path, filename_leader, file_format="csv", n_workers=4, update=False):
+    """
+    Saves db into one file per climatemodel, region and variable (named by get_filename).
+    The timeseries table is built once and grouped in one pass, and the groups are written
+    by a pool of n_workers threads.
+
+    :param db: ScmDataFrame
+    :param db_path: folder of the database
+    :param filename_leader: start of the file names
+    :param file_format: "csv" or "parquet". With "parquet" an index of all timeseries and the files
+    they are in is written as well (see read_database_parquet).
+    An index of the file of each climatemodel, region and variable is written in both cases (see read_file_index).
+    :param n_workers: number of threads writing files
+    :param update: db only holds part of the database (e.g. the climate models rebuilt by an incremental
+    update): the index entries of the other files still in db_path are kept
+    :return: dictionary of climatemodel: names of the files written
+    """
+    if file_format not in ["csv", "parquet"]:
+        raise ValueError("Unknown file_format {}".format(file_format))
+    if file_format == "parquet" and pyarrow is None:
+        raise ValueError("pyarrow is needed to write parquet files")
+    ts = db.timeseries()
+    ts.columns = ts.columns.map(lambda x: x.year)
+    groups = ts.groupby(level=["climatemodel", "region", "variable"], sort=False)
+
+    index = []
+    written = {}
+    file_index = []
+    progress = tqdm.tqdm_notebook(total=groups.ngroups, leave=False, desc="Files")
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        # at most 2 * n_workers groups are waiting to be written at the time:
+        running = {}
+        for (cm, r, v), ts_cm_r_v in groups:
+            filename = get_filename_from_meta(cm, r, v, filename_leader, extension=file_format)
+            written.setdefault(cm, []).append(filename)
+            file_index.append((cm, r, v, filename))
+            outfile = os.path.join(db_path, filename)
+            running[executor.submit(_write_group, ts_cm_r_v, outfile, file_format)] = filename
+            while len(running) >= 2 * n_workers:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index.append((running.pop(future), future.result()))
+                    progress.update()
+        for future in as_completed(running):
+            index.append((running[future], future.result()))
+            progress.update()
+    progress.close()
+    logger.debug("saved {} files to {}".format(len(index), db_path))
+
+    rewritten = [filename for filenames in written.values() for filename in filenames]
+    if file_format == "parquet":
+        index = [meta.assign(file=filename) for filename, meta in index]
+        path_index = os.path.join(db_path, get_parquet_index_filename(filename_leader))
+        if update and os.path.isfile(path_index):
+            index.append(_keep_index_entries(pd.read_parquet(path_index), rewritten, db_path))
+        pd.concat(index, ignore_index=True, sort=False).to_parquet(path_index, index=False)
+
+    file_index = [pd.DataFrame(file_index, columns=["climatemodel", "region", "variable", "file"])]
+    path_file_index = os.path.join(db_path, get_file_index_filename(filename_leader))
+    if update and os.path.isfile(path_file_index):
+        file_index.append(_keep_index_entries(pd.read_csv(path_file_index), rewritten, db_path))
+    pd.concat(file_index, ignore_index=True, sort=False).sort_values("file").to_csv(path_file_index, index=False)
 
     with open(os.path.join(db_path, "timestamp.txt"), "w") as fh:
         fh.write("database written at: ")
         fh.write(datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
         fh.write("\n")
 
+    return written
+
+
+def build_file_index(db_path, filename_leader):
+    """
+    Index of the files of a database written without one (see save_into_database), from the
+    metadata in the files.
+
+    :return: pd.DataFrame with columns climatemodel, region, variable and file
+    """
+    path_index = os.path.join(db_path, get_parquet_index_filename(filename_leader))
+    if os.path.isfile(path_index):
+        index = pd.read_parquet(path_index, columns=["climatemodel", "region", "variable", "file"])
+        return index.drop_duplicates().reset_index(drop=True)
+    index = []
+    usecols = lambda col: col.lower() in ["climatemodel", "region", "variable"]
+    for filename in sorted(os.listdir(db_path)):
+        if not filename.startswith(filename_leader + "_") or filename == get_file_index_filename(filename_leader) \
+                or not filename.endswith(".csv"):
+            continue
+        meta = pd.read_csv(os.path.join(db_path, filename), usecols=usecols)
+        meta.columns = meta.columns.str.lower()
+        index.append(meta.drop_duplicates().assign(file=filename))
+    return pd.concat(index, ignore_index=True, sort=False)[["climatemodel", "region", "variable", "file"]]
+
+
+def read_file_index(db_path, filename_leader):
+    """
+    Reads the index of the files of the database in db_path (built from the files and saved if the
+    database was written without one).
+
+    :param db_path: folder of the database
+    :param filename_leader: start of the file names
+    :return: dictionary of (climatemodel, region, variable): path of the file
+    """
+    path_file_index = os.path.join(db_path, get_file_index_filename(filename_leader))
+    if os.path.isfile(path_file_index):
+        index = pd.read_csv(path_file_index)
+    else:
+        index = build_file_index(db_path, filename_leader)
+        index.to_csv(path_file_index, index=False)
+    return {(cm, r, v): os.path.join(db_path, filename)
+            for cm, r, v, filename in index[["climatemodel", "region", "variable", "file"]].values}
+
+
+def select_files(file_index, climatemodels=None, regions=None, variables=None, exclude_quantiles=True,
+                 ignore_case=False):
+    """
+    Paths of the files holding the timeseries of climatemodels, regions and variables. Patterns
+    (as in ScmDataFrame.filter, e.g. "Effective Radiative Forcing|Anthropogenic|*") are matched against
+    the unique values in the index only, the files are then looked up by key.
+
+    :param file_index: see read_file_index
+    :param climatemodels: climate models (or patterns), all if None
+    :param regions: regions (or patterns), all if None
+    :param variables: variables (or patterns), all if None
+    :param exclude_quantiles: leave out quantile variables
+    :param ignore_case: match the patterns case-insensitively (e.g. "fair-1.5-default*" matches FaIR-1.5-DEFAULT),
+    as the file names (in lower case) were matched before the index
+    :return: sorted list of paths
+    """
+    keys = pd.DataFrame(list(file_index), columns=["climatemodel", "region", "variable"])
+    levels = []
+    for col, values in zip(keys.columns, [climatemodels, regions, variables]):
+        unique = pd.Series(keys[col].unique())
+        if values is not None and ignore_case:
+            values = [values] if isinstance(values, str) else values
+            unique = unique[pattern_match(unique.str.lower(), [value.lower() for value in values])]
+        elif values is not None:
+            unique = unique[pattern_match(unique, values)]
+        if col == "variable" and exclude_quantiles:
+            unique = unique[~unique.str.contains("quantile", regex=False)]
+        levels.append(unique)
+    return sorted(set(file_index[key] for key in itertools.product(*levels) if key in file_index))
+
+
+def read_database_parquet(db_path, filename_leader, filters=None, years=None, files=None):
+    """
+    Reads the timeseries matching filters from a database saved with file_format="parquet".
+    The index is searched first, so only the files containing matching timeseries are opened,
+    only the row groups of the matching scenarios and only the requested years are read.
+
+    :param db_path: folder of the database
+    :param filename_leader: start of the file names
+    :param filters: dictionary of column: value(s), matched as in ScmDataFrame.filter
+    :param years: years to read, by default all
+    :param files: only read these files (paths or file names), e.g. selected by file name
+    :return: pd.DataFrame in wide format with int year columns, to be read with ScmDataFrame
+    """
+    index = pd.read_parquet(os.path.join(db_path, get_parquet_index_filename(filename_leader)))
+    if files is not None:
+        index = index[index["file"].isin([os.path.basename(str(f)) for f in files])]
+    index = filter_rows(index, filters)
+    meta_cols = [col for col in index.columns if col != "file"]
+    year_cols = None if years is None else [str(year) for year in years]
+
+    read = []
+    for filename, file_index in index.groupby("file"):
+        path = os.path.join(db_path, filename)
+        columns = None
+        if year_cols is not None:
+            available = pq.read_schema(path).names
+            columns = meta_cols + [col for col in year_cols if col in available]
+        df = pd.read_parquet(
+            path, columns=columns, filters=[("scenario", "in", list(file_index["scenario"].unique()))]
+        )
+        read.append(filter_rows(df, filters))
+    if len(read) == 0:
+        return pd.DataFrame(columns=meta_cols)
+    df = pd.concat(read, ignore_index=True, sort=False)
+    df.columns = [int(col) if col.isdigit() else col for col in df.columns]
+    return df
+
+
+def _mce_quantile_variable(variables, climatemodels):
+    quantiles = climatemodels.str.extract(r"(17th|33rd|50th|67th|83rd)$", expand=False)
+    if quantiles.isnull().any():
+        raise NotImplementedError(list(climatemodels[quantiles.isnull()]))
+    return variables + "|" + quantiles.str[:2] + "th quantile"
+
+
+def _hector_quantile_variable(variables, climatemodels):
+    quantiles = climatemodels.str.split("q").str[1]
+    quantiles = quantiles.where(quantiles.str.len() != 3, quantiles.str[:2] + "." + quantiles.str[2:])
+    statistics = quantiles.str.replace(r"^0", "", regex=True) + "th quantile"
+    statistics[climatemodels.str.endswith("Mean")] = "mean"
+    statistics[climatemodels.str.endswith("SD")] = "stddev"
+    return variables + "|" + statistics
+
+
+def _strip_leading_zero_quantile(variables, climatemodels):
+    return variables.str.replace("|00th", "|0th", regex=False).str.replace("|05th", "|5th", regex=False)
+
+
+# Reshaping of the probabilistic output of each model family, applied in this order by
+# reshape_probabilistic_output to the timeseries whose climatemodel matches the "climatemodel" pattern
+# (as in ScmDataFrame.filter). "variable" maps (variables, climatemodels) to the new variables and
+# "rename" maps climatemodels to the new climatemodels, both as vectorized string operations on pd.Series
+# of the unique (climatemodel, variable) pairs.
+PROBABILISTIC_OUTPUT_RULES = {
+    # the MCE quantiles are labelled as climate models, e.g. MCE-v1-1-PROB-17th
+    "MCE": {
+        "climatemodel": "MCE*PROB*",
+        "variable": _mce_quantile_variable,
+        "rename": lambda climatemodels: climatemodels.str.rsplit("-", n=1).str[0],
+    },
+    # the Hector quantiles are labelled as climate models, e.g. hector-HISTCALIB-q05
+    "Hector": {
+        "climatemodel": "hector*HISTCALIB*",
+        "variable": _hector_quantile_variable,
+        "rename": lambda climatemodels: climatemodels.str.split("-").str[0],
+    },
+    "FaIR": {"climatemodel": "*FaIR*", "variable": _strip_leading_zero_quantile},
+    "WASP": {"climatemodel": "*WASP*", "variable": _strip_leading_zero_quantile},
+}
+
+
+def reshape_probabilistic_output(df, rules=None):
+    """
+    Relabels the probabilistic output of the model families in rules (by default
+    PROBABILISTIC_OUTPUT_RULES) so quantiles are variables of one climate model. Only the metadata
+    table is changed, in one pass, and the string operations are done once per unique
+    (climatemodel, variable) pair.
+
+    :param df: ScmDataFrame
+    :param rules: dictionary of family: rule, see PROBABILISTIC_OUTPUT_RULES
+    :return: ScmDataFrame
+    """
+    rules = PROBABILISTIC_OUTPUT_RULES if rules is None else rules
+    ts = df.timeseries()
+    meta = ts.index.to_frame(index=False)
+    for family, rule in rules.items():
+        rows = pattern_match(meta["climatemodel"], rule["climatemodel"])
+        if not rows.any():
+            continue
+        rule_meta = meta.loc[rows, ["climatemodel", "variable"]]
+        # groups are numbered in order of appearance, as the pairs:
+        codes = rule_meta.groupby(["climatemodel", "variable"], sort=False).ngroup().values
+        pairs = rule_meta.drop_duplicates().reset_index(drop=True)
+        logger.debug("reshaping {} timeseries of {}".format(rows.sum(), family))
+        if "variable" in rule:
+            meta.loc[rows, "variable"] = rule["variable"](pairs["variable"], pairs["climatemodel"]).values[codes]
+        if "rename" in rule:
+            meta.loc[rows, "climatemodel"] = rule["rename"](pairs["climatemodel"]).values[codes]
+    ts.index = pd.MultiIndex.from_frame(meta)
+    return ScmDataFrame(ts)
+
 
 def mce_get_quantile(inp):
     if inp.endswith("33rd"):
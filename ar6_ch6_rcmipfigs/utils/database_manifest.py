@@ -0,0 +1,243 @@
+"""
+Manifest of the database written by 0_database-generation: the size, modification time and content
+hash of every input file, and the input and output files of every climate model. It is stored as
+manifest.json next to timestamp.txt and used to rebuild only the climate models whose inputs changed.
+"""
+import json
+import os
+from datetime import datetime
+
+import pandas as pd
+
+from scmdata import ScmDataFrame
+
+from ar6_ch6_rcmipfigs.utils.database_generation import get_parquet_index_filename, get_file_index_filename, \
+    relabel_scenarios, reshape_probabilistic_output, save_into_database, unify_submissions
+from ar6_ch6_rcmipfigs.utils.misc_func import file_sha1
+from ar6_ch6_rcmipfigs.utils.results_loader import load_results, read_climatemodels
+
+MANIFEST_VERSION = 1
+
+
+def get_manifest_path(db_path):
+    return os.path.join(db_path, "manifest.json")
+
+
+def empty_manifest():
+    return {"version": MANIFEST_VERSION, "depends": [], "dest": [], "inputs": {}, "climatemodels": {}}
+
+
+def read_manifest(db_path):
+    """
+    Reads the manifest of the database in db_path, empty if there is none (or it was written by
+    another version, in which case everything is rebuilt).
+    """
+    path = get_manifest_path(db_path)
+    if not os.path.isfile(path):
+        return empty_manifest()
+    with open(path) as fh:
+        manifest = json.load(fh)
+    if manifest.get("version") != MANIFEST_VERSION:
+        return empty_manifest()
+    return manifest
+
+
+def write_manifest(db_path, manifest):
+    manifest = dict(manifest, written=datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+    with open(get_manifest_path(db_path), "w") as fh:
+        json.dump(manifest, fh, indent=1, sort_keys=True)
+
+
+def file_fingerprint(path, previous=None, blocksize=2 ** 20):
+    """
+    Size, modification time and sha1 of the file path. The hash in previous (an earlier fingerprint
+    of the same file) is reused if size and modification time are unchanged.
+
+    :return: dictionary with keys size, mtime, sha1
+    """
+    stat = os.stat(path)
+    fingerprint = {"size": stat.st_size, "mtime": stat.st_mtime}
+    if previous is not None and all(previous.get(key) == fingerprint[key] for key in ["size", "mtime"]):
+        fingerprint["sha1"] = previous["sha1"]
+        return fingerprint
+    fingerprint["sha1"] = file_sha1(path, blocksize=blocksize)
+    return fingerprint
+
+
+def plan_rebuild(manifest, paths):
+    """
+    Compares the input files paths to the manifest. Changed and new files are read again, as well as
+    the other files of the climate models they (or deleted files) contribute to: a climate model is
+    always rebuilt from all its inputs.
+
+    :param manifest: manifest of the database (see read_manifest)
+    :param paths: paths of the input files
+    :return: dictionary with keys
+        inputs: fingerprints of paths, with the climate models in each file
+        changed: new or changed files
+        removed: files in the manifest which are not in paths
+        read: files to read
+        stale: climate models in the manifest to rebuild or remove
+    """
+    paths = [str(path) for path in paths]
+    previous = manifest["inputs"]
+    inputs = {}
+    changed = []
+    for path in paths:
+        inputs[path] = file_fingerprint(path, previous=previous.get(path))
+        if path in previous and previous[path]["sha1"] == inputs[path]["sha1"]:
+            inputs[path]["climatemodels"] = previous[path]["climatemodels"]
+        else:
+            inputs[path]["climatemodels"] = read_climatemodels(path)
+            changed.append(path)
+    removed = sorted(set(previous) - set(paths))
+
+    read = set(changed)
+    stale = set()
+    while True:
+        # same climate model in the file as submitted:
+        submitted = set(cm for path in read for cm in inputs[path]["climatemodels"])
+        submitted |= set(cm for path in removed for cm in previous[path]["climatemodels"])
+        _read = read | set(path for path in paths if submitted.intersection(inputs[path]["climatemodels"]))
+        # same climate model in the database:
+        stale = set(cm for cm, entry in manifest["climatemodels"].items()
+                    if set(entry["inputs"]) & (_read | set(removed)))
+        _read |= set(path for cm in stale for path in manifest["climatemodels"][cm]["inputs"] if path in inputs)
+        if _read == read:
+            break
+        read = _read
+    return {"inputs": inputs, "changed": sorted(changed), "removed": removed, "read": sorted(read),
+            "stale": sorted(stale)}
+
+
+def get_inputs_per_climatemodel(ts, source_col="source"):
+    """
+    Input files of each climate model in the timeseries table ts read by load_results(..., source_col).
+
+    :return: dictionary of climatemodel: sorted paths
+    """
+    meta = ts.index.to_frame(index=False) if source_col in ts.index.names else ts
+    pairs = meta[["climatemodel", source_col]].drop_duplicates()
+    return {cm: sorted(set(path for paths in _pairs[source_col] for path in paths.split(";")))
+            for cm, _pairs in pairs.groupby("climatemodel")}
+
+
+def check_inputs_complete(manifest, plan, inputs_per_climatemodel):
+    """
+    Raises ValueError if a climate model read is in the manifest with inputs which were not read,
+    which happens if a new file adds to a climate model under another submitted name
+    (rebuild the whole database in that case).
+    """
+    for cm, entry in manifest["climatemodels"].items():
+        missing = set(entry["inputs"]) & (set(plan["inputs"]) - set(plan["read"]))
+        if cm in inputs_per_climatemodel and missing:
+            raise ValueError("Inputs {} of {} were not read, rebuild the whole database".format(
+                sorted(missing), cm))
+
+
+def list_outputs(db_path, filename_leader):
+    """
+    Output files of the database on disk (the files of the timeseries, not the indices).
+    """
+    indices = [get_parquet_index_filename(filename_leader), get_file_index_filename(filename_leader)]
+    return sorted(filename for filename in os.listdir(db_path)
+                  if filename.startswith(filename_leader + "_") and filename not in indices
+                  and os.path.splitext(filename)[1] in [".csv", ".parquet"])
+
+
+def remove_outputs(db_path, manifest, climatemodels, filename_leader):
+    """
+    Removes the output files of climatemodels (as listed in the manifest) from the database and
+    its indices.
+    """
+    filenames = [filename for cm in climatemodels for filename in manifest["climatemodels"][cm]["outputs"]]
+    return remove_files(db_path, filenames, filename_leader)
+
+
+def remove_files(db_path, filenames, filename_leader):
+    """
+    Removes the output files filenames from the database and its indices.
+    """
+    for filename in filenames:
+        path = os.path.join(db_path, filename)
+        if os.path.isfile(path):
+            os.remove(path)
+    path_index = os.path.join(db_path, get_parquet_index_filename(filename_leader))
+    if filenames and os.path.isfile(path_index):
+        index = pd.read_parquet(path_index)
+        index[~index["file"].isin(filenames)].to_parquet(path_index, index=False)
+    path_file_index = os.path.join(db_path, get_file_index_filename(filename_leader))
+    if filenames and os.path.isfile(path_file_index):
+        file_index = pd.read_csv(path_file_index)
+        file_index[~file_index["file"].isin(filenames)].to_csv(path_file_index, index=False)
+    return filenames
+
+
+def update_manifest(manifest, plan, inputs_per_climatemodel, written, depends=None, dest=None):
+    """
+    Manifest after the rebuild of plan: the stale climate models are replaced by the ones rebuilt.
+
+    :param manifest: manifest before the rebuild
+    :param plan: see plan_rebuild
+    :param inputs_per_climatemodel: see get_inputs_per_climatemodel
+    :param written: dictionary of climatemodel: output files, as returned by save_into_database
+    :param depends: other files the database depends on (e.g. __depends__ of the notebook)
+    :param dest: files the database generation declares as output (e.g. __dest__ of the notebook)
+    :return: new manifest
+    """
+    climatemodels = {cm: entry for cm, entry in manifest["climatemodels"].items() if cm not in plan["stale"]}
+    for cm, paths in inputs_per_climatemodel.items():
+        climatemodels[cm] = {"inputs": paths, "outputs": sorted(written.get(cm, []))}
+    new = empty_manifest()
+    new.update(inputs=plan["inputs"], climatemodels=climatemodels,
+               depends=sorted(set(depends or []) | set(plan["inputs"])), dest=list(dest or []))
+    return new
+
+
+def rebuild_database(db_path, manifest, plan, protocol_variables, protocol_scenarios, filename_leader,
+                     file_format="csv", rebuild_all=False, depends=None, dest=None):
+    """
+    Rebuilds the climate models of plan (see plan_rebuild) and writes the new manifest: the files to read
+    are loaded, relabelled (see relabel_scenarios and reshape_probabilistic_output), checked against the
+    protocol and converted to its units (see unify_submissions), then the outputs of the stale climate
+    models are replaced by the new ones. With rebuild_all, every output file on disk which was not
+    written again is removed, whether it is in the manifest or not.
+
+    :param db_path: folder of the database
+    :param manifest: manifest of the database (see read_manifest), empty with rebuild_all
+    :param plan: see plan_rebuild
+    :param protocol_variables: protocol variable definitions (columns variable and unit)
+    :param protocol_scenarios: protocol scenario definitions (column scenario)
+    :param filename_leader: start of the file names
+    :param file_format: see save_into_database
+    :param rebuild_all: plan covers the whole database
+    :param depends: see update_manifest
+    :param dest: see update_manifest
+    :return: new manifest
+    """
+    if plan["read"]:
+        # files are read in parallel, the file of each timeseries is kept in the source column for the manifest:
+        db = load_results(plan["read"], source_col="source")
+        db["unit"] = db["unit"].apply(
+            lambda x: x.replace("Dimensionless", "dimensionless") if isinstance(x, str) else x
+        )
+        db = reshape_probabilistic_output(relabel_scenarios(ScmDataFrame(db)))
+
+        inputs_per_climatemodel = get_inputs_per_climatemodel(db.timeseries())
+        check_inputs_complete(manifest, plan, inputs_per_climatemodel)
+        db = ScmDataFrame(db.timeseries().reset_index("source", drop=True))
+        clean_db = unify_submissions(db, protocol_variables, protocol_scenarios)
+    else:
+        inputs_per_climatemodel = {}
+
+    remove_outputs(db_path, manifest, plan["stale"], filename_leader)
+    written = {}
+    if plan["read"]:
+        written = save_into_database(clean_db, db_path, filename_leader, file_format=file_format,
+                                     update=not rebuild_all)
+    if rebuild_all:
+        rewritten = set(filename for filenames in written.values() for filename in filenames)
+        remove_files(db_path, sorted(set(list_outputs(db_path, filename_leader)) - rewritten), filename_leader)
+    manifest = update_manifest(manifest, plan, inputs_per_climatemodel, written, depends=depends, dest=dest)
+    write_manifest(db_path, manifest)
+    return manifest
@@ -0,0 +1,121 @@
+"""
+Writing and reading of the forcing and Delta T datasets. The data variables are written compressed
+(zlib in netCDF files, Blosc in Zarr stores) and chunked along the (scenario, climatemodel, time) access
+pattern of the plotting notebooks: one scenario per chunk, with all climate models and the whole time axis.
+Optionally they are stored as float32. Paths ending with .zarr are written as Zarr stores (requires zarr),
+from which a single scenario can be read lazily without decoding the whole dataset.
+"""
+import os
+import shutil
+
+import xarray as xr
+
+try:
+    import numcodecs
+    from zarr import __version__ as zarr_version
+except ImportError:
+    numcodecs = None
+    zarr_version = None
+
+# chunk size along each dimension, dimensions not listed are not chunked:
+DEFAULT_CHUNKS = {'scenario': 1}
+
+
+def is_zarr_path(path):
+    return str(path).rstrip('/').endswith('.zarr')
+
+
+def _zarr_v3():
+    # zarr 3 writes Zarr v3 stores, with a list of codecs under 'compressors' instead of 'compressor':
+    return int(zarr_version.split('.')[0]) >= 3
+
+
+def _default_compressor(complevel):
+    if _zarr_v3():
+        from zarr.codecs import BloscCodec
+        return BloscCodec(cname='zstd', clevel=complevel, shuffle='shuffle')
+    return numcodecs.Blosc(cname='zstd', clevel=complevel, shuffle=numcodecs.Blosc.SHUFFLE)
+
+
+def _chunk_shape(var, chunks):
+    return tuple(max(1, min(chunks.get(dim, size), size)) for dim, size in zip(var.dims, var.shape))
+
+
+def get_encoding(ds, zarr=False, float32=False, complevel=4, chunks=None, compressor=None):
+    """
+    Encoding of the data variables of ds for Dataset.to_netcdf or Dataset.to_zarr.
+
+    :param ds: dataset to write
+    :param zarr: encoding for a Zarr store, otherwise for a netCDF file
+    :param float32: store floating point data variables as float32
+    :param complevel: compression level (zlib 1-9 for netCDF, Blosc 0-9 for Zarr)
+    :param chunks: dictionary of dimension: chunk size, by default DEFAULT_CHUNKS
+    :param compressor: compressor for Zarr (a numcodecs compressor for zarr 2, a zarr.codecs codec for zarr 3),
+    by default Blosc zstd with byte shuffle
+    :return: dictionary of variable: encoding
+    """
+    chunks = DEFAULT_CHUNKS if chunks is None else chunks
+    if zarr and numcodecs is None:
+        raise ImportError('Writing Zarr stores requires zarr')
+    if zarr and compressor is None:
+        compressor = _default_compressor(complevel)
+    encoding = {}
+    for name, var in ds.data_vars.items():
+        if var.dtype.kind not in 'iuf' or not var.dims:
+            continue
+        if zarr and _zarr_v3():
+            _encoding = {'compressors': (compressor,), 'chunks': _chunk_shape(var, chunks)}
+        elif zarr:
+            _encoding = {'compressor': compressor, 'chunks': _chunk_shape(var, chunks)}
+        else:
+            _encoding = {'zlib': True, 'complevel': complevel, 'shuffle': True,
+                         'chunksizes': _chunk_shape(var, chunks)}
+        if float32 and var.dtype.kind == 'f':
+            _encoding['dtype'] = 'float32'
+        encoding[name] = _encoding
+    return encoding
+
+
+def write_dataset(ds, path, float32=False, complevel=4, chunks=None, compressor=None):
+    """
+    Writes ds compressed and chunked (see get_encoding) to a netCDF file, or to a Zarr store if path
+    ends with .zarr (an existing store is replaced).
+
+    :param ds: dataset to write
+    :param path: path of the netCDF file or Zarr store
+    :param float32: see get_encoding
+    :param complevel: see get_encoding
+    :param chunks: see get_encoding
+    :param compressor: see get_encoding
+    """
+    zarr = is_zarr_path(path)
+    # the encoding ds was read with (e.g. contiguous storage) would conflict with the new one:
+    ds = ds.copy()
+    for var in ds.variables.values():
+        var.encoding = {}
+    encoding = get_encoding(ds, zarr=zarr, float32=float32, complevel=complevel, chunks=chunks,
+                            compressor=compressor)
+    if not zarr:
+        ds.to_netcdf(path, encoding=encoding)
+        return
+    # dask chunks must not be split between Zarr chunks:
+    if ds.chunks:
+        ds = ds.chunk({dim: (DEFAULT_CHUNKS if chunks is None else chunks).get(dim, -1) for dim in ds.dims})
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    ds.to_zarr(path, mode='w', encoding=encoding)
+
+
+def read_dataset(path, chunks=None):
+    """
+    Opens the dataset written by write_dataset lazily. Zarr stores are opened with the chunks they were
+    written with unless chunks is given, netCDF files with chunks if given (requires dask) and without
+    dask otherwise.
+
+    :param path: path of the netCDF file or Zarr store
+    :param chunks: dictionary of dimension: chunk size
+    :return: xr.Dataset
+    """
+    if is_zarr_path(path):
+        return xr.open_zarr(path) if chunks is None else xr.open_zarr(path, chunks=chunks)
+    return xr.open_dataset(path, chunks=chunks)
@@ -0,0 +1,260 @@
+"""
+Shared access to the Delta T dataset of the plotting notebooks (3_*). The dataset is opened lazily and
+the views derived from it (the stack of the SLCF variables, anomalies relative to a reference year,
+and the mean and standard deviation over the climate models) are computed once and kept in memory,
+bounded by a least recently used cache. The model statistics are also saved in a sidecar cache keyed
+by the content hash of the dataset, so they are only computed again when the dataset changes.
+The statistics of the anomalies needed for the figures and tables (mean, standard deviation, median,
+minimum and maximum over the climate models) are computed in one pass for all variables, scenarios and
+reference years (see anomaly_statistics) and indexed from the resulting array.
+"""
+import glob
+import hashlib
+import os
+import warnings
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from ar6_ch6_rcmipfigs.constants import OUTPUT_DATA_DIR
+from ar6_ch6_rcmipfigs.utils.dataset_io import read_dataset
+from ar6_ch6_rcmipfigs.utils.irf_integration import name_deltaT
+from ar6_ch6_rcmipfigs.utils.misc_func import file_sha1, make_folders, new_varname
+from ar6_ch6_rcmipfigs.utils.time_axis import to_time_axis
+
+DELTA_T_CACHE_DIR = os.path.join(OUTPUT_DATA_DIR, 'cache', 'delta_T')
+climatemodel = 'climatemodel'
+_statistic_functions = {'mean': np.nanmean, 'std': np.nanstd, 'median': np.nanmedian, 'min': np.nanmin,
+                        'max': np.nanmax}
+STATISTICS = list(_statistic_functions)
+
+
+def sum_name(var):
+    """
+    Name of the variable stacking the components of var, e.g. Delta T|Anthropogenic|All for
+    Delta T|Anthropogenic|CH4.
+    """
+    return '|'.join(var.split('|')[0:2]) + '|' + 'All'
+
+
+def source_hash(path):
+    """
+    sha1 of the content of the netCDF file path, or of all files in the Zarr store path.
+    """
+    if not os.path.isdir(path):
+        return file_sha1(path)
+    sha1 = hashlib.sha1()
+    for root, dirs, files in sorted(os.walk(path)):
+        for file in sorted(files):
+            _path = os.path.join(root, file)
+            sha1.update(os.path.relpath(_path, path).encode())
+            sha1.update(file_sha1(_path).encode())
+    return sha1.hexdigest()
+
+
+def anomaly_statistics(ds, ref_years, variables=None, statistics=None, dim=climatemodel):
+    """
+    Statistics over dim (the climate models) of the anomalies of the variables of ds relative to each
+    reference year, computed in one pass: the variables are stacked into one (variable, ..., dim, time)
+    array, the value in every reference year is subtracted at once and each statistic is one reduction
+    over dim. Missing values are skipped, as in the xarray reductions (std with ddof=0).
+
+    :param ds: dataset with the variables along dim and time (annual)
+    :param ref_years: reference years, e.g. ['2021'], the anomalies relative to the (first) time step in
+    each year
+    :param variables: variables along dim and time, by default all
+    :param statistics: any of STATISTICS (default all)
+    :param dim: dimension of the statistics
+    :return: xr.DataArray with dimensions statistic, variable, the other dimensions of the variables
+    (e.g. scenario), ref_year and time
+    """
+    if variables is None:
+        variables = [var for var, da in ds.data_vars.items() if dim in da.dims and 'time' in da.dims]
+    statistics = STATISTICS if statistics is None else list(statistics)
+    da = ds[list(variables)].to_array('variable').transpose('variable', ..., dim, 'time')
+    years = to_time_axis(da['time'].values, output='year')
+    ref_index = []
+    for ref_year in ref_years:
+        index = np.flatnonzero(years == int(ref_year))
+        if not len(index):
+            raise ValueError('Reference year {} not in the dataset'.format(ref_year))
+        ref_index.append(index[0])
+
+    values = da.values
+    # (variable, ..., dim, ref_year, time):
+    anomaly = values[..., np.newaxis, :] - values[..., ref_index][..., np.newaxis]
+    with warnings.catch_warnings():
+        # all-NaN slices (e.g. a variable missing for a scenario) give NaN:
+        warnings.simplefilter('ignore', RuntimeWarning)
+        cube = np.stack([_statistic_functions[statistic](anomaly, axis=-3) for statistic in statistics])
+
+    dims = [d for d in da.dims if d not in [dim, 'time']]
+    coords = {d: da[d].values for d in dims if d in da.coords}
+    coords.update(statistic=statistics, ref_year=list(ref_years), time=da['time'].values)
+    return xr.DataArray(cube, dims=['statistic'] + dims + ['ref_year', 'time'], coords=coords,
+                        name='Delta T statistics')
+
+
+class DeltaTData:
+    """
+    Lazily opened Delta T dataset with memoized derived views.
+
+    :param path: path of the Delta T dataset (netCDF file or Zarr store, see dataset_io)
+    :param variables_erf_comp: forcing variables stacked in the SLCF sum variables
+    :param maxsize: number of derived views kept in memory
+    :param cache_dir: folder of the sidecar cache of the model statistics, no sidecar cache if None
+    :param chunks: see dataset_io.read_dataset
+    """
+
+    def __init__(self, path, variables_erf_comp, maxsize=32, cache_dir=DELTA_T_CACHE_DIR, chunks=None):
+        self.path = str(path)
+        self.variables_erf_comp = list(variables_erf_comp)
+        self.variables_dt_comp = [new_varname(var, name_deltaT) for var in self.variables_erf_comp]
+        self.erf_all = sum_name(self.variables_erf_comp[0])
+        self.dt_all = sum_name(self.variables_dt_comp[0])
+        self.maxsize = maxsize
+        self.cache_dir = cache_dir
+        self.chunks = chunks
+        self._ds = None
+        self._source_hash = None
+        self._views = OrderedDict()
+
+    @property
+    def ds(self):
+        """
+        The Delta T dataset, opened on first access.
+        """
+        if self._ds is None:
+            self._ds = read_dataset(self.path, chunks=self.chunks)
+        return self._ds
+
+    @property
+    def source_hash(self):
+        if self._source_hash is None:
+            self._source_hash = source_hash(self.path)
+        return self._source_hash
+
+    def _memoized(self, key, compute):
+        """
+        compute() memoized by key, the least recently used views are dropped beyond maxsize.
+        """
+        if key in self._views:
+            self._views.move_to_end(key)
+            return self._views[key]
+        view = compute()
+        self._views[key] = view
+        if len(self._views) > self.maxsize:
+            self._views.popitem(last=False)
+        return view
+
+    def _sidecar(self, key, compute):
+        """
+        compute() (a dataset) cached in cache_dir as netCDF, keyed by key and the content hash of the
+        Delta T dataset. Cached views of older versions of the dataset are removed.
+        """
+        if self.cache_dir is None:
+            return compute()
+        leader = '{}_{}_'.format(os.path.basename(self.path.rstrip('/')),
+                                 hashlib.sha1(repr((key, self.variables_erf_comp)).encode()).hexdigest()[:16])
+        cache_file = os.path.join(self.cache_dir, leader + self.source_hash + '.nc')
+        if os.path.isfile(cache_file):
+            with xr.open_dataset(cache_file) as _ds:
+                return _ds.load()
+        view = compute().load()
+        make_folders(cache_file)
+        for old_file in glob.glob(os.path.join(self.cache_dir, glob.escape(leader) + '*.nc')):
+            os.remove(old_file)
+        view.to_netcdf(cache_file)
+        return view
+
+    def clear(self):
+        """
+        Drops the views kept in memory (e.g. after the dataset was written again).
+        """
+        self._views.clear()
+        self._ds = None
+        self._source_hash = None
+
+    @property
+    def slcf_stack(self):
+        """
+        The SLCF components stacked along a new dimension variable: erf_all for the forcing and
+        dt_all for Delta T.
+        """
+        def compute():
+            index = pd.Index(self.variables_erf_comp, name='variable')
+            return xr.Dataset({
+                self.erf_all: xr.concat([self.ds[var] for var in self.variables_erf_comp], index),
+                self.dt_all: xr.concat([self.ds[var] for var in self.variables_dt_comp], index),
+            })
+
+        return self._memoized('slcf_stack', compute)
+
+    @property
+    def ds_slcf(self):
+        """
+        The Delta T dataset with the variables of slcf_stack.
+        """
+        return self._memoized('ds_slcf', lambda: self.ds.assign(dict(self.slcf_stack.data_vars)))
+
+    def anomaly(self, ref_year, start=None, end=None, scenarios=None):
+        """
+        ds_slcf from start to end minus its value in ref_year.
+
+        :param ref_year: reference year, e.g. '2021'
+        :param start: first year, e.g. '2015'
+        :param end: last year, e.g. '2100'
+        :param scenarios: scenarios to keep, all by default
+        :return: xr.Dataset
+        """
+        scenarios = None if scenarios is None else tuple(scenarios)
+
+        def compute():
+            ds = self.ds_slcf if scenarios is None else self.ds_slcf.sel(scenario=list(scenarios))
+            return ds.sel(time=slice(start, end)) - ds.sel(time=slice(ref_year, ref_year)).squeeze()
+
+        return self._memoized(('anomaly', ref_year, start, end, scenarios), compute)
+
+    def _model_statistic(self, statistic, ref_year, start, end, scenarios):
+        scenarios = None if scenarios is None else tuple(scenarios)
+        key = (statistic, ref_year, start, end, scenarios)
+
+        def compute():
+            anomaly = self.anomaly(ref_year, start=start, end=end, scenarios=scenarios)
+            anomaly = anomaly[[var for var, da in anomaly.data_vars.items() if climatemodel in da.dims]]
+            return getattr(anomaly, statistic)(climatemodel)
+
+        return self._memoized(key, lambda: self._sidecar(key, compute))
+
+    def model_mean(self, ref_year, start=None, end=None, scenarios=None):
+        """
+        Mean over the climate models of anomaly(ref_year, start, end, scenarios).
+        """
+        return self._model_statistic('mean', ref_year, start, end, scenarios)
+
+    def model_std(self, ref_year, start=None, end=None, scenarios=None):
+        """
+        Standard deviation over the climate models of anomaly(ref_year, start, end, scenarios).
+        """
+        return self._model_statistic('std', ref_year, start, end, scenarios)
+
+    def statistics(self, ref_years, variables=None):
+        """
+        anomaly_statistics of ds_slcf (with erf_all and dt_all summed over the SLCF components) for
+        the reference years ref_years.
+
+        :param ref_years: reference years, e.g. ['2021']
+        :param variables: variables, by default all along climatemodel and time
+        :return: xr.DataArray, see anomaly_statistics
+        """
+        ref_years = tuple(ref_years)
+        variables = None if variables is None else tuple(variables)
+        key = ('statistics', ref_years, variables)
+
+        def compute():
+            ds = self.ds_slcf.assign({var: self.ds_slcf[var].sum('variable') for var in [self.erf_all, self.dt_all]})
+            return anomaly_statistics(ds, ref_years, variables=variables).to_dataset()
+
+        return self._memoized(key, lambda: self._sidecar(key, compute)['Delta T statistics'])
@@ -0,0 +1,62 @@
+"""
+Conversion of the long-format timeseries table (one row per timeseries, one column per time point)
+into the dense forcing dataset saved by 1_preprocess_data (one data variable per forcing, with dims
+scenario, climatemodel and time).
+"""
+import numpy as np
+import pandas as pd
+import xarray as xr
+from scmdata import ScmDataFrame
+
+
+def build_forcing_dataset(db, variables=None, dims=("scenario", "climatemodel")):
+    """
+    Pivots the timeseries of db into one (variable, *dims, time) array, allocated once and filled by
+    the category codes of each timeseries, and returns it as a dataset with one data variable per forcing.
+    The coordinates are the sorted unique values of each dimension and missing timeseries are NaN.
+    Other metadata (e.g. model, region, unit) become scalar coordinates if they have one value, or
+    attributes of the data variables if they have one value per variable.
+
+    :param db: ScmDataFrame or timeseries table (metadata index, time columns)
+    :param variables: variables to include, by default all in db
+    :param dims: metadata columns used as dimensions, which together with variable must identify a timeseries
+    :return: xr.Dataset
+    """
+    ts = db.timeseries() if isinstance(db, ScmDataFrame) else db
+    meta = ts.index.to_frame(index=False)
+    if variables is None:
+        variables = sorted(meta["variable"].unique())
+    rows = meta["variable"].isin(variables).values
+    meta = meta[rows].reset_index(drop=True)
+    values = ts.values[rows]
+
+    dims = list(dims)
+    if meta.duplicated(["variable"] + dims).any():
+        raise ValueError("Timeseries are not unique in variable and {}".format(dims))
+    codes = [pd.Categorical(meta["variable"], categories=list(variables)).codes]
+    coords = {}
+    for dim in dims:
+        categorical = pd.Categorical(meta[dim], categories=sorted(meta[dim].unique()))
+        codes.append(categorical.codes)
+        coords[dim] = list(categorical.categories)
+    coords["time"] = ts.columns.values
+
+    cube = np.full([len(variables)] + [len(coords[dim]) for dim in dims] + [len(coords["time"])], np.nan)
+    cube[tuple(codes)] = values
+
+    attrs = {var: {} for var in variables}
+    for col in meta.columns.drop(["variable"] + dims):
+        unique = meta[col].unique()
+        if len(unique) == 1:
+            coords[col] = unique[0]
+            continue
+        per_variable = meta.groupby("variable")[col].unique()
+        if (per_variable.map(len) > 1).any():
+            raise ValueError("{} is not unique for each variable, add it to dims".format(col))
+        for var, value in per_variable.items():
+            attrs[var][col] = value[0]
+
+    return xr.Dataset(
+        {var: xr.Variable(dims + ["time"], cube[i], attrs=attrs[var]) for i, var in enumerate(variables)},
+        coords=coords,
+    )
@@ -0,0 +1,103 @@
+"""
+Compiled IRF convolution for any time axis (e.g. variable delta_t): JIT-compiled with numba when it is
+installed, otherwise the vectorized NumPy version (convolve_direct) is used.
+"""
+import time
+
+import numpy as np
+
+from ar6_ch6_rcmipfigs.utils.irf_integration import convolve_direct, convolve_recursive, irf_kernel
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+def _convolve_loop(forcing, kernel):
+    """
+    Loop version of convolve_direct for a (column, time) forcing array, compiled by numba.
+    """
+    n_col, n_time = forcing.shape
+    _val = np.empty((n_col, n_time))
+    for col in numba.prange(n_col):
+        for i in range(n_time):
+            if np.isnan(forcing[col, i]):
+                _val[col, i] = np.nan
+                continue
+            acc = 0.
+            for j in range(i + 1):
+                if not np.isnan(forcing[col, j]):
+                    acc += forcing[col, j] * kernel[i, j]
+            _val[col, i] = acc
+    return _val
+
+
+if numba is not None:
+    _convolve_loop = numba.njit(parallel=True, cache=True)(_convolve_loop)
+
+
+def convolve_irf(forcing, years, delta_t, params=None, use_numba=None):
+    """
+    Integrates forcing with the IRF along the last axis. NaNs in the forcing are skipped in the sum
+    and the result is masked where the forcing at the current time step is missing, as in convolve_direct.
+
+    :param forcing: np.ndarray with time as last axis
+    :param years: time of each time step in (decimal) years, see time_axis.decimal_years
+    :param delta_t: time step of each time step
+    :param params: dictionary of IRF parameters (l, alpha1, alpha2, tau1, tau2), defaults as in IRF
+    :param use_numba: use the numba compiled loop, by default if numba is installed
+    :return: np.ndarray of same shape as forcing
+    """
+    if use_numba is None:
+        use_numba = numba is not None
+    if use_numba and numba is None:
+        raise ValueError('numba is not installed')
+    forcing = np.asarray(forcing, dtype=float)
+    params = dict(params or {})
+    kernel = irf_kernel(years, delta_t, csfac=params.pop('l', 0.885), **params)
+    if not use_numba:
+        return convolve_direct(forcing, kernel)
+    _val = _convolve_loop(np.ascontiguousarray(forcing.reshape(-1, forcing.shape[-1])), kernel)
+    return _val.reshape(forcing.shape)
+
+
+def benchmark_convolve_irf(shape=(7, 8, 5, 251), repeat=5, seed=0):
+    """
+    Times convolve_irf (numba and NumPy) against the methods of integrate_to_dT on random forcing
+    with annual time steps and some missing values.
+
+    :param shape: shape of the forcing, time last (default as variable, scenario, climatemodel, time)
+    :param repeat: number of runs, the fastest is reported
+    :param seed: seed for the random number generator
+    :return: dictionary of implementation: time in seconds
+    """
+    rng = np.random.default_rng(seed)
+    forcing = rng.normal(size=shape)
+    forcing[rng.random(shape) < 0.01] = np.nan
+    years = np.arange(shape[-1]) + 1850
+    delta_t = np.ones(shape[-1])
+    implementations = {
+        'direct (irf_integration)': lambda: convolve_direct(forcing, irf_kernel(years, delta_t)),
+        'recursive (irf_integration)': lambda: convolve_recursive(forcing, delta_t),
+        'convolve_irf numpy': lambda: convolve_irf(forcing, years, delta_t, use_numba=False),
+    }
+    if numba is not None:
+        implementations['convolve_irf numba'] = lambda: convolve_irf(forcing, years, delta_t, use_numba=True)
+    reference = implementations['direct (irf_integration)']()
+    timings = {}
+    for name, func in implementations.items():
+        # also compiles the numba loop before timing:
+        np.testing.assert_allclose(func(), reference, rtol=1e-10, atol=1e-12)
+        _times = []
+        for _ in range(repeat):
+            _t0 = time.perf_counter()
+            func()
+            _times.append(time.perf_counter() - _t0)
+        timings[name] = min(_times)
+        print('%s: %.4f s' % (name, timings[name]))
+    return timings
+
+
+if __name__ == '__main__':
+    benchmark_convolve_irf()
@@ -0,0 +1,223 @@
+"""
+Monte Carlo ensemble of the IRF parameters: draws parameter sets, integrates the forcing of every
+RCMIP model under each set and reduces the results on the fly to mean, standard deviation and
+quantiles, so the full (sample, variable, scenario, climatemodel, time) cube is never held in memory.
+"""
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import xarray as xr
+
+from ar6_ch6_rcmipfigs.utils.irf_integration import convolve_recursive, get_years_and_delta_t, name_deltaT
+from ar6_ch6_rcmipfigs.utils.misc_func import new_varname
+
+# mean and standard deviation of the IRF parameters, see IRF and Uncertainty_calculation.ipynb.
+# A standard deviation of 0 keeps the parameter fixed.
+irf_params_distribution = {
+    'l': (0.885, 0.24),
+    'alpha1': (0.587 / 4.1, 0.),
+    'alpha2': (0.413 / 249, 0.),
+    'tau1': (4.1, 0.),
+    'tau2': (249., 0.),
+}
+
+
+def sample_irf_params(n_samples, params=None, seed=None):
+    """
+    Draws IRF parameter sets from independent normal distributions.
+
+    :param n_samples: number of parameter sets
+    :param params: dictionary of parameter: (mean, std) updating irf_params_distribution
+    :param seed: seed for the random number generator
+    :return: dictionary of parameter: np.ndarray of length n_samples
+    """
+    distribution = dict(irf_params_distribution, **(params or {}))
+    rng = np.random.default_rng(seed)
+    samples = {}
+    for key in ['l', 'alpha1', 'alpha2', 'tau1', 'tau2']:
+        mean, std = distribution[key]
+        samples[key] = rng.normal(mean, std, n_samples)
+    if np.any(samples['tau1'] <= 0) or np.any(samples['tau2'] <= 0):
+        raise ValueError('Sampled non-positive time scale tau, reduce the standard deviation')
+    return samples
+
+
+class _StreamingStats:
+    """
+    Running count, mean and sum of squared deviations (Welford/Chan) and a histogram per cell
+    (for approximate quantiles) over the samples added so far. Samples outside of the range of the
+    histogram are counted in the edge bins and in outside.
+    """
+
+    def __init__(self, shape, lo, hi, n_bins):
+        self.count = np.zeros(shape, dtype=np.int64)
+        self.mean = np.zeros(shape)
+        self.m2 = np.zeros(shape)
+        self.lo = lo
+        self.hi = hi
+        self.n_bins = n_bins
+        self.hist = np.zeros(shape + (n_bins,), dtype=np.int32)
+        self.outside = np.zeros(shape, dtype=np.int64)
+
+    def add(self, values):
+        """
+        :param values: np.ndarray with samples along the first axis
+        """
+        notnull = ~np.isnan(values)
+        n_b = notnull.sum(axis=0)
+        _filled = np.where(notnull, values, 0.)
+        mean_b = _filled.sum(axis=0) / np.maximum(n_b, 1)
+        m2_b = (np.where(notnull, values - mean_b, 0.) ** 2).sum(axis=0)
+        self.merge(n_b, mean_b, m2_b)
+
+        # histogram, values outside of [lo, hi) are counted in the edge bins:
+        width = (self.hi - self.lo) / self.n_bins
+        _bin = np.floor((_filled - self.lo) / np.where(width > 0, width, 1.))
+        self.outside += (notnull & ((_filled < self.lo) | (_filled > self.hi))).sum(axis=0)
+        _bin = np.clip(_bin, 0, self.n_bins - 1).astype(np.int64)
+        _flat = np.arange(n_b.size).reshape(n_b.shape) * self.n_bins + _bin
+        counts = np.bincount(_flat[notnull], minlength=n_b.size * self.n_bins)
+        self.hist += counts.reshape(self.hist.shape)
+
+    def merge(self, n_b, mean_b, m2_b, hist_b=None, outside_b=None):
+        n = self.count + n_b
+        delta = mean_b - self.mean
+        _n = np.maximum(n, 1)
+        self.mean = self.mean + delta * n_b / _n
+        self.m2 = self.m2 + m2_b + delta ** 2 * self.count * n_b / _n
+        self.count = n
+        if hist_b is not None:
+            self.hist += hist_b
+        if outside_b is not None:
+            self.outside += outside_b
+
+    def std(self):
+        return np.where(self.count > 1, np.sqrt(self.m2 / np.maximum(self.count - 1, 1)), np.nan)
+
+    def quantile(self, q):
+        """
+        Approximate quantile from the histogram (linear interpolation within bins).
+        """
+        cum = np.cumsum(self.hist, axis=-1)
+        target = q * self.count
+        _bin = np.minimum((cum < target[..., np.newaxis]).sum(axis=-1), self.n_bins - 1)
+        cum_below = np.where(_bin > 0, np.take_along_axis(cum, np.maximum(_bin - 1, 0)[..., np.newaxis],
+                                                          axis=-1)[..., 0], 0)
+        in_bin = np.take_along_axis(self.hist, _bin[..., np.newaxis], axis=-1)[..., 0]
+        frac = np.clip((target - cum_below) / np.maximum(in_bin, 1), 0, 1)
+        width = (self.hi - self.lo) / self.n_bins
+        return np.where(self.count > 0, self.lo + (_bin + frac) * width, np.nan)
+
+
+# set in each worker process by _init_worker:
+_worker_forcing = None
+_worker_delta_t = None
+
+
+def _init_worker(forcing, delta_t):
+    global _worker_forcing, _worker_delta_t
+    _worker_forcing = forcing
+    _worker_delta_t = delta_t
+
+
+def _integrate_samples(forcing, delta_t, samples):
+    """
+    Integrates forcing for all parameter sets in samples at once, samples along a new first axis.
+    """
+    _p = {key: val.reshape((-1,) + (1,) * (forcing.ndim - 1)) for key, val in samples.items()}
+    return convolve_recursive(forcing[np.newaxis], delta_t, **_p)
+
+
+def _run_batches(samples, lo, hi, n_bins, batch_size, forcing=None, delta_t=None):
+    """
+    Integrates and reduces samples in batches of batch_size. Returns the streaming statistics.
+    """
+    if forcing is None:
+        forcing, delta_t = _worker_forcing, _worker_delta_t
+    stats = _StreamingStats(forcing.shape, lo, hi, n_bins)
+    n_samples = len(samples['l'])
+    for start in range(0, n_samples, batch_size):
+        batch = {key: val[start:start + batch_size] for key, val in samples.items()}
+        stats.add(_integrate_samples(forcing, delta_t, batch))
+    return stats.count, stats.mean, stats.m2, stats.hist, stats.outside
+
+
+def integrate_to_dT_ensemble(ds, from_t, to_t, variables, n_samples=1000, params=None,
+                             quantiles=(0.05, 0.17, 0.5, 0.83, 0.95), batch_size=50, n_bins=200,
+                             n_workers=1, seed=None):
+    """
+    Integrate forcing to temperature change for an ensemble of IRF parameter sets drawn from
+    the distributions in params (see sample_irf_params), reduced to statistics over the ensemble.
+    Only one batch of batch_size samples is held in memory at the time (per worker).
+    The quantiles are approximate: they are computed from a histogram of n_bins bins per value,
+    with the range set from the first batch (widened by half its range on each side). Samples outside
+    of this range are counted in the edge bins, which biases the outer quantiles: a warning is issued
+    if there are any, and their number is kept in the attribute n_outside_histogram (increase
+    batch_size to widen the range).
+
+    :param ds: dataset containing the focings
+    :param from_t: start time
+    :param to_t: end time
+    :param variables: variables to integrate
+    :param n_samples: number of parameter sets
+    :param params: dictionary of parameter: (mean, std), see sample_irf_params
+    :param quantiles: quantiles to compute
+    :param batch_size: number of parameter sets integrated at once
+    :param n_bins: number of histogram bins per value for the quantiles
+    :param n_workers: number of processes
+    :param seed: seed for the random number generator
+    :return: dataset with the Delta T variables along the new dimension statistic
+    ('mean', 'std' and e.g. '5th quantile')
+    """
+    samples = sample_irf_params(n_samples, params=params, seed=seed)
+    # slice dataset
+    ds_sl = ds.sel(time=slice(from_t, to_t))
+    da_erf = ds_sl[variables].to_array('variable').transpose(..., 'time')
+    forcing = da_erf.values
+    _, delta_t = get_years_and_delta_t(ds_sl)
+
+    # first batch sets the range of the histograms:
+    first = {key: val[:batch_size] for key, val in samples.items()}
+    _val = _integrate_samples(forcing, delta_t, first)
+    _notnull = np.any(~np.isnan(_val), axis=0)
+    # NaN only where all samples are NaN:
+    _min, _max = np.fmin.reduce(_val, axis=0), np.fmax.reduce(_val, axis=0)
+    _min, _max = np.where(_notnull, _min, 0.), np.where(_notnull, _max, 0.)
+    lo, hi = _min - (_max - _min) / 2, _max + (_max - _min) / 2
+    stats = _StreamingStats(forcing.shape, lo, hi, n_bins)
+    stats.add(_val)
+    del _val
+
+    rest = {key: val[batch_size:] for key, val in samples.items()}
+    n_rest = len(rest['l'])
+    if n_rest > 0 and n_workers > 1:
+        chunks = np.array_split(np.arange(n_rest), n_workers)
+        with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker,
+                                 initargs=(forcing, delta_t)) as executor:
+            futures = [executor.submit(_run_batches, {key: val[ind] for key, val in rest.items()},
+                                       lo, hi, n_bins, batch_size)
+                       for ind in chunks if len(ind) > 0]
+            for future in futures:
+                stats.merge(*future.result())
+    elif n_rest > 0:
+        stats.merge(*_run_batches(rest, lo, hi, n_bins, batch_size, forcing=forcing, delta_t=delta_t))
+
+    n_outside = int(stats.outside.sum())
+    if n_outside > 0:
+        warnings.warn('%s of %s samples outside of the histogram range (set from the first batch) are counted '
+                      'in the edge bins, the outer quantiles are biased. Increase batch_size.'
+                      % (n_outside, int(stats.count.sum())))
+
+    labels = ['mean', 'std'] + ['%sth quantile' % ('%g' % (q * 100)) for q in quantiles]
+    _stats = np.stack([stats.mean, stats.std()] + [stats.quantile(q) for q in quantiles])
+    _stats[0][stats.count == 0] = np.nan
+    da_stats = xr.DataArray(_stats, dims=('statistic',) + da_erf.dims,
+                            coords=dict(da_erf.coords, statistic=labels))
+    ds_out = xr.Dataset(attrs={'n_samples': n_samples, 'n_outside_histogram': n_outside})
+    for var in variables:
+        namevar = new_varname(var, name_deltaT)
+        ds_out[namevar] = da_stats.sel(variable=var, drop=True).transpose('statistic', *ds_sl[var].dims)
+        # Units Kelvin:
+        ds_out[namevar].attrs['unit'] = 'K'
+    return ds_out
@@ -0,0 +1,518 @@
+import functools
+import hashlib
+import multiprocessing
+import os
+
+import numpy as np
+import xarray as xr
+
+from ar6_ch6_rcmipfigs.utils.dataset_io import read_dataset, write_dataset
+from ar6_ch6_rcmipfigs.utils.misc_func import new_varname
+from ar6_ch6_rcmipfigs.utils.time_axis import decimal_years, time_step
+
+name_deltaT = 'Delta T'
+
+
+def IRF(t, l=0.885, alpha1=0.587 / 4.1, alpha2=0.413 / 249, tau1=4.1, tau2=249):
+    """
+    Returns the IRF function for:
+    :param t: Time in years
+    :param l: climate sensitivity factor
+    :param alpha1:
+    :param alpha2:
+    :param tau1:
+    :param tau2:
+    :return:
+    IRF
+    """
+    return l * (alpha1 * np.exp(-t / tau1) + alpha2 * np.exp(-t / tau2))
+
+
+def irf_kernel(years, delta_t, csfac=0.885, **params):
+    """
+    Builds the (time, time) kernel of the integral, i.e. the weight of the forcing at time j
+    in the temperature change at time i:
+    kernel[i, j] = IRF(years[i] - years[j]) * delta_t[j] for j <= i, else 0.
+
+    :param years: time of each time step in (decimal) years, see time_axis.decimal_years
+    :param delta_t: time step of each time step
+    :param csfac: climate sensitivity factor (for IRF)
+    :param params: other parameters of IRF (alpha1, alpha2, tau1, tau2), defaults as in IRF
+    :return: lower triangular kernel matrix
+    """
+    years = np.asarray(years, dtype=float)
+    delta_t = np.asarray(delta_t, dtype=float)
+    # time elapsed since the forcing at time j:
+    end_year_delta = years[:, np.newaxis] - years[np.newaxis, :]
+    kernel = IRF(np.maximum(end_year_delta, 0.), l=csfac, **params) * delta_t[np.newaxis, :]
+    # only forcing up until (and including) time i contributes:
+    return np.tril(kernel)
+
+
+def convolve_direct(forcing, kernel):
+    """
+    Integrates forcing with kernel along the last axis, batched over all other axes.
+    NaNs in the forcing are skipped in the sum (as xarray sum does) and the result is
+    masked where the forcing at the current time step is missing (in order to not get
+    an integral where there is no forcing data).
+
+    :param forcing: np.ndarray with time as last axis
+    :param kernel: (time, time) kernel, see irf_kernel
+    :return: np.ndarray of same shape as forcing
+    """
+    isnull = np.isnan(forcing)
+    _val = np.where(isnull, 0., forcing) @ kernel.T
+    _val[isnull] = np.nan
+    return _val
+
+
+def convolve_recursive(forcing, delta_t, l=0.885, alpha1=0.587 / 4.1, alpha2=0.413 / 249, tau1=4.1, tau2=249,
+                       state=None, return_state=False):
+    """
+    Integrates forcing with the IRF along the last axis by keeping a running state for each of
+    the two exponential boxes of the IRF:
+    box_k[i] = box_k[i-1] * exp(-delta_t[i-1] / tau_k) + forcing[i] * delta_t[i]
+    dT[i] = l * (alpha1 * box_1[i] + alpha2 * box_2[i])
+    The cost is linear in the number of time steps. The time elapsed between two time steps is
+    taken to be delta_t, so for annual data with delta_t = 1 this equals convolve_direct.
+    NaN handling is the same as in convolve_direct.
+    The IRF parameters may be arrays broadcastable against forcing.shape[:-1], e.g. one
+    parameter set per sample along a leading axis.
+    The integration can be continued from a previous call by passing its returned state.
+
+    :param forcing: np.ndarray with time as last axis
+    :param delta_t: time step of each time step
+    :param l: climate sensitivity factor
+    :param alpha1:
+    :param alpha2:
+    :param tau1:
+    :param tau2:
+    :param state: (box1, box2) content of the boxes carried over from the time step before
+    the first one, as returned with return_state
+    :param return_state: if True, also return the state after the last time step
+    :return: np.ndarray of forcing and parameters broadcast against each other
+    (and the state (box1, box2) if return_state)
+    """
+    delta_t = np.asarray(delta_t, dtype=float)
+    l, alpha1, alpha2, tau1, tau2 = [np.asarray(p, dtype=float) for p in [l, alpha1, alpha2, tau1, tau2]]
+    isnull = np.isnan(forcing)
+    to_integrate = np.where(isnull, 0., forcing) * delta_t
+    # decay of each box from one time step to the next:
+    decay1 = np.exp(-delta_t / tau1[..., np.newaxis])
+    decay2 = np.exp(-delta_t / tau2[..., np.newaxis])
+    shape = np.broadcast_shapes(forcing.shape, decay1.shape, decay2.shape,
+                                l.shape + (1,), alpha1.shape + (1,), alpha2.shape + (1,))
+    box1 = np.zeros(shape[:-1])
+    box2 = np.zeros(shape[:-1])
+    if state is not None:
+        box1 = box1 + state[0]
+        box2 = box2 + state[1]
+    _val = np.empty(shape)
+    for i in range(shape[-1]):
+        if i > 0:
+            box1 = box1 * decay1[..., i - 1]
+            box2 = box2 * decay2[..., i - 1]
+        box1 = box1 + to_integrate[..., i]
+        box2 = box2 + to_integrate[..., i]
+        _val[..., i] = l * (alpha1 * box1 + alpha2 * box2)
+    _val[np.broadcast_to(isnull, shape)] = np.nan
+    if return_state:
+        # boxes decayed to the next time step:
+        return _val, (box1 * decay1[..., -1], box2 * decay2[..., -1])
+    return _val
+
+
+@functools.lru_cache(maxsize=32)
+def _kernel_fft(n_fft, len_time, delta_t, csfac=0.885, sampled_kernel=None):
+    """
+    FFT of the IRF sampled at every time step (times delta_t), zero padded to n_fft.
+    Cached, so repeated integrations with the same length and parameters reuse it.
+
+    :param n_fft: length of the FFT
+    :param len_time: number of time steps
+    :param delta_t: (constant) time step
+    :param csfac: climate sensitivity factor (for IRF)
+    :param sampled_kernel: bytes of float64 array with sampled response function, replaces IRF if given
+    :return: rfft of kernel
+    """
+    if sampled_kernel is None:
+        kernel = IRF(np.arange(len_time) * delta_t, l=csfac)
+    else:
+        kernel = np.frombuffer(sampled_kernel, dtype=float)[:len_time]
+    return np.fft.rfft(kernel * delta_t, n_fft)
+
+
+def convolve_fft(forcing, delta_t, csfac=0.885, kernel=None):
+    """
+    Integrates forcing with the IRF (or a sampled kernel) along the last axis by FFT convolution,
+    batched over all other axes. Requires a constant time step, so that the response only depends
+    on the number of time steps since the forcing.
+    NaN handling is the same as in convolve_direct.
+
+    :param forcing: np.ndarray with time as last axis
+    :param delta_t: time step of each time step
+    :param csfac: climate sensitivity factor (for IRF)
+    :param kernel: sampled response function, kernel[k] is the response k time steps after
+    the forcing (zero after the end of the array). If given, used instead of IRF and csfac.
+    :return: np.ndarray of same shape as forcing
+    """
+    delta_t = np.asarray(delta_t, dtype=float)
+    # time steps from decimal years differ by rounding errors:
+    if not np.allclose(delta_t, delta_t[0], rtol=1e-9, atol=0):
+        raise ValueError("FFT convolution requires a constant delta_t, use method 'direct' or 'recursive'")
+    len_time = forcing.shape[-1]
+    # padding to avoid circular convolution:
+    n_fft = 1 << (2 * len_time - 1).bit_length()
+    if kernel is not None:
+        kernel = np.ascontiguousarray(kernel, dtype=float).tobytes()
+    kernel_fft = _kernel_fft(n_fft, len_time, float(np.mean(delta_t)), csfac=csfac, sampled_kernel=kernel)
+
+    isnull = np.isnan(forcing)
+    forcing_fft = np.fft.rfft(np.where(isnull, 0., forcing), n_fft, axis=-1)
+    _val = np.fft.irfft(forcing_fft * kernel_fft, n_fft, axis=-1)[..., :len_time]
+    _val[isnull] = np.nan
+    return _val
+
+
+def _convolve(forcing, years, delta_t, csfac=0.885, method='direct', kernel=None):
+    """
+    Integrates forcing (np.ndarray with time as last axis) to temperature change with the chosen method.
+    """
+    if kernel is not None and method != 'fft':
+        raise ValueError('kernel is only supported with method fft')
+    if method == 'direct':
+        return convolve_direct(forcing, irf_kernel(years, delta_t, csfac=csfac))
+    elif method == 'recursive':
+        return convolve_recursive(forcing, delta_t, l=csfac)
+    elif method == 'fft':
+        return convolve_fft(forcing, delta_t, csfac=csfac, kernel=kernel)
+    raise ValueError('Unknown method %s' % method)
+
+
+# number of columns integrated at once with method direct, in the workers and without: fixed, since
+# the summation order of the matrix product depends on its shape, so that the result does not depend
+# on n_workers:
+_shard_size = 8
+
+# shared input and output arrays, set in each worker process by _init_worker:
+_shared = {}
+# a process forked after numba (irf_compiled) has run a parallel loop (with the tbb threading layer)
+# does not exit cleanly, so the workers are forked from a server process, where this module is
+# imported once, instead:
+if 'forkserver' in multiprocessing.get_all_start_methods():
+    _mp_context = multiprocessing.get_context('forkserver')
+    _mp_context.set_forkserver_preload([__name__])
+else:
+    _mp_context = multiprocessing.get_context()
+
+
+def _init_worker(raw_in, raw_out, shape):
+    _shared['in'] = np.frombuffer(raw_in).reshape(shape)
+    _shared['out'] = np.frombuffer(raw_out).reshape(shape)
+
+
+def _integrate_shard(start, stop, years, delta_t, csfac, method, kernel):
+    """
+    Integrates the columns start to stop of the shared forcing array (variable, column, time) and
+    writes them to the shared output array.
+    """
+    _shared['out'][:, start:stop] = _convolve(_shared['in'][:, start:stop], years, delta_t,
+                                              csfac=csfac, method=method, kernel=kernel)
+
+
+def _convolve_parallel(forcing, years, delta_t, csfac=0.885, method='direct', kernel=None, n_workers=2):
+    """
+    Integrates forcing (variable, ..., time) in n_workers processes, sharded by the columns
+    of the dimensions between variable and time (e.g. scenario and climatemodel).
+    The workers read from and write to shared memory, so only the column indices are sent to them.
+    """
+    shape = (forcing.shape[0], int(np.prod(forcing.shape[1:-1])), forcing.shape[-1])
+    raw_in = _mp_context.RawArray('d', int(np.prod(shape)))
+    raw_out = _mp_context.RawArray('d', int(np.prod(shape)))
+    np.frombuffer(raw_in).reshape(shape)[:] = forcing.reshape(shape)
+    shards = [(start, min(start + _shard_size, shape[1]), years, delta_t, csfac, method, kernel)
+              for start in range(0, shape[1], _shard_size)]
+    with _mp_context.Pool(n_workers, initializer=_init_worker, initargs=(raw_in, raw_out, shape)) as pool:
+        pool.starmap(_integrate_shard, shards)
+    return np.frombuffer(raw_out).reshape(forcing.shape).copy()
+
+
+def get_years_and_delta_t(ds_sl, calendar=None):
+    """
+    Time points of ds_sl in decimal years (see time_axis.decimal_years), from which the time elapsed
+    between two time points is taken, and the time step of the integration: the variable delta_t if
+    ds_sl has one, otherwise derived from the time axis (see time_axis.time_step).
+
+    :param ds_sl: dataset containing the forcings, sliced in time
+    :param calendar: calendar of the time axis, by default that of its cftime dates or standard
+    :return: years, delta_t as np.ndarray
+    """
+    times = ds_sl['time'].values
+    if calendar is None:
+        calendar = getattr(times[0], 'calendar', None) if len(times) else None
+        calendar = calendar or 'standard'
+    years = decimal_years(times, calendar=calendar)
+    if 'delta_t' in ds_sl:
+        return years, ds_sl['delta_t'].values
+    return years, time_step(times, calendar=calendar)
+
+
+def _integrate(ds_sl, variables, csfac=0.885, method='direct', kernel=None, n_workers=1):
+    """
+    Integrates the variables in ds_sl to temperature change with the chosen method.
+
+    :param ds_sl: dataset containing the forcings, sliced in time
+    :param variables: variables to integrate
+    :param csfac: climate sensitivity factor
+    :param method: see integrate_to_dT
+    :param kernel: see integrate_to_dT
+    :param n_workers: see integrate_to_dT
+    :return: xr.DataArray with dimension variable (named by forcing variable) and time last
+    """
+    # all variables in one array with time as the last dimension:
+    da_erf = ds_sl[variables].to_array('variable').transpose(..., 'time')
+    years, delta_t = get_years_and_delta_t(ds_sl)
+    if n_workers > 1:
+        _val = _convolve_parallel(da_erf.values.astype(float), years, delta_t, csfac=csfac, method=method,
+                                  kernel=kernel, n_workers=n_workers)
+    elif method == 'direct':
+        # in the same shards as _convolve_parallel:
+        forcing = da_erf.values.astype(float)
+        shape = (forcing.shape[0], int(np.prod(forcing.shape[1:-1])), forcing.shape[-1])
+        _in = forcing.reshape(shape)
+        _val = np.empty(shape)
+        for start in range(0, shape[1], _shard_size):
+            _val[:, start:start + _shard_size] = _convolve(_in[:, start:start + _shard_size], years, delta_t,
+                                                           csfac=csfac, method=method)
+        _val = _val.reshape(forcing.shape)
+    else:
+        _val = _convolve(da_erf.values, years, delta_t, csfac=csfac, method=method, kernel=kernel)
+    return xr.DataArray(_val, dims=da_erf.dims, coords=da_erf.coords)
+
+
+def _add_dT_variables(ds_DT, da_dT, variables):
+    """
+    Adds the Delta T variables (named from the forcing variables) from da_dT to ds_DT.
+
+    :param ds_DT: the output dataset, containing the forcing variables
+    :param da_dT: xr.DataArray with dimension variable (named by forcing variable)
+    :param variables: forcing variables
+    """
+    for var in variables:
+        namevar = new_varname(var, name_deltaT)
+        _da = da_dT.sel(variable=var, drop=True)
+        ds_DT[namevar] = _da.transpose(*[d for d in _da.dims if d not in ds_DT[var].dims], *ds_DT[var].dims)
+        # Units Kelvin:
+        ds_DT[namevar].attrs['unit'] = 'K'
+
+
+def integrate_to_dT(ds, from_t, to_t, variables, csfac=0.885, method='direct', kernel=None, n_workers=1,
+                    path_dT=None, float32=False):
+    """
+    Integrate forcing to temperature change.
+
+    :param ds: dataset containing the focings
+    :param from_t: start time
+    :param to_t: end time
+    :param variables: variables to integrate
+    :param csfac: climate sensitivity factor
+    :param method: 'direct' sums over the whole history for each time step, 'recursive' updates
+    the two exponential boxes of the IRF for each time step (linear in length of time axis),
+    'fft' convolves by FFT (requires constant delta_t)
+    :param kernel: sampled response function for method 'fft', kernel[k] is the response k time
+    steps after the forcing. If given, used instead of IRF and csfac.
+    :param n_workers: number of processes, the (scenario, climatemodel) columns are split between them.
+    Only worth it for large datasets on several cores: starting the processes and copying the data to
+    shared memory costs more than it saves otherwise (on one core, integrating the synthetic dataset with
+    10 models takes 0.03 s with 1 and 0.07 s with 2 workers, plus 0.7 s once to start the server process
+    the workers are forked from). The result does not depend on n_workers.
+    :param path_dT: if given, the output dataset is saved there (see dataset_io.write_dataset)
+    :param float32: save the output as float32
+    :return:
+    """
+    # slice dataset
+    ds_sl = ds.sel(time=slice(from_t, to_t))
+    # lets create a result DS
+    ds_DT = ds_sl.copy()
+
+    da_dT = _integrate(ds_sl, variables, csfac=csfac, method=method, kernel=kernel, n_workers=n_workers)
+    _add_dT_variables(ds_DT, da_dT, variables)
+
+    if path_dT is not None:
+        write_dataset(ds_DT, path_dT, float32=float32)
+    return ds_DT
+
+
+def integrate_to_dT_sensitivity(ds, from_t, to_t, variables, csfacs, dim='ECS', method='direct', kernel=None,
+                                n_workers=1):
+    """
+    Integrate forcing to temperature change for several climate sensitivity factors.
+    Since the IRF is linear in the climate sensitivity factor, the forcing is integrated only once
+    with csfac=1 and then scaled by each csfac, so adding more values only costs a multiplication.
+
+    :param ds: dataset containing the focings
+    :param from_t: start time
+    :param to_t: end time
+    :param variables: variables to integrate
+    :param csfacs: climate sensitivity factors, either list or dictionary of label: csfac
+    (e.g. {'ECS = 2K': 0.526})
+    :param dim: name of the new dimension
+    :param method: see integrate_to_dT
+    :param kernel: see integrate_to_dT, scaled by each csfac.
+    :param n_workers: see integrate_to_dT
+    :return: dataset with the Delta T variables along the new dimension dim with coordinate csfac
+    """
+    if isinstance(csfacs, dict):
+        labels, csfacs = list(csfacs.keys()), list(csfacs.values())
+    else:
+        labels = list(csfacs)
+    csfacs = np.asarray(csfacs, dtype=float)
+    coords = {dim: labels}
+    if dim != 'csfac':
+        coords['csfac'] = (dim, csfacs)
+    da_csfacs = xr.DataArray(csfacs, dims=dim, coords=coords)
+    # slice dataset
+    ds_sl = ds.sel(time=slice(from_t, to_t))
+    # lets create a result DS
+    ds_DT = ds_sl.copy()
+
+    da_dT = _integrate(ds_sl, variables, csfac=1., method=method, kernel=kernel, n_workers=n_workers)
+    _add_dT_variables(ds_DT, (da_dT * da_csfacs).transpose(dim, ...), variables)
+    return ds_DT
+
+
+def integrate_to_dT_chunked(path_forcing, path_dT, from_t, to_t, variables, csfac=0.885, method='recursive',
+                            kernel=None, chunks=None, float32=False):
+    """
+    Integrate forcing to temperature change out of core with dask. The forcing dataset is opened
+    chunked along the dimensions other than time (e.g. scenario, climatemodel and ensemble member),
+    each chunk is integrated separately and the result is written to path_dT chunk by chunk, so the
+    memory use is bounded by the chunk size and not by the size of the dataset. Requires dask.
+    Nothing is returned, so no handle on path_dT is kept open (which would prevent writing it again):
+    open the output with dataset_io.read_dataset, and close it before path_dT is written again.
+
+    :param path_forcing: path of the dataset containing the forcings
+    :param path_dT: path of the output dataset
+    :param from_t: start time
+    :param to_t: end time
+    :param variables: variables to integrate
+    :param csfac: climate sensitivity factor
+    :param method: see integrate_to_dT
+    :param kernel: see integrate_to_dT
+    :param chunks: dictionary of dimension: chunk size, by default 1 along all dimensions except time
+    (the time dimension is never chunked)
+    :param float32: save the output as float32
+    """
+    if chunks is None:
+        with xr.open_dataset(path_forcing) as ds:
+            chunks = {dim: 1 for dim in ds.dims if dim != 'time'}
+    chunks = dict(chunks, time=-1)
+    with xr.open_dataset(path_forcing, chunks=chunks) as ds:
+        # slice dataset
+        ds_sl = ds.sel(time=slice(from_t, to_t))
+        # lets create a result DS
+        ds_DT = ds_sl.copy()
+        years, delta_t = get_years_and_delta_t(ds_sl)
+        kwargs = dict(years=years, delta_t=delta_t, csfac=csfac, method=method, kernel=kernel)
+        for var in variables:
+            namevar = new_varname(var, name_deltaT)
+            _da = xr.apply_ufunc(_convolve, ds_sl[var], kwargs=kwargs, input_core_dims=[['time']],
+                                 output_core_dims=[['time']], dask='parallelized', output_dtypes=[float])
+            ds_DT[namevar] = _da.transpose(*ds_sl[var].dims)
+            # Units Kelvin:
+            ds_DT[namevar].attrs['unit'] = 'K'
+        # computes and writes one chunk at the time:
+        write_dataset(ds_DT, path_dT, float32=float32)
+
+
+def _state_path(path_dT):
+    """
+    Path of the integrator state saved next to the Delta T dataset at path_dT.
+    """
+    return os.path.splitext(str(path_dT).rstrip('/'))[0] + '_state.nc'
+
+
+def _column_hashes(forcing):
+    """
+    Content hash of each column (time series) of forcing (np.ndarray with time as last axis).
+    """
+    _flat = np.ascontiguousarray(forcing, dtype=float).reshape(-1, forcing.shape[-1])
+    hashes = [hashlib.sha1(col.tobytes()).hexdigest() for col in _flat]
+    return np.array(hashes, dtype=object).reshape(forcing.shape[:-1])
+
+
+def integrate_to_dT_incremental(ds, from_t, to_t, variables, path_dT, csfac=0.885, float32=False):
+    """
+    Integrate forcing to temperature change (method 'recursive') and save the result to path_dT
+    together with the state of the integrator: the content of the two exponential boxes of the IRF
+    after the last time step and a content hash of the forcing of each (variable, scenario,
+    climatemodel) column.
+    If a previous result and state exist at path_dT, only what changed is integrated: years appended
+    after the previous last year are integrated on from the saved state, and columns whose forcing
+    changed (or which are new) are integrated from the start.
+
+    :param ds: dataset containing the focings
+    :param from_t: start time
+    :param to_t: end time
+    :param variables: variables to integrate
+    :param path_dT: path of the Delta T dataset, the state is saved next to it (<name>_state.nc)
+    :param csfac: climate sensitivity factor
+    :param float32: save the output as float32 (the saved state is kept in float64)
+    :return: dataset as from integrate_to_dT
+    """
+    # slice dataset
+    ds_sl = ds.sel(time=slice(from_t, to_t))
+    # lets create a result DS
+    ds_DT = ds_sl.copy()
+    da_erf = ds_sl[variables].to_array('variable').transpose(..., 'time')
+    dims = da_erf.dims[:-1]
+    forcing = da_erf.values
+    _, delta_t = get_years_and_delta_t(ds_sl)
+    len_time = forcing.shape[-1]
+
+    # check if previous result can be continued:
+    n_old = 0
+    path_state = _state_path(path_dT)
+    if os.path.exists(path_dT) and os.path.isfile(path_state):
+        with xr.open_dataset(path_state) as _state:
+            state = _state.load()
+        with read_dataset(path_dT) as _ds:
+            ds_DT_old = _ds.load()
+        old_time = ds_DT_old['time'].values
+        if state.attrs['csfac'] == csfac and len(old_time) <= len_time and \
+                np.array_equal(old_time, ds_sl['time'].values[:len(old_time)]):
+            n_old = len(old_time)
+
+    if n_old == 0:
+        recompute = np.ones(forcing.shape[:-1], dtype=bool)
+        _val, (box1, box2) = convolve_recursive(forcing, delta_t, l=csfac, return_state=True)
+    else:
+        # previous results and state aligned to the current columns (new columns are missing):
+        old_vars = [var for var in variables if new_varname(var, name_deltaT) in ds_DT_old]
+        da_old = ds_DT_old[[new_varname(var, name_deltaT) for var in old_vars]].to_array('variable')
+        da_old = da_old.assign_coords(variable=old_vars).transpose(*da_erf.dims)
+        da_old = da_old.reindex({dim: da_erf[dim] for dim in dims})
+        state = state.reindex({dim: da_erf[dim] for dim in dims}).transpose(*dims)
+        recompute = state['hash'].values != _column_hashes(forcing[..., :n_old])
+
+        _val = np.empty(forcing.shape)
+        _val[..., :n_old] = da_old.values
+        box1 = np.where(recompute, 0., state['box1'].values)
+        box2 = np.where(recompute, 0., state['box2'].values)
+        # continue from the saved state:
+        if n_old < len_time:
+            _val[..., n_old:], (box1, box2) = convolve_recursive(
+                forcing[..., n_old:], delta_t[n_old:], l=csfac, state=(box1, box2), return_state=True)
+        # integrate changed columns from the start:
+        if recompute.any():
+            _val[recompute], (box1[recompute], box2[recompute]) = convolve_recursive(
+                forcing[recompute], delta_t, l=csfac, return_state=True)
+    print('Integrated %s new time steps, %s of %s columns from the start'
+          % (len_time - n_old, recompute.sum(), recompute.size))
+
+    _add_dT_variables(ds_DT, xr.DataArray(_val, dims=da_erf.dims, coords=da_erf.coords), variables)
+    state = xr.Dataset({'box1': (dims, box1), 'box2': (dims, box2), 'hash': (dims, _column_hashes(forcing))},
+                       coords={dim: da_erf[dim].values for dim in dims}, attrs={'csfac': csfac})
+    write_dataset(ds_DT, path_dT, float32=float32)
+    state.to_netcdf(path_state)
+    return ds_DT
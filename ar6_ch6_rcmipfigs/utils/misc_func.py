@@ -1,12 +1,19 @@
+import glob
+import hashlib
 import logging
 import os
 
 import pandas as pd
 from scmdata import ScmDataFrame
 
+from ar6_ch6_rcmipfigs.constants import OUTPUT_DATA_DIR
+
 climatemodel = 'climatemodel'
 logger = logging.getLogger()
 
+# parsed protocol tables, see read_cached_table:
+PROTOCOL_CACHE_DIR = os.path.join(OUTPUT_DATA_DIR, 'cache', 'protocol')
+
 
 def aggregate_variable(db_in, v_to_agg, cmodel, remove_quantiles=True):
     """
@@ -64,6 +71,84 @@ def aggregate_variable(db_in, v_to_agg, cmodel, remove_quantiles=True):
     return db_out
 
 
+def _aggregation_layers(parents):
+    """
+    Splits parents into layers so that a parent comes after the parents below it in the hierarchy
+    (whose aggregates are then among its children).
+    """
+    layer = {}
+    for parent in sorted(parents, key=lambda p: -p.count('|')):
+        below = [layer[p] for p in layer if p.startswith(parent + '|')]
+        layer[parent] = max(below) + 1 if below else 0
+    return [[p for p in parents if layer[p] == i] for i in range(max(layer.values()) + 1)] if layer else []
+
+
+def aggregate_variables(db_in, parents, remove_quantiles=True):
+    """
+    Aggregates the direct subcategories (parent|*) of each variable in parents for all climate models
+    and scenarios in one groupby, as aggregate_variable does for one variable and one model. The children
+    of each parent are found once from the unique variables, and (climatemodel, parent) pairs where
+    the parent is already reported are left unchanged. Parents below other parents in the hierarchy
+    are aggregated first.
+
+    :type db_in: ScmDataFrame
+    :param db_in: data to aggregate
+    :param parents: variables to aggregate, e.g. ['Effective Radiative Forcing|Anthropogenic|Aerosols']
+    :param remove_quantiles: True (quantiles are not aggregated)
+    :return: ScmDataFrame with the aggregates appended, pd.DataFrame report with one row per climatemodel
+    and parent: status ('aggregated', 'already reported' or 'no subcategories'), the subcategories summed
+    and the number of timeseries added
+    """
+    if not remove_quantiles:
+        raise NotImplementedError("quantile handling wrong")
+    report = []
+    db_out = db_in
+    for layer in _aggregation_layers(list(parents)):
+        ts = db_out.timeseries()
+        meta = ts.index.to_frame(index=False)
+        # remove quantiles (so they are not aggregated
+        meta = meta[~meta['variable'].str.endswith('quantile')]
+        unique_variables = meta['variable'].unique()
+        # direct subcategories only, so e.g. HFC23|50th Percentile is not picked up by accident:
+        parent_of = {}
+        for parent in layer:
+            for var in unique_variables:
+                if var.startswith(parent + '|') and '|' not in var[len(parent) + 1:]:
+                    parent_of[var] = parent
+        reported = set(zip(meta.loc[meta['variable'].isin(layer), climatemodel],
+                           meta.loc[meta['variable'].isin(layer), 'variable']))
+        children = meta.assign(parent=meta['variable'].map(parent_of)).dropna(subset=['parent'])
+        is_reported = pd.Series([pair in reported for pair in zip(children[climatemodel], children['parent'])],
+                                index=children.index, dtype=bool)
+        to_sum = children[~is_reported]
+
+        if len(to_sum) > 0:
+            # Group by index except 'variable', and the parent; sum up values in each group:
+            group_idx = [name for name in ts.index.names if name != 'variable']
+            values = ts.iloc[to_sum.index]
+            values.index = pd.MultiIndex.from_frame(to_sum.drop(columns='variable'))
+            aggregated = values.groupby(group_idx + ['parent']).sum().reset_index().rename(
+                columns={'parent': 'variable'})
+            n_added = aggregated.groupby([climatemodel, 'variable']).size().to_dict()
+            db_out = db_out.append(aggregated)
+        else:
+            n_added = {}
+
+        subcategories = to_sum.groupby([climatemodel, 'parent'])['variable'].unique().to_dict()
+        for cm in meta[climatemodel].unique():
+            for parent in layer:
+                if (cm, parent) in reported:
+                    status = 'already reported'
+                elif (cm, parent) not in subcategories:
+                    status = 'no subcategories'
+                else:
+                    status = 'aggregated'
+                report.append((cm, parent, status, sorted(subcategories.get((cm, parent), [])),
+                               n_added.get((cm, parent), 0)))
+    report = pd.DataFrame(report, columns=[climatemodel, 'variable', 'status', 'subcategories', 'n_timeseries'])
+    return db_out, report
+
+
 def fix_BC_name(db_in,
                 from_v='Effective Radiative Forcing|Anthropogenic|Albedo Change|Other|Deposition of Black Carbon on Snow',
                 to_v='Effective Radiative Forcing|Anthropogenic|Other|BC on Snow',
@@ -85,25 +170,74 @@ def fix_BC_name(db_in,
     return db
 
 
-def get_protocol_vars(DATA_PROTOCOL, sheet_name="variable_definitions"):
+def file_sha1(path, blocksize=2 ** 20):
+    """
+    sha1 hex digest of the content of the file path.
+    """
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as fh:
+        for block in iter(lambda: fh.read(blocksize), b''):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+def read_cached_table(path, parse, name, cache_dir=PROTOCOL_CACHE_DIR):
+    """
+    Returns parse(path), cached in cache_dir as a pickle keyed by name and the content hash of path,
+    so the file is only parsed again when it changes. Cached tables of older versions of the file are removed.
+
+    :param path: path of the file
+    :param parse: function parsing path into a pd.DataFrame
+    :param name: name of the table (e.g. the sheet name), part of the cache key
+    :param cache_dir: folder of the cache, no caching if None
+    :return: pd.DataFrame
+    """
+    if cache_dir is None:
+        return parse(path)
+    leader = '{}_{}_'.format(os.path.basename(path), name)
+    cache_file = os.path.join(cache_dir, leader + file_sha1(path) + '.pkl')
+    if os.path.isfile(cache_file):
+        return pd.read_pickle(cache_file)
+    table = parse(path)
+    make_folders(cache_file)
+    for old_file in glob.glob(os.path.join(cache_dir, glob.escape(leader) + '*.pkl')):
+        os.remove(old_file)
+    table.to_pickle(cache_file)
+    logger.debug('cached {} of {} in {}'.format(name, path, cache_file))
+    return table
+
+
+def _read_protocol_sheet(DATA_PROTOCOL, sheet_name, **kwargs):
+    protocol_table = pd.read_excel(DATA_PROTOCOL, sheet_name=sheet_name, **kwargs)
+    protocol_table.columns = protocol_table.columns.str.lower()
+    return protocol_table
+
+
+def get_protocol_vars(DATA_PROTOCOL, sheet_name="variable_definitions", cache_dir=PROTOCOL_CACHE_DIR):
     """
     Based on Zebedee Nicholls  (zebedee.nicholls@climate-energy-college.org) code https://gitlab.com/rcmip/rcmip
+    The parsed sheet is cached until DATA_PROTOCOL changes (see read_cached_table).
     """
-    protocol_variables = pd.read_excel(DATA_PROTOCOL, sheet_name=sheet_name)
-    protocol_variables.columns = protocol_variables.columns.str.lower()
-    protocol_variables.head()
-    return protocol_variables
+    return read_cached_table(DATA_PROTOCOL, lambda path: _read_protocol_sheet(path, sheet_name), sheet_name,
+                             cache_dir=cache_dir)
 
 
-def get_protocol_scenarios(DATA_PROTOCOL, sheet_name='scenario_info'):
+def get_protocol_scenarios(DATA_PROTOCOL, sheet_name='scenario_info', cache_dir=PROTOCOL_CACHE_DIR):
     """
     Based on Zebedee Nicholls  (zebedee.nicholls@climate-energy-college.org) code https://gitlab.com/rcmip/rcmip
+    The parsed sheet is cached until DATA_PROTOCOL changes (see read_cached_table).
     """
-    protocol_scenarios = pd.read_excel(
-        DATA_PROTOCOL, sheet_name=sheet_name, skip_rows=2
-    )
-    protocol_scenarios.columns = protocol_scenarios.columns.str.lower()
-    return protocol_scenarios
+    return read_cached_table(DATA_PROTOCOL, lambda path: _read_protocol_sheet(path, sheet_name, skip_rows=2),
+                             sheet_name, cache_dir=cache_dir)
+
+
+def get_protocol_emissions(SCENARIO_PROTOCOL, cache_dir=PROTOCOL_CACHE_DIR):
+    """
+    Emissions protocol (e.g. rcmip-emissions-annual-means.csv) as ScmDataFrame. The parsed timeseries
+    are cached until SCENARIO_PROTOCOL changes (see read_cached_table).
+    """
+    return ScmDataFrame(read_cached_table(SCENARIO_PROTOCOL, lambda path: ScmDataFrame(path).timeseries(),
+                                          'timeseries', cache_dir=cache_dir))
 
 
 def prep_str_for_filename(ins):
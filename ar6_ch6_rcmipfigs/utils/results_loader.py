@@ -0,0 +1,135 @@
+"""
+Parallel loading of the RCMIP result submissions (CSV files and the your_data sheet of XLSX files).
+The files are read in a pool of workers and filtered while they are parsed, so only the timeseries
+of interest are passed on and combined.
+"""
+import logging
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import numpy as np
+import pandas as pd
+from scmdata.filters import pattern_match
+
+logger = logging.getLogger()
+
+
+def _year_or_label(col):
+    """
+    Year columns as int (CSV headers are read as str, XLSX headers as numbers), other columns in lower case.
+    """
+    try:
+        return int(float(col))
+    except (ValueError, TypeError):
+        return str(col).lower()
+
+
+def filter_rows(df, filters):
+    """
+    Keeps the rows of df matching filters (dictionary of column: value(s)), as ScmDataFrame.filter.
+    """
+    if not filters:
+        return df
+    keep = np.ones(len(df), dtype=bool)
+    for col, values in filters.items():
+        keep &= pattern_match(df[col], values)
+    return df[keep]
+
+
+def read_results_file(path, filters=None, chunksize=10000):
+    """
+    Reads one result file (CSV, or the your_data sheet of an XLSX file) in wide format, keeping only
+    the timeseries matching filters. CSV files are read and filtered chunksize rows at the time.
+
+    :param path: path of the file
+    :param filters: dictionary of column: value(s) (e.g. {'variable': [...], 'scenario': [...]}),
+    matched as in ScmDataFrame.filter
+    :param chunksize: number of rows of CSV files parsed at once
+    :return: pd.DataFrame with lower case metadata columns and int year columns
+    """
+    if path.endswith(".csv"):
+        chunks = pd.read_csv(path, chunksize=chunksize)
+    else:
+        chunks = [pd.read_excel(path, sheet_name="your_data")]
+    filtered = []
+    for chunk in chunks:
+        chunk.columns = [_year_or_label(col) for col in chunk.columns]
+        filtered.append(filter_rows(chunk, filters))
+    return pd.concat(filtered, ignore_index=True)
+
+
+def iter_results_files(paths, filters=None, n_workers=4, use_processes=True):
+    """
+    Reads the files in paths in a pool of n_workers workers (see read_results_file) and yields them
+    as they are read. At most 2 * n_workers files are read ahead of the consumer.
+
+    :param paths: paths of the files
+    :param filters: see read_results_file
+    :param n_workers: number of workers
+    :param use_processes: use processes (parsing XLSX files holds the GIL), otherwise threads
+    :return: generator of (path, pd.DataFrame)
+    """
+    executor_class = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+    paths = [str(path) for path in paths]
+    with executor_class(max_workers=n_workers) as executor:
+        running = {}
+        for path in paths:
+            running[executor.submit(read_results_file, path, filters)] = path
+            if len(running) < 2 * n_workers:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield running.pop(future), future.result()
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield running.pop(future), future.result()
+
+
+def read_climatemodels(path):
+    """
+    Climate models in the result file path, read from the climatemodel column only.
+    """
+    usecols = lambda col: str(col).lower() == "climatemodel"
+    if str(path).endswith(".csv"):
+        df = pd.read_csv(path, usecols=usecols)
+    else:
+        df = pd.read_excel(path, sheet_name="your_data", usecols=usecols)
+    return sorted(df.iloc[:, 0].dropna().unique().tolist()) if df.shape[1] else []
+
+
+def load_results(paths, filters=None, n_workers=4, use_processes=True, source_col=None):
+    """
+    Reads and filters the result files in parallel (see iter_results_files) and combines them into
+    one table. Timeseries found in more than one file are averaged, as in scmdata.df_append.
+
+    :param paths: paths of the files
+    :param filters: see read_results_file
+    :param n_workers: number of workers
+    :param use_processes: see iter_results_files
+    :param source_col: if given, name of a metadata column added with the path of the file each
+    timeseries was read from (paths joined by ";" for averaged duplicates)
+    :return: pd.DataFrame in wide format, to be read with ScmDataFrame
+    """
+    paths = list(paths)
+    if not paths:
+        raise ValueError("No result files to load")
+    read = []
+    for path, _df in iter_results_files(paths, filters=filters, n_workers=n_workers, use_processes=use_processes):
+        if source_col is not None:
+            _df[source_col] = path
+        read.append(_df)
+    df = pd.concat(read, ignore_index=True, sort=False)
+    meta_cols = [col for col in df.columns if isinstance(col, str) and col != source_col]
+    year_cols = sorted(col for col in df.columns if not isinstance(col, str))
+    df = df[meta_cols + year_cols + ([] if source_col is None else [source_col])]
+    if df.duplicated(meta_cols).any():
+        logger.warning("Duplicate timeseries found, taking the average")
+        # groupby drops missing keys:
+        na_fill_value = -999
+        df[meta_cols] = df[meta_cols].fillna(na_fill_value)
+        grouped = df.groupby(meta_cols, sort=False)
+        averaged = grouped[year_cols].mean()
+        if source_col is not None:
+            averaged[source_col] = grouped[source_col].agg(lambda x: ";".join(sorted(set(x))))
+        df = averaged.reset_index().replace({col: {na_fill_value: np.nan} for col in meta_cols})
+    return df
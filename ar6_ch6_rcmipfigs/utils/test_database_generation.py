@@ -0,0 +1,276 @@
+"""
+Checks of the database generation against the implementations it replaced (per variable, per file, CSV),
+run with pytest.
+"""
+import glob
+import os
+import re
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+from scmdata import ScmDataFrame, df_append
+
+from ar6_ch6_rcmipfigs.benchmarks.synthetic import synthetic_protocol_variables, synthetic_timeseries, \
+    synthetic_variables
+from ar6_ch6_rcmipfigs.utils.database_generation import build_file_index, convert_scmdf_to_pyamdf_year_only, \
+    get_file_index_filename, get_filename, hector_get_quantile, mce_get_quantile, plan_unit_conversions, \
+    prep_str_for_filename, read_database_parquet, read_file_index, reshape_probabilistic_output, \
+    save_into_database, select_files, unify_units, validate_against_protocol
+
+rtol = 1e-10
+atol = 1e-12
+
+
+def _unify_units_per_variable(in_df, protocol_variables):
+    """
+    unify_units as it was: one convert_unit call (over the whole frame) per variable.
+    """
+    out_df = in_df.copy()
+    for variable in out_df["variable"].unique():
+        target_unit = protocol_variables[protocol_variables["variable"] == variable]["unit"]
+        if target_unit.empty:
+            continue
+        target_unit = target_unit.iloc[0]
+        try:
+            if "CH4" in target_unit:
+                out_df = out_df.convert_unit(target_unit, variable=variable, context="CH4_conversions")
+                continue
+            out_df = out_df.convert_unit(target_unit, variable=variable)
+        except:
+            pass
+    out_df = out_df.timeseries().reset_index()
+    out_df["unit_context"] = out_df["unit_context"].fillna("not_required")
+    return ScmDataFrame(out_df)
+
+
+def _timeseries_and_protocol():
+    """
+    Synthetic forcing (in W/m^2 and mW/m^2) and methane emissions, and a protocol where one variable
+    has no unit and one is missing.
+    """
+    ts = synthetic_timeseries(n_models=2, n_scenarios=2, n_variables=4, n_years=20, seed=0)
+    emissions = ts[ts["variable"] == ts["variable"].iloc[0]].assign(variable="Emissions|CH4", unit="kt CH4/yr")
+    ts = pd.concat([ts, emissions], ignore_index=True)
+    protocol_variables = synthetic_protocol_variables(4)
+    variables = protocol_variables["variable"].tolist()
+    protocol_variables.loc[protocol_variables["variable"] == variables[-1], "unit"] = np.nan
+    protocol_variables = protocol_variables[protocol_variables["variable"] != variables[-2]]
+    protocol_variables = protocol_variables.append({"variable": "Emissions|CH4", "unit": "Mt CH4/yr"},
+                                                   ignore_index=True)
+    return ScmDataFrame(ts), protocol_variables, variables
+
+
+def test_plan_skips_missing_units():
+    _, protocol_variables, variables = _timeseries_and_protocol()
+    plan = plan_unit_conversions(variables + ["Emissions|CH4"], protocol_variables)
+    assert variables[-1] not in plan and variables[-2] not in plan
+    assert plan[variables[0]] == ("W/m^2", None)
+    assert plan["Emissions|CH4"] == ("Mt CH4/yr", "CH4_conversions")
+
+
+def test_unify_units_equals_per_variable():
+    df, protocol_variables, variables = _timeseries_and_protocol()
+    expected = _unify_units_per_variable(df, protocol_variables).timeseries()
+    result = unify_units(df, protocol_variables).timeseries()
+    # the converted rows are in the target unit, the others unchanged:
+    units = result.index.to_frame(index=False).set_index("variable")["unit"]
+    assert set(units[variables[2]]) == {"W/m^2"}
+    assert set(units[variables[-1]]) == {"W/m^2", "mW/m^2"}
+    assert set(units["Emissions|CH4"]) == {"Mt CH4/yr"}
+    result = result.reorder_levels(expected.index.names).reindex(expected.index)
+    np.testing.assert_allclose(result.values, expected.values, rtol=rtol, atol=atol)
+
+
+def _save(tmp_path, file_format, seed=0):
+    """
+    A small database saved in file_format under tmp_path/file_format, and the ScmDataFrame saved.
+    """
+    db = ScmDataFrame(synthetic_timeseries(n_models=2, n_scenarios=3, n_variables=3, n_years=20,
+                                           nan_fraction=0.3, seed=seed))
+    db_path = str(tmp_path / file_format)
+    os.makedirs(db_path)
+    save_into_database(db, db_path, "rcmip", file_format=file_format, n_workers=2)
+    return db, db_path
+
+
+def _assert_timeseries_equal(result, expected):
+    result, expected = result.timeseries(), expected.timeseries()
+    assert len(result) == len(expected)
+    result = result.reorder_levels(expected.index.names).reindex(expected.index)
+    pd.testing.assert_index_equal(result.columns, expected.columns)
+    np.testing.assert_allclose(result.values, expected.values, rtol=rtol, atol=atol)
+
+
+def test_parquet_equals_csv(tmp_path):
+    db, path_csv = _save(tmp_path, "csv")
+    _, path_parquet = _save(tmp_path, "parquet")
+    # one row group per scenario:
+    for path in glob.glob(os.path.join(path_parquet, "rcmip_synthetic*.parquet")):
+        assert pq.ParquetFile(path).num_row_groups == 3
+    _assert_timeseries_equal(ScmDataFrame(read_database_parquet(path_parquet, "rcmip")), db)
+
+    # filtered as the CSV files were read in 1_preprocess_data:
+    filters = dict(variable=synthetic_variables(3)[1:], scenario=db["scenario"].unique()[1:])
+    years = range(1855, 1865)
+    expected = df_append([ScmDataFrame(path).filter(year=years, **filters)
+                          for path in glob.glob(os.path.join(path_csv, "rcmip_synthetic*.csv"))])
+    result = ScmDataFrame(read_database_parquet(path_parquet, "rcmip", filters=filters, years=years))
+    _assert_timeseries_equal(result, expected)
+
+
+def _save_per_file(db, db_path, filename_leader):
+    """
+    save_into_database as it was: filtered and converted to an IamDataFrame file by file.
+    """
+    for cm in db["climatemodel"].unique():
+        db_cm = db.filter(climatemodel=cm)
+        for r in db_cm["region"].unique():
+            db_cm_r = db_cm.filter(region=r)
+            for v in db_cm_r["variable"].unique():
+                db_cm_r_v = ScmDataFrame(db_cm_r.filter(variable=v))
+                outfile = os.path.join(db_path, get_filename(db_cm_r_v, leader=filename_leader))
+                convert_scmdf_to_pyamdf_year_only(db_cm_r_v).to_csv(outfile)
+
+
+def test_save_into_database_equals_per_file(tmp_path):
+    db, db_path = _save(tmp_path, "csv")
+    path_expected = str(tmp_path / "expected")
+    os.makedirs(path_expected)
+    _save_per_file(db, path_expected, "rcmip")
+    files = sorted(os.listdir(path_expected))
+    assert sorted(set(os.listdir(db_path)) - {"rcmip_files.csv", "timestamp.txt"}) == files
+    for filename in files:
+        pd.testing.assert_frame_equal(pd.read_csv(os.path.join(db_path, filename)),
+                                      pd.read_csv(os.path.join(path_expected, filename)))
+
+
+def _in_protocol_per_row(df, protocol_variables, protocol_scenarios):
+    """
+    check_all_variables_and_units_as_in_protocol and check_all_scenarios_as_in_protocol as they were:
+    the (variable, unit) and scenario of every timeseries merged with the protocol.
+    """
+    checker_df = df.filter(variable="*Other*", keep=False)[["variable", "unit"]]
+    checker_df["unit"] = checker_df["unit"].apply(
+        lambda x: x.replace("dimensionless", "Dimensionless") if isinstance(x, str) else x)
+    checker_df["variable"] = checker_df["variable"].apply(
+        lambda v: "|".join(v.split("|")[:-1]) if any(v.endswith(suf) for suf in ["quantile", "mean", "stddev"])
+        else v)
+    variables_ok = len(checker_df.merge(protocol_variables[["variable", "unit"]])) == len(checker_df)
+    checker_df = df["scenario"].to_frame()
+    scenarios_ok = len(checker_df.merge(protocol_scenarios[["scenario"]])) == len(checker_df)
+    return variables_ok and scenarios_ok
+
+
+def _submissions():
+    """
+    Three climate models: the first with a quantile and an "Other" variable (all in the protocol),
+    the second with a variable and a scenario which are not and the third with a unit that cannot
+    be converted.
+    """
+    ts = synthetic_timeseries(n_models=3, n_scenarios=2, n_variables=3, n_years=10, seed=0)
+    variables = synthetic_variables(3)
+    cms = ts["climatemodel"].unique()
+    first = ts[(ts["climatemodel"] == cms[0]) & (ts["variable"] == variables[0])]
+    second = ts["climatemodel"] == cms[1]
+    ts.loc[second & (ts["variable"] == variables[1]), "variable"] = variables[1] + "|Unknown"
+    ts = pd.concat([
+        ts,
+        first.assign(variable=variables[0] + "|5th quantile"),
+        first.assign(variable=variables[0] + "|Other|Synthetic"),
+        ts[second & (ts["variable"] == variables[0]) & (ts["scenario"] == ts["scenario"].iloc[0])].assign(
+            scenario="ssp000"),
+    ], ignore_index=True)
+    ts.loc[(ts["climatemodel"] == cms[2]) & (ts["variable"] == variables[2]), "unit"] = "K"
+    protocol_scenarios = pd.DataFrame({"scenario": ts["scenario"].unique()[:2]})
+    return ScmDataFrame(ts), synthetic_protocol_variables(3), protocol_scenarios
+
+
+def test_validate_equals_per_row():
+    df, protocol_variables, protocol_scenarios = _submissions()
+    report_unconverted = validate_against_protocol(df, protocol_variables, protocol_scenarios, converted=False)
+    assert set(report_unconverted["kind"]) == {"variable", "scenario", "unit"}
+    passed = []
+    for climatemodel in df["climatemodel"].unique():
+        cdf = df.filter(climatemodel=climatemodel)
+        # checked after the conversion, as in 0_database-generation before:
+        expected = _in_protocol_per_row(_unify_units_per_variable(cdf, protocol_variables), protocol_variables,
+                                        protocol_scenarios)
+        report = validate_against_protocol(unify_units(cdf, protocol_variables), protocol_variables,
+                                           protocol_scenarios)
+        assert report.empty == expected
+        assert (report_unconverted["climatemodel"] != climatemodel).all() == expected
+        passed.append(expected)
+    assert passed == [True, False, False]
+
+
+def _reshape_per_family(db):
+    """
+    The reshaping of the probabilistic output as it was in 0_database-generation: one filter, apply
+    and append per model family.
+    """
+    mce_prob_data = db.filter(climatemodel="MCE*PROB*").timeseries().reset_index()
+    mce_prob_data["variable"] = (mce_prob_data["variable"] + "|"
+                                 + mce_prob_data["climatemodel"].apply(mce_get_quantile) + "th quantile")
+    mce_prob_data["climatemodel"] = mce_prob_data["climatemodel"].apply(lambda x: "-".join(x.split("-")[:-1]))
+    db = db.filter(climatemodel="MCE*PROB*", keep=False).append(mce_prob_data)
+
+    hector_prob_data = db.filter(climatemodel="hector*HISTCALIB*").timeseries().reset_index()
+    hector_prob_data["variable"] = (hector_prob_data["variable"] + "|"
+                                    + hector_prob_data["climatemodel"].apply(hector_get_quantile))
+    hector_prob_data["climatemodel"] = hector_prob_data["climatemodel"].apply(lambda x: x.split("-")[0])
+    db = db.filter(climatemodel="hector*HISTCALIB*", keep=False).append(hector_prob_data)
+
+    for family in ["*FaIR*", "*WASP*"]:
+        prob_data = db.filter(climatemodel=family).timeseries().reset_index()
+        prob_data["variable"] = prob_data["variable"].apply(lambda x: x.replace("|00th", "|0th").replace("|05th",
+                                                                                                          "|5th"))
+        db = db.filter(climatemodel=family, keep=False).append(ScmDataFrame(prob_data))
+    return db
+
+
+def test_reshape_equals_per_family():
+    climatemodels = (["MCE-v1-1-PROB-%s" % q for q in ["17th", "33rd", "50th", "67th", "83rd"]]
+                     + ["hector-HISTCALIB-%s" % q for q in ["q05", "q167", "q50", "Mean", "SD"]]
+                     + ["FaIR-1.5-DEFAULT", "WASP-v1", "OSCARv3.0"])
+    ts = synthetic_timeseries(n_models=len(climatemodels), n_scenarios=2, n_variables=2, n_years=10, seed=0)
+    ts["climatemodel"] = ts["climatemodel"].map(dict(zip(ts["climatemodel"].unique(), climatemodels)))
+    for climatemodel, quantile in [("FaIR-1.5-DEFAULT", "|05th quantile"), ("WASP-v1", "|00th quantile")]:
+        rows = ts["climatemodel"] == climatemodel
+        ts.loc[rows, "variable"] = ts.loc[rows, "variable"] + quantile
+    db = ScmDataFrame(ts)
+
+    expected = _reshape_per_family(db.copy())
+    result = reshape_probabilistic_output(db)
+    _assert_timeseries_equal(result, expected)
+    assert sorted(result["climatemodel"].unique()) == ["FaIR-1.5-DEFAULT", "MCE-v1-1-PROB", "OSCARv3.0",
+                                                       "WASP-v1", "hector"]
+    assert "Effective Radiative Forcing|Anthropogenic|CH4|16.7th quantile" in result["variable"].unique()
+
+
+def test_select_files_equals_file_names(tmp_path):
+    climatemodels = ["Cicero-SCM", "FaIR-1.5-DEFAULT", "FaIR-1.5-DEFAULT-v2", "OSCARv3.0", "hector"]
+    ts = synthetic_timeseries(n_models=len(climatemodels), n_scenarios=2, n_variables=3, n_years=10, seed=0)
+    ts["climatemodel"] = ts["climatemodel"].map(dict(zip(ts["climatemodel"].unique(), climatemodels)))
+    variables = synthetic_variables(3)
+    quantiles = ts[ts["variable"] == variables[0]].assign(variable=variables[0] + "|5th quantile")
+    db_path = str(tmp_path)
+    leader = "rcmip-phase-1"
+    save_into_database(ScmDataFrame(pd.concat([ts, quantiles], ignore_index=True)), db_path, leader)
+
+    # the index built from the files is the one written with them:
+    written = pd.read_csv(os.path.join(db_path, get_file_index_filename(leader)))
+    built = build_file_index(db_path, leader).sort_values("file").reset_index(drop=True)
+    pd.testing.assert_frame_equal(built, written)
+
+    # as the files were selected by name in 1_preprocess_data before:
+    model_of_interest = [".*rcmip-phase-1_cicero-scm.*", ".*fair-1.5-default.*", ".*oscarv3.0.*"]
+    expected = [path for path in glob.glob(os.path.join(db_path, leader + "_*.csv"))
+                if any(re.match(m, path) for m in model_of_interest)
+                and any(re.match(".*{}.*".format(prep_str_for_filename(v)), path) for v in variables[:2])
+                and "quantile" not in path]
+    result = select_files(read_file_index(db_path, leader), climatemodels=["Cicero-SCM*", "FaIR-1.5-DEFAULT*",
+                                                                           "OSCARv3.0*"],
+                          variables=variables[:2], ignore_case=True)
+    assert result == sorted(expected) and len(result) == 8
+    assert select_files(read_file_index(db_path, leader), climatemodels="fair-1.5-default") == []
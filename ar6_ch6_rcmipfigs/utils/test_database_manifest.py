@@ -0,0 +1,126 @@
+"""
+Checks of the incremental rebuild of the database (plan_rebuild, remove_outputs, update_manifest and
+rebuild_database), run with pytest.
+"""
+import os
+
+import pandas as pd
+from scmdata import ScmDataFrame
+
+from ar6_ch6_rcmipfigs.benchmarks.synthetic import synthetic_protocol_variables, synthetic_timeseries
+from ar6_ch6_rcmipfigs.utils.database_generation import get_file_index_filename, read_file_index, \
+    save_into_database
+from ar6_ch6_rcmipfigs.utils.database_manifest import empty_manifest, list_outputs, \
+    plan_rebuild, read_manifest, rebuild_database, remove_outputs, update_manifest
+
+leader = "rcmip"
+
+
+def _write_results(tmp_path, seed=0):
+    """
+    Result files: the first climate model in one file, the second split over two files by scenario.
+    """
+    ts = synthetic_timeseries(n_models=2, n_scenarios=2, n_variables=2, n_years=10, seed=seed)
+    first, second = ts["climatemodel"].unique()
+    scenarios = ts["scenario"].unique()
+    parts = {
+        "a.csv": ts[ts["climatemodel"] == first],
+        "b1.csv": ts[(ts["climatemodel"] == second) & (ts["scenario"] == scenarios[0])],
+        "b2.csv": ts[(ts["climatemodel"] == second) & (ts["scenario"] == scenarios[1])],
+    }
+    paths = {}
+    for filename, part in parts.items():
+        paths[filename] = str(tmp_path / filename)
+        part.to_csv(paths[filename], index=False)
+    return paths, first, second
+
+
+def _written(manifest, plan, climatemodels):
+    """
+    Manifest after a rebuild of climatemodels, without writing the database.
+    """
+    inputs = {cm: [path for path in plan["read"] if cm in plan["inputs"][path]["climatemodels"]]
+              for cm in climatemodels}
+    written = {cm: ["%s_%s.csv" % (leader, cm)] for cm in climatemodels}
+    return update_manifest(manifest, plan, inputs, written)
+
+
+def test_plan_rebuild(tmp_path):
+    paths, first, second = _write_results(tmp_path)
+    all_paths = sorted(paths.values())
+    plan = plan_rebuild(empty_manifest(), all_paths)
+    assert plan["read"] == all_paths and plan["changed"] == all_paths and plan["stale"] == []
+    manifest = _written(empty_manifest(), plan, [first, second])
+    assert manifest["climatemodels"][second] == {"inputs": [paths["b1.csv"], paths["b2.csv"]],
+                                                 "outputs": ["%s_%s.csv" % (leader, second)]}
+
+    # nothing changed:
+    plan = plan_rebuild(manifest, all_paths)
+    assert plan["read"] == [] and plan["stale"] == []
+
+    # a changed file is read with the other file of its climate model:
+    pd.read_csv(paths["b1.csv"]).assign(unit="W/m^2").to_csv(paths["b1.csv"], index=False)
+    plan = plan_rebuild(manifest, all_paths)
+    assert plan["changed"] == [paths["b1.csv"]]
+    assert plan["read"] == [paths["b1.csv"], paths["b2.csv"]] and plan["stale"] == [second]
+    manifest = _written(manifest, plan, [second])
+
+    # a removed file makes its climate model stale:
+    plan = plan_rebuild(manifest, [paths["b1.csv"], paths["b2.csv"]])
+    assert plan["removed"] == [paths["a.csv"]] and plan["read"] == [] and plan["stale"] == [first]
+    manifest = update_manifest(manifest, plan, {}, {})
+    assert sorted(manifest["climatemodels"]) == [second]
+    assert sorted(manifest["inputs"]) == [paths["b1.csv"], paths["b2.csv"]]
+
+
+def test_remove_outputs(tmp_path):
+    db = ScmDataFrame(synthetic_timeseries(n_models=2, n_scenarios=2, n_variables=2, n_years=10, seed=0))
+    first, second = db["climatemodel"].unique()
+    db_path = str(tmp_path)
+    written = save_into_database(db, db_path, leader, file_format="parquet", n_workers=2)
+    manifest = empty_manifest()
+    manifest["climatemodels"] = {cm: {"inputs": [], "outputs": outputs} for cm, outputs in written.items()}
+
+    assert remove_outputs(db_path, manifest, [first], leader) == written[first]
+    assert list_outputs(db_path, leader) == sorted(written[second])
+    index = pd.read_parquet(os.path.join(db_path, "%s_index.parquet" % leader))
+    assert set(index["file"]) == set(written[second])
+    assert set(os.path.basename(path) for path in read_file_index(db_path, leader).values()) \
+        == set(written[second])
+
+
+def _rebuild(db_path, manifest, plan, rebuild_all=False):
+    protocol_variables = synthetic_protocol_variables(2)
+    protocol_scenarios = pd.DataFrame({"scenario": ["historical", "ssp119"]})
+    return rebuild_database(db_path, manifest, plan, protocol_variables, protocol_scenarios, leader,
+                            rebuild_all=rebuild_all)
+
+
+def test_rebuild_database(tmp_path):
+    paths, first, second = _write_results(tmp_path)
+    db_path = str(tmp_path / "database")
+    os.makedirs(db_path)
+    manifest = _rebuild(db_path, empty_manifest(), plan_rebuild(empty_manifest(), sorted(paths.values())))
+    assert read_manifest(db_path)["climatemodels"] == manifest["climatemodels"]
+    outputs = list_outputs(db_path, leader)
+    assert sorted(output for entry in manifest["climatemodels"].values() for output in entry["outputs"]) \
+        == outputs
+
+    # without the submission of the first climate model, its outputs are removed:
+    manifest = _rebuild(db_path, manifest, plan_rebuild(manifest, [paths["b1.csv"], paths["b2.csv"]]))
+    assert list_outputs(db_path, leader) == manifest["climatemodels"][second]["outputs"]
+    assert set(pd.read_csv(os.path.join(db_path, get_file_index_filename(leader)))["climatemodel"]) == {second}
+
+
+def test_rebuild_all_removes_files_not_written(tmp_path):
+    paths, _, _ = _write_results(tmp_path)
+    db_path = str(tmp_path / "database")
+    os.makedirs(db_path)
+    # an output of a climate model not in the manifest (e.g. written before the manifest existed):
+    stale = "%s_old-model_world_effective-radiative-forcing.csv" % leader
+    pd.DataFrame({"Model": ["unspecified"]}).to_csv(os.path.join(db_path, stale), index=False)
+    plan = plan_rebuild(empty_manifest(), sorted(paths.values()))
+    manifest = _rebuild(db_path, empty_manifest(), plan, rebuild_all=True)
+    assert stale not in os.listdir(db_path)
+    assert list_outputs(db_path, leader) == sorted(
+        output for entry in manifest["climatemodels"].values() for output in entry["outputs"])
@@ -0,0 +1,77 @@
+"""
+Checks of the round trip of write_dataset and read_dataset (netCDF and Zarr, float32 and chunking), run with pytest.
+"""
+import numpy as np
+import pytest
+import xarray as xr
+
+from ar6_ch6_rcmipfigs.benchmarks.synthetic import synthetic_forcing_dataset, synthetic_variables
+from ar6_ch6_rcmipfigs.utils.dataset_io import get_encoding, read_dataset, write_dataset
+
+rtol = 1e-10
+atol = 1e-12
+paths = ['forcing.nc', 'forcing.zarr']
+
+
+def _dataset():
+    return synthetic_forcing_dataset(n_models=3, n_scenarios=4, n_variables=3, n_years=50, nan_fraction=0.2, seed=0)
+
+
+def _path(tmp_path, filename):
+    if filename.endswith('.zarr'):
+        pytest.importorskip('zarr')
+    return str(tmp_path / filename)
+
+
+@pytest.mark.parametrize('filename', paths)
+def test_round_trip(tmp_path, filename):
+    ds = _dataset()
+    path = _path(tmp_path, filename)
+    write_dataset(ds, path)
+    with read_dataset(path) as ds_read:
+        xr.testing.assert_identical(ds_read.load(), ds)
+
+
+@pytest.mark.parametrize('filename', paths)
+def test_float32(tmp_path, filename):
+    ds = _dataset()
+    path = _path(tmp_path, filename)
+    write_dataset(ds, path, float32=True)
+    with read_dataset(path) as ds_read:
+        for var in synthetic_variables(3):
+            assert ds_read[var].dtype == np.float32
+            np.testing.assert_array_equal(ds_read[var].values, ds[var].values.astype(np.float32))
+        # the time step is a data variable too:
+        np.testing.assert_allclose(ds_read['delta_t'].values, ds['delta_t'].values, rtol=rtol, atol=atol)
+
+
+@pytest.mark.parametrize('filename', paths)
+def test_chunks(tmp_path, filename):
+    pytest.importorskip('dask')
+    ds = _dataset()
+    path = _path(tmp_path, filename)
+    var = synthetic_variables(3)[0]
+    chunks = {'scenario': 1, 'time': 20}
+    # written from dask chunks which do not match the chunks of the file:
+    write_dataset(ds.chunk({'scenario': 3}), path, chunks=chunks)
+    with read_dataset(path, chunks=chunks if filename.endswith('.nc') else None) as ds_read:
+        assert ds_read[var].chunks == ((1,) * 4, (3,), (20, 20, 10))
+        if filename.endswith('.nc'):
+            assert ds_read[var].encoding['chunksizes'] == (1, 3, 20)
+        xr.testing.assert_identical(ds_read.load(), ds)
+    # an existing file is replaced:
+    write_dataset(ds.isel(scenario=[0]), path)
+    with read_dataset(path) as ds_read:
+        assert ds_read.dims['scenario'] == 1
+
+
+def test_encoding():
+    ds = _dataset()
+    var = synthetic_variables(3)[0]
+    encoding = get_encoding(ds, float32=True, chunks={'time': 100})
+    assert encoding[var]['chunksizes'] == (4, 3, 50) and encoding[var]['dtype'] == 'float32'
+    pytest.importorskip('zarr')
+    encoding = get_encoding(ds, zarr=True)
+    assert encoding[var]['chunks'] == (1, 3, 50)
+    # one of the compressor keys of zarr 2 and 3:
+    assert len({'compressor', 'compressors'} & set(encoding[var])) == 1
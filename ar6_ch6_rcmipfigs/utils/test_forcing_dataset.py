@@ -0,0 +1,77 @@
+"""
+Checks of build_forcing_dataset against the per variable pivot of 1_preprocess_data it replaced, run with pytest.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+from scmdata import ScmDataFrame
+
+from ar6_ch6_rcmipfigs.benchmarks.synthetic import synthetic_forcing_dataset, synthetic_timeseries, \
+    synthetic_variables
+from ar6_ch6_rcmipfigs.utils.forcing_dataset import build_forcing_dataset
+
+rtol = 1e-10
+atol = 1e-12
+
+
+def _pivot_per_variable(db, variables):
+    """
+    The dataset as built in 1_preprocess_data before: unstacked to xarray and merged one variable at the time.
+    """
+    ds = xr.Dataset()
+    for var in variables:
+        _da = db.filter(variable=var).timeseries().transpose().unstack().to_xarray().squeeze()
+        _ds = _da.to_dataset(name=var)
+        del _ds.coords['variable']
+        ds = xr.merge([_ds, ds])
+    return ds
+
+
+def _db(seed=0):
+    ts = synthetic_timeseries(n_models=3, n_scenarios=3, n_variables=3, n_years=15, nan_fraction=0.2, seed=seed)
+    ts['unit'] = 'W/m^2'
+    # a timeseries which is not reported, NaN in the dataset:
+    variables = synthetic_variables(3)
+    missing = (ts['variable'] == variables[1]) & (ts['climatemodel'] == ts['climatemodel'].iloc[0]) & (
+            ts['scenario'] == ts['scenario'].iloc[0])
+    return ScmDataFrame(ts[~missing]), variables
+
+
+def test_equals_per_variable():
+    db, variables = _db()
+    expected = _pivot_per_variable(db, variables)
+    ds = build_forcing_dataset(db, variables)
+    assert set(ds.data_vars) == set(variables)
+    for var in variables:
+        assert ds[var].dims == ('scenario', 'climatemodel', 'time')
+        _expected = expected[var].transpose(*ds[var].dims).reindex(scenario=ds['scenario'],
+                                                                   climatemodel=ds['climatemodel'])
+        np.testing.assert_array_equal(ds['time'].values, pd.to_datetime(_expected['time'].values))
+        np.testing.assert_allclose(ds[var].values, _expected.values, rtol=rtol, atol=atol)
+    assert np.isnan(ds[variables[1]][0, 0]).all()
+    # the metadata with one value are scalar coordinates, as after squeeze:
+    for coord in ['model', 'region', 'unit']:
+        assert ds[coord].item() == expected[coord].item()
+
+
+def test_ensemble_members():
+    kwargs = dict(n_models=2, n_scenarios=2, n_variables=2, n_years=10, n_members=3, seed=1)
+    ts = synthetic_timeseries(**kwargs)
+    # the climate models reporting in mW/m^2 differ in unit, which is not a dimension:
+    with pytest.raises(ValueError):
+        build_forcing_dataset(ScmDataFrame(ts), dims=('scenario', 'climatemodel', 'ensemble_member'))
+    in_mW = ts['unit'] == 'mW/m^2'
+    years = [col for col in ts.columns if not isinstance(col, str)]
+    ts.loc[in_mW, years] /= 1000
+    ts['unit'] = 'W/m^2'
+    db = ScmDataFrame(ts)
+    # the ensemble members are not unique in scenario and climatemodel:
+    with pytest.raises(ValueError):
+        build_forcing_dataset(db)
+    ds = build_forcing_dataset(db, dims=('scenario', 'climatemodel', 'ensemble_member'))
+    expected = synthetic_forcing_dataset(**kwargs)
+    for var in synthetic_variables(2):
+        _expected = expected[var].reindex(scenario=ds['scenario'], climatemodel=ds['climatemodel'],
+                                          ensemble_member=ds['ensemble_member'])
+        np.testing.assert_allclose(ds[var].values, _expected.values, rtol=rtol, atol=atol)
@@ -0,0 +1,45 @@
+"""
+Checks of convolve_irf (numba and NumPy) against the recursive integrator of irf_integration, run with pytest.
+"""
+import numpy as np
+import pytest
+
+from ar6_ch6_rcmipfigs.utils.irf_compiled import convolve_irf, numba
+from ar6_ch6_rcmipfigs.utils.irf_integration import convolve_recursive
+
+rtol = 1e-10
+atol = 1e-12
+params = dict(l=0.526, alpha1=0.5 / 3., alpha2=0.5 / 150, tau1=3., tau2=150)
+
+use_numba = [False] + ([True] if numba is not None else [])
+
+
+def _variable_time_axis(len_time, seed=0):
+    """
+    Decimal years with steps between a month and two years, and the time step of each of them.
+    """
+    rng = np.random.default_rng(seed)
+    delta_t = rng.uniform(1 / 12, 2, len_time)
+    years = 1850 + np.concatenate([[0.], np.cumsum(delta_t[:-1])])
+    return years, delta_t
+
+
+@pytest.mark.parametrize('_use_numba', use_numba)
+def test_variable_delta_t_equals_recursive(_use_numba):
+    years, delta_t = _variable_time_axis(120)
+    rng = np.random.default_rng(1)
+    forcing = np.cumsum(rng.normal(0, 0.1, (4, 3, 120)), axis=-1)
+    forcing[rng.random(forcing.shape) < 0.05] = np.nan
+    for _params in [None, params]:
+        np.testing.assert_allclose(convolve_irf(forcing, years, delta_t, params=_params, use_numba=_use_numba),
+                                   convolve_recursive(forcing, delta_t, **(_params or {})), rtol=rtol, atol=atol)
+
+
+@pytest.mark.parametrize('_use_numba', use_numba)
+def test_constant_delta_t_equals_recursive(_use_numba):
+    # e.g. monthly steps, the lag in years is the number of steps times delta_t:
+    years = 1850 + np.arange(240) / 12
+    delta_t = np.full(240, 1 / 12)
+    forcing = np.cumsum(np.random.default_rng(2).normal(0, 0.1, (5, 240)), axis=-1)
+    np.testing.assert_allclose(convolve_irf(forcing, years, delta_t, params=params, use_numba=_use_numba),
+                               convolve_recursive(forcing, delta_t, **params), rtol=rtol, atol=atol)
@@ -0,0 +1,56 @@
+"""
+Checks of the streaming statistics of integrate_to_dT_ensemble against the statistics of all samples, run
+with pytest.
+"""
+import numpy as np
+import pytest
+
+from ar6_ch6_rcmipfigs.benchmarks.synthetic import synthetic_forcing_dataset, synthetic_variables
+from ar6_ch6_rcmipfigs.utils.irf_ensemble import _integrate_samples, integrate_to_dT_ensemble, sample_irf_params
+from ar6_ch6_rcmipfigs.utils.irf_integration import get_years_and_delta_t, name_deltaT
+from ar6_ch6_rcmipfigs.utils.misc_func import new_varname
+
+quantiles = (0.05, 0.5, 0.95)
+
+
+def _all_samples(ds, variables, n_samples, seed):
+    """
+    Delta T of every sample, (sample, variable, scenario, climatemodel, time).
+    """
+    forcing = ds[variables].to_array('variable').transpose(..., 'time').values
+    _, delta_t = get_years_and_delta_t(ds)
+    return _integrate_samples(forcing, delta_t, sample_irf_params(n_samples, seed=seed))
+
+
+@pytest.mark.parametrize('n_workers', [1, 2])
+def test_streaming_statistics(n_workers):
+    ds = synthetic_forcing_dataset(n_models=2, n_scenarios=2, n_variables=2, n_years=40, nan_fraction=0.3, seed=0)
+    variables = synthetic_variables(2)
+    n_samples, n_bins = 400, 1000
+    # the first batch holds all samples, so no sample is outside of the range of the histograms:
+    ds_stats = integrate_to_dT_ensemble(ds, '1850', '1889', variables, n_samples=n_samples, quantiles=quantiles,
+                                        batch_size=n_samples, n_bins=n_bins, n_workers=n_workers, seed=1)
+    assert ds_stats.attrs['n_outside_histogram'] == 0
+    _val = _all_samples(ds, variables, n_samples, seed=1)
+    # one histogram bin (range widened by half on each side):
+    width = 2 * (np.nanmax(_val, axis=0) - np.nanmin(_val, axis=0)) / n_bins
+    for i, var in enumerate(variables):
+        da = ds_stats[new_varname(var, name_deltaT)].transpose('statistic', 'scenario', 'climatemodel', 'time')
+        np.testing.assert_allclose(da.sel(statistic='mean'), np.nanmean(_val[:, i], axis=0), rtol=1e-10)
+        np.testing.assert_allclose(da.sel(statistic='std'), np.nanstd(_val[:, i], axis=0, ddof=1), rtol=1e-8)
+        for q in quantiles:
+            # within one bin of the samples next to the quantile (the definitions of the quantile of a
+            # sample differ by up to one sample):
+            below = np.nanquantile(_val[:, i], q - 1 / n_samples, axis=0) - width[i]
+            above = np.nanquantile(_val[:, i], q + 1 / n_samples, axis=0) + width[i]
+            streaming = da.sel(statistic='%gth quantile' % (q * 100)).values
+            assert np.all(np.isnan(below) | ((below <= streaming) & (streaming <= above)))
+
+
+def test_samples_outside_histogram():
+    ds = synthetic_forcing_dataset(n_models=1, n_scenarios=1, n_variables=1, n_years=20, nan_fraction=0, seed=0)
+    variables = synthetic_variables(1)
+    # the range of the histograms is set from the first two samples only:
+    with pytest.warns(UserWarning, match='outside of the histogram range'):
+        ds_stats = integrate_to_dT_ensemble(ds, '1850', '1869', variables, n_samples=200, batch_size=2, seed=0)
+    assert ds_stats.attrs['n_outside_histogram'] > 0
@@ -0,0 +1,167 @@
+"""
+Checks of the integration methods of irf_integration against each other, run with pytest.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from ar6_ch6_rcmipfigs.benchmarks.synthetic import synthetic_forcing_dataset, synthetic_variables
+from ar6_ch6_rcmipfigs.utils.dataset_io import read_dataset
+from ar6_ch6_rcmipfigs.utils.irf_integration import convolve_direct, convolve_recursive, integrate_to_dT, \
+    integrate_to_dT_chunked, integrate_to_dT_incremental, irf_kernel, name_deltaT
+from ar6_ch6_rcmipfigs.utils.misc_func import new_varname
+
+rtol = 1e-10
+atol = 1e-12
+
+
+def _forcing(shape, seed=0):
+    rng = np.random.default_rng(seed)
+    return np.cumsum(rng.normal(0, 0.1, shape), axis=-1)
+
+
+def test_recursive_equals_direct():
+    ds = synthetic_forcing_dataset(n_models=3, n_scenarios=2, n_variables=4, n_years=120, nan_fraction=0.3,
+                                   seed=0)
+    variables = synthetic_variables(4)
+    ds_direct = integrate_to_dT(ds, '1850', '1969', variables)
+    ds_recursive = integrate_to_dT(ds, '1850', '1969', variables, method='recursive')
+    for var in variables:
+        namevar = new_varname(var, name_deltaT)
+        np.testing.assert_allclose(ds_recursive[namevar], ds_direct[namevar], rtol=rtol, atol=atol)
+
+
+def test_leading_nans():
+    forcing = _forcing((3, 50))
+    forcing[:, :7] = np.nan
+    delta_t = np.ones(50)
+    direct = convolve_direct(forcing, irf_kernel(np.arange(50), delta_t))
+    recursive = convolve_recursive(forcing, delta_t)
+    assert np.isnan(direct[:, :7]).all() and np.isnan(recursive[:, :7]).all()
+    np.testing.assert_allclose(recursive, direct, rtol=rtol, atol=atol)
+    # missing forcing does not contribute, so the response starts as if the forcing started there:
+    np.testing.assert_allclose(direct[:, 7:], convolve_direct(forcing[:, 7:], irf_kernel(np.arange(43), delta_t[7:])),
+                               rtol=rtol, atol=atol)
+
+
+def test_single_time_step():
+    ds = synthetic_forcing_dataset(n_models=2, n_scenarios=2, n_variables=2, n_years=1, nan_fraction=0, seed=0)
+    variables = synthetic_variables(2)
+    ds_direct = integrate_to_dT(ds, '1850', '1850', variables)
+    ds_recursive = integrate_to_dT(ds, '1850', '1850', variables, method='recursive')
+    for var in variables:
+        namevar = new_varname(var, name_deltaT)
+        assert ds_direct[namevar].sizes['time'] == 1
+        # the response to the forcing of the same time step, IRF(0) * delta_t:
+        np.testing.assert_allclose(ds_direct[namevar], ds[var] * 0.885 * (0.587 / 4.1 + 0.413 / 249), rtol=rtol)
+        np.testing.assert_allclose(ds_recursive[namevar], ds_direct[namevar], rtol=rtol, atol=atol)
+
+
+def test_state_round_trip():
+    forcing = _forcing((2, 3, 80))
+    forcing[0, 1, 30:35] = np.nan
+    delta_t = np.ones(80)
+    full, full_state = convolve_recursive(forcing, delta_t, return_state=True)
+    first, state = convolve_recursive(forcing[..., :45], delta_t[:45], return_state=True)
+    second, second_state = convolve_recursive(forcing[..., 45:], delta_t[45:], state=state, return_state=True)
+    np.testing.assert_allclose(np.concatenate([first, second], axis=-1), full, rtol=rtol, atol=atol)
+    for box, full_box in zip(second_state, full_state):
+        np.testing.assert_allclose(box, full_box, rtol=rtol, atol=atol)
+
+
+def test_incremental_equals_full(tmp_path):
+    ds = synthetic_forcing_dataset(n_models=3, n_scenarios=2, n_variables=3, n_years=100, nan_fraction=0.2, seed=1)
+    variables = synthetic_variables(3)
+    path_dT = str(tmp_path / 'dT.nc')
+    integrate_to_dT_incremental(ds, '1850', '1919', variables, path_dT)
+    # years appended and one column edited:
+    ds[variables[1]][0, 2, 10:20] += 0.5
+    ds_incremental = integrate_to_dT_incremental(ds, '1850', '1949', variables, path_dT)
+    ds_direct = integrate_to_dT(ds, '1850', '1949', variables)
+    for var in variables:
+        namevar = new_varname(var, name_deltaT)
+        np.testing.assert_allclose(ds_incremental[namevar], ds_direct[namevar], rtol=rtol, atol=atol)
+
+
+def test_chunked_rerun(tmp_path):
+    ds = synthetic_forcing_dataset(n_models=2, n_scenarios=2, n_variables=2, n_years=60, nan_fraction=0.2, seed=2)
+    variables = synthetic_variables(2)
+    path_forcing = str(tmp_path / 'forcing.nc')
+    path_dT = str(tmp_path / 'dT.nc')
+    ds.to_netcdf(path_forcing)
+    # the second call overwrites the output of the first (no handle on it is kept open):
+    for _ in range(2):
+        result = integrate_to_dT_chunked(path_forcing, path_dT, '1850', '1909', variables)
+    assert result is None
+    ds_direct = integrate_to_dT(ds, '1850', '1909', variables)
+    with read_dataset(path_dT) as ds_chunked:
+        for var in variables:
+            namevar = new_varname(var, name_deltaT)
+            np.testing.assert_allclose(ds_chunked[namevar], ds_direct[namevar], rtol=rtol, atol=atol)
+
+
+def _dataset(time, seed=0):
+    """
+    Random forcing for two variables along (scenario, climatemodel, time) on the time axis time.
+    """
+    rng = np.random.default_rng(seed)
+    ds = xr.Dataset(coords=dict(scenario=['a', 'b'], climatemodel=['x', 'y', 'z'], time=time))
+    variables = synthetic_variables(2)
+    for var in variables:
+        ds[var] = (('scenario', 'climatemodel', 'time'),
+                   np.cumsum(rng.normal(0, 0.1, (2, 3, len(time))), axis=-1) + 1.)
+    return ds, variables
+
+
+def _integrate_all(ds, variables, methods):
+    return {method: integrate_to_dT(ds, None, None, variables, method=method) for method in methods}
+
+
+def _assert_methods_agree(ds_methods, variables):
+    ds_reference = ds_methods['direct']
+    for ds_DT in ds_methods.values():
+        for var in variables:
+            namevar = new_varname(var, name_deltaT)
+            np.testing.assert_allclose(ds_DT[namevar], ds_reference[namevar], rtol=rtol, atol=atol)
+
+
+def test_methods_agree_monthly():
+    # constant monthly steps:
+    time = xr.cftime_range('1850-01-01', periods=600, freq='MS', calendar='360_day')
+    ds, variables = _dataset(time)
+    _assert_methods_agree(_integrate_all(ds, variables, ['direct', 'recursive', 'fft']), variables)
+    # calendar months, the steps vary with the length of the month:
+    ds, variables = _dataset(pd.date_range('1850-01-01', periods=600, freq='MS'))
+    _assert_methods_agree(_integrate_all(ds, variables, ['direct', 'recursive']), variables)
+    with pytest.raises(ValueError):
+        integrate_to_dT(ds, None, None, variables, method='fft')
+
+
+def test_methods_agree_variable_step():
+    rng = np.random.default_rng(3)
+    days = np.cumsum(rng.integers(15, 800, 150))
+    ds, variables = _dataset(np.datetime64('1850-01-01') + days.astype('timedelta64[D]'))
+    _assert_methods_agree(_integrate_all(ds, variables, ['direct', 'recursive']), variables)
+
+
+def test_monthly_constant_forcing():
+    # constant forcing of 1 W/m2 for 50 years, the integral of the IRF over 50 years:
+    var = synthetic_variables(1)[0]
+    time = pd.date_range('1850-01-01', periods=600, freq='MS')
+    ds = xr.Dataset({var: ('time', np.ones(600))}, coords={'time': time})
+    expected = 0.885 * (0.587 * (1 - np.exp(-50 / 4.1)) + 0.413 * (1 - np.exp(-50 / 249)))
+    for method in ['direct', 'recursive']:
+        ds_DT = integrate_to_dT(ds, None, None, [var], method=method)
+        np.testing.assert_allclose(ds_DT[new_varname(var, name_deltaT)][-1], expected, rtol=0.02)
+
+
+@pytest.mark.parametrize('method', ['direct', 'recursive', 'fft'])
+def test_parallel_equals_serial(method):
+    ds = synthetic_forcing_dataset(n_models=3, n_scenarios=3, n_variables=3, n_years=80, nan_fraction=0.2, seed=4)
+    variables = synthetic_variables(3)
+    ds_serial = integrate_to_dT(ds, '1850', '1929', variables, method=method)
+    ds_parallel = integrate_to_dT(ds, '1850', '1929', variables, method=method, n_workers=2)
+    for var in variables:
+        namevar = new_varname(var, name_deltaT)
+        np.testing.assert_array_equal(ds_parallel[namevar], ds_serial[namevar])
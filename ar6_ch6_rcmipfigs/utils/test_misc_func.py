@@ -0,0 +1,120 @@
+"""
+Checks of the helpers of misc_func against the implementations they replaced, run with pytest.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+from scmdata import ScmDataFrame
+
+from ar6_ch6_rcmipfigs.benchmarks.synthetic import name_erf_anthropogenic, synthetic_protocol_variables, \
+    synthetic_timeseries
+from ar6_ch6_rcmipfigs.utils.misc_func import aggregate_variable, aggregate_variables, get_protocol_emissions, \
+    get_protocol_scenarios, get_protocol_vars, read_cached_table
+
+rtol = 1e-10
+atol = 1e-12
+erf_aerosols = name_erf_anthropogenic + '|Aerosols'
+erf_fgases = name_erf_anthropogenic + '|F-Gases'
+erf_HFC = erf_fgases + '|HFC'
+
+
+def _write_protocol(path, n_variables=3):
+    """
+    Submission template with the sheets variable_definitions and scenario_info (column names in title case).
+    """
+    with pd.ExcelWriter(path) as writer:
+        synthetic_protocol_variables(n_variables).rename(columns=str.title).to_excel(
+            writer, sheet_name="variable_definitions", index=False)
+        pd.DataFrame({"Scenario": ["historical", "ssp119"], "Description": ["a", "b"]}).to_excel(
+            writer, sheet_name="scenario_info", index=False)
+
+
+def test_protocol_tables_cached(tmp_path):
+    path = str(tmp_path / "template.xlsx")
+    _write_protocol(path)
+    cache_dir = str(tmp_path / "cache")
+    for _ in range(2):
+        # the first call parses and caches, the second reads the cache:
+        protocol_variables = get_protocol_vars(path, cache_dir=cache_dir)
+        protocol_scenarios = get_protocol_scenarios(path, cache_dir=cache_dir)
+        # as read in 0_database-generation before:
+        expected = pd.read_excel(path, sheet_name="variable_definitions")
+        expected.columns = expected.columns.str.lower()
+        pd.testing.assert_frame_equal(protocol_variables, expected)
+        expected = pd.read_excel(path, sheet_name="scenario_info", skip_rows=2)
+        expected.columns = expected.columns.str.lower()
+        pd.testing.assert_frame_equal(protocol_scenarios, expected)
+    assert len(os.listdir(cache_dir)) == 2
+
+
+def test_cache_invalidated(tmp_path):
+    path = str(tmp_path / "table.csv")
+    cache_dir = str(tmp_path / "cache")
+    parsed = []
+
+    def parse(_path):
+        parsed.append(_path)
+        return pd.read_csv(_path)
+
+    pd.DataFrame({"a": [1, 2]}).to_csv(path, index=False)
+    for _ in range(2):
+        pd.testing.assert_frame_equal(read_cached_table(path, parse, "table", cache_dir=cache_dir),
+                                      pd.DataFrame({"a": [1, 2]}))
+    assert len(parsed) == 1
+    # a changed file is parsed again and replaces the cached table:
+    pd.DataFrame({"a": [3]}).to_csv(path, index=False)
+    pd.testing.assert_frame_equal(read_cached_table(path, parse, "table", cache_dir=cache_dir),
+                                  pd.DataFrame({"a": [3]}))
+    assert len(parsed) == 2 and len(os.listdir(cache_dir)) == 1
+    # no caching:
+    read_cached_table(path, parse, "table", cache_dir=None)
+    assert len(parsed) == 3
+
+
+def test_protocol_emissions_cached(tmp_path):
+    path = str(tmp_path / "emissions.csv")
+    synthetic_timeseries(n_models=1, n_scenarios=2, n_variables=2, n_years=10, seed=0).to_csv(path, index=False)
+    expected = ScmDataFrame(path).timeseries()
+    for _ in range(2):
+        result = get_protocol_emissions(path, cache_dir=str(tmp_path / "cache")).timeseries()
+        pd.testing.assert_index_equal(result.index, expected.index)
+        np.testing.assert_allclose(result.values, expected.values, rtol=rtol, atol=atol)
+
+
+def _forcing_hierarchy():
+    """
+    Three climate models reporting subcategories of Aerosols and F-Gases: the first reports Aerosols
+    itself, the second a quantile of HFC and the third no HFC subcategories.
+    """
+    variables = [erf_aerosols, erf_aerosols + '|Aerosols-radiation interactions',
+                 erf_aerosols + '|Aerosols-cloud interactions', erf_HFC + '|HFC23', erf_HFC + '|HFC32',
+                 erf_HFC + '|5th quantile', erf_fgases + '|PFC']
+    ts = synthetic_timeseries(n_models=3, n_scenarios=2, n_variables=len(variables), n_years=10, seed=0)
+    ts['variable'] = ts['variable'].map(dict(zip(ts['variable'].unique(), variables)))
+    cms = ts['climatemodel'].unique()
+    drop = (((ts['variable'] == erf_aerosols) & (ts['climatemodel'] != cms[0]))
+            | ((ts['variable'] == erf_HFC + '|5th quantile') & (ts['climatemodel'] != cms[1]))
+            | (ts['variable'].str.startswith(erf_HFC + '|HFC') & (ts['climatemodel'] == cms[2])))
+    return ScmDataFrame(ts[~drop])
+
+
+def test_aggregate_variables_equals_per_model():
+    db = _forcing_hierarchy()
+    cms = db['climatemodel'].unique()
+    for parents in [[erf_aerosols, erf_HFC], [erf_aerosols, erf_HFC, erf_fgases]]:
+        # one variable and one model at the time, as in 1_preprocess_data before:
+        expected = db.copy()
+        for parent in parents:
+            for cmod in cms:
+                expected = aggregate_variable(expected, parent, cmod)
+        result, report = aggregate_variables(db, parents)
+        expected, result = expected.timeseries(), result.timeseries()
+        assert len(result) == len(expected)
+        result = result.reorder_levels(expected.index.names).reindex(expected.index)
+        np.testing.assert_allclose(result.values, expected.values, rtol=rtol, atol=atol)
+
+        report = report.set_index(['climatemodel', 'variable'])['status']
+        assert report[cms[0], erf_aerosols] == 'already reported'
+        assert report[cms[1], erf_aerosols] == 'aggregated'
+        assert report[cms[2], erf_HFC] == 'no subcategories'
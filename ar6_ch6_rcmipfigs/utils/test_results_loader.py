@@ -0,0 +1,66 @@
+"""
+Checks of load_results against reading the files one by one with ScmDataFrame and df_append, run with pytest.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+from scmdata import ScmDataFrame, df_append
+
+from ar6_ch6_rcmipfigs.benchmarks.synthetic import synthetic_timeseries, synthetic_variables
+from ar6_ch6_rcmipfigs.utils.results_loader import load_results
+
+rtol = 1e-10
+atol = 1e-12
+
+
+def _write_files(tmp_path):
+    """
+    Three result files, the second repeats the timeseries of the first climate model with other
+    values, so they are averaged.
+    """
+    ts = synthetic_timeseries(n_models=3, n_scenarios=2, n_variables=3, n_years=30, nan_fraction=0.2, seed=0)
+    first_model = ts["climatemodel"] == ts["climatemodel"].iloc[0]
+    repeated = ts[first_model].copy()
+    years = [col for col in ts.columns if not isinstance(col, str)]
+    repeated[years] += 1.
+    paths = [str(tmp_path / ("results_%s.csv" % ind)) for ind in range(3)]
+    ts[first_model].to_csv(paths[0], index=False)
+    pd.concat([repeated, ts[~first_model & (ts["scenario"] == ts["scenario"].iloc[0])]]).to_csv(paths[1],
+                                                                                                index=False)
+    ts[~first_model & (ts["scenario"] != ts["scenario"].iloc[0])].to_csv(paths[2], index=False)
+    return paths, ts["climatemodel"].iloc[0]
+
+
+def _timeseries(df):
+    return ScmDataFrame(df).timeseries().sort_index()
+
+
+def test_duplicates_averaged(tmp_path):
+    paths, _ = _write_files(tmp_path)
+    expected = df_append([ScmDataFrame(path) for path in paths]).timeseries().sort_index()
+    result = _timeseries(load_results(paths, n_workers=2, use_processes=False))
+    pd.testing.assert_index_equal(result.index, expected.index)
+    np.testing.assert_allclose(result.values, expected.values, rtol=rtol, atol=atol)
+
+
+def test_filters(tmp_path):
+    paths, _ = _write_files(tmp_path)
+    variables = synthetic_variables(3)[1:]
+    expected = df_append([ScmDataFrame(path).filter(variable=variables) for path in paths]).timeseries()
+    result = _timeseries(load_results(paths, filters=dict(variable=variables), n_workers=2))
+    np.testing.assert_allclose(result.values, expected.sort_index().values, rtol=rtol, atol=atol)
+
+
+def test_source_col(tmp_path):
+    paths, repeated_model = _write_files(tmp_path)
+    df = load_results(paths, n_workers=2, use_processes=False, source_col="source")
+    assert df.columns[-1] == "source"
+    repeated = df["climatemodel"] == repeated_model
+    # the averaged duplicates list both files:
+    assert set(df.loc[repeated, "source"]) == {";".join(sorted(paths[:2]))}
+    assert set(df.loc[~repeated, "source"]) == set(paths[1:])
+
+
+def test_no_files():
+    with pytest.raises(ValueError):
+        load_results([])
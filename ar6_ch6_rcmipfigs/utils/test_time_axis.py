@@ -0,0 +1,65 @@
+"""
+Checks of the vectorized time axis handling of time_axis against the fields of each date, run with pytest.
+"""
+import datetime
+
+import cftime
+import numpy as np
+import pandas as pd
+import pytest
+
+from ar6_ch6_rcmipfigs.utils.time_axis import time_fields, to_time_axis
+
+calendars = ['standard', 'proleptic_gregorian', 'julian', 'noleap', 'all_leap', '360_day']
+
+
+def _fields_per_date(times):
+    """
+    Year, month and day read from each date, as time_fields did before.
+    """
+    fields = np.array([(t.year, t.month, t.day) for t in times.ravel()], dtype=int).reshape(times.shape + (3,))
+    return fields[..., 0], fields[..., 1], fields[..., 2]
+
+
+def _random_dates(calendar, n_dates=2000, seed=0):
+    """
+    Dates from year 1 to 9999 (and around the Gregorian reform in 1582) in calendar.
+    """
+    rng = np.random.default_rng(seed)
+    num = np.concatenate([rng.integers(0, 3652000, n_dates), np.arange(577000, 578500, 3)])
+    if calendar == '360_day':
+        num = num * 360 // 365
+    return cftime.num2date(num + 0.25, 'days since 0001-01-01', calendar=calendar, only_use_cftime_datetimes=True)
+
+
+@pytest.mark.parametrize('calendar', calendars)
+def test_cftime_equals_per_date(calendar):
+    times = _random_dates(calendar)
+    for result, expected in zip(time_fields(times), _fields_per_date(times)):
+        np.testing.assert_array_equal(result, expected)
+    times = times[:200].reshape(10, 20)
+    for result, expected in zip(time_fields(times), _fields_per_date(times)):
+        np.testing.assert_array_equal(result, expected)
+
+
+def test_datetime_equals_per_date():
+    times = np.array([datetime.datetime(1600, 2, 29), datetime.datetime(1850, 1, 1, 12),
+                      datetime.datetime(2100, 12, 31)])
+    for result, expected in zip(time_fields(times), _fields_per_date(times)):
+        np.testing.assert_array_equal(result, expected)
+    times = pd.date_range('1850', '2100', freq='MS')
+    for result, expected in zip(time_fields(times.values), _fields_per_date(times.to_pydatetime())):
+        np.testing.assert_array_equal(result, expected)
+    for result in time_fields(np.array([], dtype=object)):
+        assert result.shape == (0,)
+
+
+@pytest.mark.parametrize('calendar', calendars)
+def test_round_trip(calendar):
+    times = _random_dates(calendar, n_dates=200, seed=1)
+    if calendar == 'standard':
+        # to_time_axis does not convert to the Julian part of the standard calendar:
+        times = times[[t.year > 1582 for t in times]]
+    dates = to_time_axis(times, output='cftime', calendar=calendar)
+    for result, expected in zip(time_fields(dates), _fields_per_date(times)):
+        np.testing.assert_array_equal(result, expected)
@@ -0,0 +1,136 @@
+"""
+Vectorized handling of the time axis: RCMIP time points (integer years, datetime64, datetime or cftime
+objects) are split into year, month and day arrays once, and converted from there to integer years,
+datetime64 or cftime dates in a chosen calendar. The time step used by the IRF integration (delta_t,
+in years) is derived from the same arrays.
+"""
+import operator
+
+import cftime
+import numpy as np
+
+_days_in_month = {
+    'noleap': np.array([31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]),
+    'all_leap': np.array([31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]),
+    '360_day': np.full(12, 30),
+}
+_calendar_aliases = {'365_day': 'noleap', '366_day': 'all_leap', 'gregorian': 'standard'}
+# whole days within the range of datetime64[ns] (pd.Timestamp.min, pd.Timestamp.max):
+_datetime64_range = (np.datetime64('1677-09-22'), np.datetime64('2262-04-11'))
+_calendars = ['standard', 'proleptic_gregorian', 'julian', 'noleap', 'all_leap', '360_day']
+_date_fields = np.frompyfunc(operator.attrgetter('year', 'month', 'day'), 1, 3)
+
+
+def _calendar_name(calendar):
+    calendar = _calendar_aliases.get(calendar, calendar)
+    if calendar not in _calendars:
+        raise ValueError('Unknown calendar {}, choose from {}'.format(calendar, _calendars))
+    return calendar
+
+
+def time_fields(times):
+    """
+    Year, month and day of each time point.
+
+    :param times: integer (or float) years, datetime64 values, or datetime or cftime objects
+    :return: year, month, day as np.ndarray of int
+    """
+    times = np.asarray(times)
+    if times.dtype.kind in 'iuf':
+        years = times.astype(int)
+        return years, np.ones_like(years), np.ones_like(years)
+    if times.dtype.kind == 'M':
+        # datetime64 arithmetic works for any year, unlike pandas timestamps:
+        years = times.astype('datetime64[Y]')
+        months = times.astype('datetime64[M]')
+        days = times.astype('datetime64[D]')
+        return (years.astype(int) + 1970, (months - years).astype(int) + 1,
+                (days - months.astype('datetime64[D]')).astype(int) + 1)
+    # date2num (and datetime64 conversion of datetime objects) is slower than reading the fields,
+    # which the ufunc does in one pass over the array of any shape:
+    return tuple(field.astype(int) for field in _date_fields(times))
+
+
+def _is_leap(years, calendar):
+    if calendar in ['standard', 'proleptic_gregorian']:
+        return ((years % 4 == 0) & (years % 100 != 0)) | (years % 400 == 0)
+    if calendar == 'julian':
+        return years % 4 == 0
+    return np.full(np.shape(years), calendar == 'all_leap')
+
+
+def _day_of_year(years, months, days, calendar):
+    """
+    Days since the start of the year (0 on 1 January) and days in the year.
+    """
+    if calendar in _days_in_month:
+        month_lengths = np.broadcast_to(_days_in_month[calendar], np.shape(years) + (12,))
+    else:
+        month_lengths = np.where(_is_leap(years, calendar)[..., np.newaxis], _days_in_month['all_leap'],
+                                 _days_in_month['noleap'])
+    cum_days = np.concatenate([np.zeros(np.shape(years) + (1,), dtype=int), np.cumsum(month_lengths, axis=-1)],
+                              axis=-1)
+    day_of_year = np.take_along_axis(cum_days, (months - 1)[..., np.newaxis], axis=-1)[..., 0] + days - 1
+    return day_of_year, cum_days[..., -1]
+
+
+def decimal_years(times, calendar='standard'):
+    """
+    Time points as decimal years (e.g. 1850.0 for 1 January 1850) in calendar.
+    """
+    calendar = _calendar_name(calendar)
+    years, months, days = time_fields(times)
+    day_of_year, days_in_year = _day_of_year(years, months, days, calendar)
+    return years + day_of_year / days_in_year
+
+
+def time_step(times, calendar='standard'):
+    """
+    Length of each time step in years (delta_t of the IRF integration): the difference to the next
+    time point, the last time step is as long as the one before. Annual data on 1 January gives ones.
+    """
+    years = decimal_years(times, calendar=calendar)
+    if len(years) < 2:
+        return np.ones(len(years))
+    delta_t = np.diff(years)
+    return np.append(delta_t, delta_t[-1])
+
+
+def to_time_axis(times, output='datetime64', calendar='standard'):
+    """
+    Converts RCMIP time points to integer years, datetime64 or cftime dates in one vectorized step.
+
+    :param times: integer years, datetime64 values, or datetime or cftime objects
+    :param output: 'year', 'datetime64' (within 1678-2261, the range of pandas timestamps) or 'cftime'
+    (any year, e.g. for multi-millennium runs)
+    :param calendar: calendar of the cftime dates, and of the input for decimal years
+    :return: np.ndarray
+    """
+    calendar = _calendar_name(calendar)
+    years, months, days = time_fields(times)
+    if output == 'year':
+        return years
+    if output == 'datetime64':
+        dates = ((years - 1970).astype('datetime64[Y]').astype('datetime64[M]') + (months - 1)).astype(
+            'datetime64[D]') + (days - 1)
+        if len(dates) and (dates.min() < _datetime64_range[0] or dates.max() > _datetime64_range[1]):
+            raise ValueError("Time points outside the range of datetime64[ns], use output='cftime'")
+        return dates.astype('datetime64[ns]')
+    if output != 'cftime':
+        raise ValueError("Unknown output {}, choose from 'year', 'datetime64' and 'cftime'".format(output))
+
+    if calendar in ['standard', 'proleptic_gregorian']:
+        dates = ((years - 1970).astype('datetime64[Y]').astype('datetime64[M]') + (months - 1)).astype(
+            'datetime64[D]') + (days - 1)
+        if calendar == 'standard' and len(dates) and dates.min() < np.datetime64('1582-10-15'):
+            raise ValueError("The standard calendar is Julian before 1582-10-15, use calendar='proleptic_gregorian'")
+        return cftime.num2date((dates - np.datetime64('1970-01-01')).astype(int), 'days since 1970-01-01',
+                               calendar=calendar, only_use_cftime_datetimes=True)
+    # days since 1 January of year 1 to 1 January of each year:
+    if calendar == 'julian':
+        num = 365 * (years - 1) + (years - 1) // 4
+    else:
+        num = (years - 1) * {'360_day': 360, 'noleap': 365, 'all_leap': 366}[calendar]
+    day_of_year, _ = _day_of_year(years, months, days, calendar)
+    return cftime.num2date(num + day_of_year, 'days since 0001-01-01', calendar=calendar,
+                           only_use_cftime_datetimes=True)
@@ -4,7 +4,7 @@ setup(
     name='AR6_CH6_RCMIPFIGS',
     version='v00',
     packages=['ar6_ch6_rcmipfigs', 'ar6_ch6_rcmipfigs.data_in', 'ar6_ch6_rcmipfigs.notebooks',
-              'ar6_ch6_rcmipfigs.data_out'],
+              'ar6_ch6_rcmipfigs.data_out', 'ar6_ch6_rcmipfigs.utils', 'ar6_ch6_rcmipfigs.benchmarks'],
     url='https://github.com/sarambl/AR6_CH6_RCMIPFIGS.git',
     license='MIT',
     author='sarambl',